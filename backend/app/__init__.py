@@ -1 +1,5 @@
 # 建立 __init__.py 讓 app 成為 Python 套件
+import time
+
+# 套件開始匯入的時間，app.main 匯入完成後據此記錄啟動時的匯入耗時
+IMPORT_STARTED_AT = time.perf_counter()
@@ -0,0 +1,91 @@
+"""
+入場控制
+請求進入時依推論排程器的佇列狀態決定是否受理，過載時立即以 429 + Retry-After 拒絕，
+讓已受理的請求仍能在延遲目標內完成，而不是讓所有請求一起排隊到前端逾時：
+- 每個引擎的排隊工作數有上限（max_queue_depth）
+- 依各引擎平均執行時間預估排隊時間，超過該優先權的等待目標（wait_slo_seconds）即拒絕
+- 只在請求入口判斷；已受理請求後續階段（例如 LLM 之後的 TTS）不會被中途丟棄
+"""
+import math
+from typing import Iterable, Optional, Tuple
+
+from app.config import config
+from app.metrics import admission_requests
+from app.scheduler import scheduler, PRIORITY_NAMES, PRIORITY_NORMAL
+
+
+class Overloaded(Exception):
+    """請求因過載被拒絕"""
+
+    def __init__(self, engine: str, reason: str, retry_after: int):
+        super().__init__(f"服務忙碌中（{engine} {reason}），請於 {retry_after} 秒後重試")
+        self.engine = engine
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """依佇列深度與預估等待時間決定是否受理請求"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.shed = 0
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入入場控制參數"""
+        admission_config = config.get("admission", {}) or {}
+        self.enabled = admission_config.get("enabled", True)
+        self.max_queue_depth = admission_config.get("max_queue_depth", 16)
+        self.wait_slo = admission_config.get("wait_slo_seconds", {"interactive": 60, "normal": 120, "bulk": 300})
+        self.max_retry_after = admission_config.get("max_retry_after", 120)
+
+    def _retry_after(self, seconds: float) -> int:
+        return max(1, min(self.max_retry_after, math.ceil(seconds)))
+
+    def evaluate(self, engines: Iterable[str], priority: int = PRIORITY_NORMAL) -> Optional[Tuple[str, str, int]]:
+        """回傳 (引擎, 原因, Retry-After 秒數)；可受理時回傳 None"""
+        slo = self.wait_slo.get(PRIORITY_NAMES.get(priority, "normal"))
+        for engine in engines:
+            depth = scheduler.get_queue_depth(engine)
+            service_time = scheduler.get_service_time(engine) or 0.0
+            if self.max_queue_depth and depth >= self.max_queue_depth:
+                # 等佇列消化到上限以下所需的時間
+                limit = scheduler.get_device_limit(scheduler.get_device(engine))
+                excess = depth - self.max_queue_depth + 1
+                return engine, "queue_full", self._retry_after(excess * service_time / max(1, limit))
+            if slo:
+                wait = scheduler.predict_wait(engine, priority)
+                if wait > slo:
+                    return engine, "wait_slo", self._retry_after(wait - slo)
+        return None
+
+    def admit(self, endpoint: str, engines: Iterable[str], priority: int = PRIORITY_NORMAL):
+        """受理或拒絕請求（拋出 Overloaded），並記錄受理／拒絕次數"""
+        if not self.enabled:
+            return
+        decision = self.evaluate(engines, priority)
+        if decision is None:
+            self.accepted += 1
+            admission_requests.inc(endpoint=endpoint, result="accepted", reason="")
+            return
+        engine, reason, retry_after = decision
+        self.shed += 1
+        admission_requests.inc(endpoint=endpoint, result="shed", reason=reason)
+        print(f"拒絕請求 {endpoint}: {engine} {reason}，Retry-After {retry_after} 秒")
+        raise Overloaded(engine, reason, retry_after)
+
+    def get_stats(self):
+        total = self.accepted + self.shed
+        return {
+            "enabled": self.enabled,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_slo_seconds": self.wait_slo,
+            "accepted": self.accepted,
+            "shed": self.shed,
+            "shed_rate": round(self.shed / total, 4) if total else 0.0,
+        }
+
+
+# 全域入場控制器
+admission_controller = AdmissionController()
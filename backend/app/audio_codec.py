@@ -0,0 +1,151 @@
+"""
+輸出音訊格式轉換
+依請求的 format / sample_rate 參數或 Accept 標頭，將 TTS 引擎輸出的 16-bit WAV
+轉成 Opus(OGG)、MP3、FLAC 或指定取樣率。重取樣器依 (來源, 目標) 取樣率快取重用。
+torch / torchaudio 在第一次需要重取樣時才匯入，只轉換格式的部署不必載入。
+"""
+import asyncio
+import io
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from app.tracing import span
+
+# 格式名稱 -> soundfile 格式 / 子類型 / MIME / 副檔名
+AUDIO_FORMATS = {
+    "wav": {"format": "WAV", "subtype": "PCM_16", "media_type": "audio/wav", "extension": "wav"},
+    "flac": {"format": "FLAC", "subtype": "PCM_16", "media_type": "audio/flac", "extension": "flac"},
+    "opus": {"format": "OGG", "subtype": "OPUS", "media_type": "audio/ogg", "extension": "ogg"},
+    "mp3": {"format": "MP3", "subtype": "MPEG_LAYER_III", "media_type": "audio/mpeg", "extension": "mp3"},
+}
+FORMAT_ALIASES = {"ogg": "opus"}
+# Accept 標頭中的 MIME -> 格式名稱
+MEDIA_TYPE_FORMATS = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+EXTENSION_MEDIA_TYPES = {spec["extension"]: spec["media_type"] for spec in AUDIO_FORMATS.values()}
+
+# Opus 只支援這些取樣率
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+_resamplers: Dict[Tuple[int, int], Any] = {}  # torchaudio.transforms.Resample
+_resamplers_lock = threading.Lock()
+
+
+def normalize_format(fmt: str) -> str:
+    fmt = fmt.strip().lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in AUDIO_FORMATS:
+        raise ValueError(f"不支援的音訊格式: {fmt}（可選: {', '.join(AUDIO_FORMATS)}）")
+    return fmt
+
+
+def negotiate_format(fmt: Optional[str], accept: Optional[str]) -> str:
+    """決定輸出格式：明確的 format 參數優先，其次為 Accept 中 q 值最高的音訊類型，預設 wav"""
+    if fmt:
+        return normalize_format(fmt)
+    if not accept:
+        return "wav"
+    candidates = []
+    for index, part in enumerate(accept.split(",")):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        if media_type not in MEDIA_TYPE_FORMATS:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, index, MEDIA_TYPE_FORMATS[media_type]))
+    return min(candidates)[2] if candidates else "wav"
+
+
+def resolve_output_format(fmt: Optional[str], sample_rate: Optional[int],
+                          accept: Optional[str]) -> Tuple[str, Optional[int]]:
+    """驗證並回傳 (格式, 目標取樣率)，參數不合法時拋出 ValueError"""
+    fmt = negotiate_format(fmt, accept)
+    if sample_rate is not None and not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"取樣率需介於 {MIN_SAMPLE_RATE} 與 {MAX_SAMPLE_RATE} Hz 之間")
+    return fmt, sample_rate
+
+
+def media_type_for(fmt: str) -> str:
+    return AUDIO_FORMATS[fmt]["media_type"]
+
+
+def extension_for(fmt: str) -> str:
+    return AUDIO_FORMATS[fmt]["extension"]
+
+
+def media_type_for_filename(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    return EXTENSION_MEDIA_TYPES.get(extension, "application/octet-stream")
+
+
+def _get_resampler(orig_freq: int, new_freq: int) -> "torchaudio.transforms.Resample":
+    import torchaudio
+
+    key = (orig_freq, new_freq)
+    with _resamplers_lock:
+        resampler = _resamplers.get(key)
+        if resampler is None:
+            resampler = torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+            _resamplers[key] = resampler
+            print(f"建立重取樣器: {orig_freq} Hz -> {new_freq} Hz")
+    return resampler
+
+
+def resample(waveform: np.ndarray, orig_freq: int, new_freq: int) -> np.ndarray:
+    """重取樣 (frames, channels) 的 float32 波形"""
+    if orig_freq == new_freq:
+        return waveform
+    import torch
+
+    tensor = torch.from_numpy(np.ascontiguousarray(waveform.T))
+    with torch.no_grad():
+        resampled = _get_resampler(orig_freq, new_freq)(tensor)
+    return resampled.numpy().T
+
+
+def transcode(wav_bytes: bytes, fmt: str = "wav", sample_rate: Optional[int] = None) -> bytes:
+    """將 WAV 轉成指定格式與取樣率（同步，CPU 運算）"""
+    spec = AUDIO_FORMATS[fmt]
+    waveform, source_rate = sf.read(io.BytesIO(wav_bytes), dtype="float32", always_2d=True)
+    target_rate = sample_rate or source_rate
+    if fmt == "opus" and target_rate not in OPUS_SAMPLE_RATES:
+        # 取不低於目標的最小 Opus 取樣率
+        target_rate = next((rate for rate in OPUS_SAMPLE_RATES if rate >= target_rate), OPUS_SAMPLE_RATES[-1])
+    if fmt == "wav" and target_rate == source_rate:
+        return wav_bytes
+
+    with span("audio.transcode", format=fmt, sample_rate=target_rate):
+        waveform = resample(waveform, source_rate, target_rate)
+        buffer = io.BytesIO()
+        sf.write(buffer, waveform, target_rate, format=spec["format"], subtype=spec["subtype"])
+        return buffer.getvalue()
+
+
+async def transcode_async(wav_bytes: bytes, fmt: str = "wav", sample_rate: Optional[int] = None) -> bytes:
+    """於執行緒中轉檔，不阻塞事件迴圈；不需轉換時直接回傳"""
+    if fmt == "wav" and sample_rate is None:
+        return wav_bytes
+    return await asyncio.to_thread(transcode, wav_bytes, fmt, sample_rate)
@@ -0,0 +1,173 @@
+"""
+音檔儲存
+對話端點產生的音檔先放在記憶體 LRU（以總位元組數為上限），/audio 直接由記憶體回傳；
+超出上限被淘汰的音檔可選擇寫入輸出目錄，之後仍能由 /audio 從磁碟取得。
+TTS 尚在載入時可先 reserve() 保留檔名回傳給前端，合成完成後以同一檔名 put()（或 fail()）。
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from app.config import config
+from app.retention import retention_manager
+from app.http_audio import content_etag
+
+
+class AudioStore:
+    """以位元組數為上限的記憶體 LRU，淘汰時可溢出到磁碟
+
+    max_memory_mb 設為 0 時等同純磁碟模式（每個音檔都直接寫入磁碟）。
+    """
+
+    def __init__(self):
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._spilling: Dict[str, bytes] = {}  # 寫入磁碟中的音檔，完成前仍由記憶體提供
+        self._owners: Dict[str, str] = {}  # 檔名 -> 所屬請求（對話 ID），溢出到磁碟時交給保留策略
+        self._etags: Dict[str, str] = {}  # 檔名 -> 內容雜湊 ETag（首次請求時計算）
+        self._pending: "OrderedDict[str, Optional[str]]" = OrderedDict()  # 保留中的檔名 -> 失敗原因（None 為合成中）
+        self._lock = threading.Lock()
+        self._spill_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-spill")
+        self.memory_bytes = 0
+        # 統計
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spilled = 0
+        self.dropped = 0
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入儲存參數"""
+        store_config = config.get("audio_store", {})
+        self.max_memory_bytes = int(store_config.get("max_memory_mb", 256) * 1024 * 1024)
+        self.spill_to_disk = store_config.get("spill_to_disk", True)
+        self.disk_dir = store_config.get("disk_dir") or config.get("paths.outputs", "./outputs")
+        self.max_pending = store_config.get("max_pending", 256)
+
+    def reserve(self, prefix: str = "audio", extension: str = "wav") -> str:
+        """保留檔名（音檔稍後才會產生），/audio 在完成前回報合成中"""
+        filename = f"{prefix}_{uuid.uuid4().hex[:8]}.{extension}"
+        with self._lock:
+            self._pending[filename] = None
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+        return filename
+
+    def fail(self, filename: str, error: str):
+        """保留的音檔無法產生"""
+        with self._lock:
+            if filename in self._pending:
+                self._pending[filename] = error
+
+    def get_pending(self, filename: str) -> Optional[dict]:
+        """保留中的檔名回傳 {"status": "pending" | "failed", "error": ...}，其餘回傳 None"""
+        with self._lock:
+            if filename not in self._pending:
+                return None
+            error = self._pending[filename]
+        return {"status": "failed" if error else "pending", "error": error}
+
+    def put(self, audio: bytes, prefix: str = "audio", extension: str = "wav",
+            request_id: Optional[str] = None, filename: Optional[str] = None) -> str:
+        """存入音檔並回傳檔名（供 /audio/{filename} 使用）；filename 為 reserve() 保留的檔名"""
+        filename = filename or f"{prefix}_{uuid.uuid4().hex[:8]}.{extension}"
+        with self._lock:
+            self._pending.pop(filename, None)
+            self._items[filename] = audio
+            if request_id:
+                self._owners[filename] = request_id
+            self.memory_bytes += len(audio)
+            evicted = self._evict_locked()
+        for name, data in evicted:
+            self._spill(name, data)
+        return filename
+
+    def _evict_locked(self):
+        evicted = []
+        while self.memory_bytes > self.max_memory_bytes and self._items:
+            name, data = self._items.popitem(last=False)
+            self._etags.pop(name, None)
+            self.memory_bytes -= len(data)
+            evicted.append((name, data))
+        return evicted
+
+    def _spill(self, filename: str, data: bytes):
+        with self._lock:
+            request_id = self._owners.pop(filename, None)
+            if self.spill_to_disk:
+                self._spilling[filename] = data
+        if not self.spill_to_disk:
+            self.dropped += 1
+            return
+        self._spill_pool.submit(self._write_file, filename, data, request_id)
+
+    def _write_file(self, filename: str, data: bytes, request_id: Optional[str]):
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            file_path = os.path.join(self.disk_dir, filename)
+            with open(file_path, "wb") as f:
+                f.write(data)
+            self.spilled += 1
+            retention_manager.register(file_path, request_id, size=len(data))
+        except Exception as e:
+            self.dropped += 1
+            print(f"音檔寫入磁碟失敗 {filename}: {e}")
+        finally:
+            with self._lock:
+                self._spilling.pop(filename, None)
+
+    def get(self, filename: str) -> Optional[bytes]:
+        """由記憶體取得音檔，不存在時回傳 None"""
+        with self._lock:
+            data = self._items.get(filename)
+            if data is not None:
+                self._items.move_to_end(filename)
+                self.hits += 1
+                return data
+            data = self._spilling.get(filename)
+            if data is not None:
+                self.hits += 1
+            return data
+
+    def get_etag(self, filename: str, data: bytes) -> str:
+        """記憶體中音檔的 ETag（內容不變，計算一次後快取）"""
+        etag = self._etags.get(filename)
+        if etag is None:
+            etag = content_etag(data)
+            with self._lock:
+                if filename in self._items:
+                    self._etags[filename] = etag
+        return etag
+    
+    def get_path(self, filename: str) -> Optional[str]:
+        """記憶體未命中時，回傳磁碟上的檔案路徑"""
+        file_path = os.path.join(self.disk_dir, os.path.basename(filename))
+        if os.path.exists(file_path):
+            self.disk_hits += 1
+            return file_path
+        self.misses += 1
+        return None
+
+    def get_stats(self) -> dict:
+        return {
+            "items": len(self._items),
+            "pending": sum(1 for error in self._pending.values() if error is None),
+            "memory_bytes": self.memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+    def shutdown(self):
+        """等待進行中的磁碟寫入完成"""
+        self._spill_pool.shutdown(wait=True)
+
+
+# 全域音檔儲存實例
+audio_store = AudioStore()
@@ -0,0 +1,44 @@
+"""
+音訊格式工具
+串流回應用的 WAV 檔頭與 PCM 轉換。
+"""
+import io
+import struct
+from typing import Tuple
+
+import soundfile as sf
+
+# 串流 WAV 的 RIFF / data 長度未知時填入最大值，多數播放器會讀到連線結束為止
+STREAMING_DATA_SIZE = 0xFFFFFFFF
+
+
+def wav_stream_header(sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """產生長度未知的 PCM WAV 檔頭（44 bytes）"""
+    block_align = channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", STREAMING_DATA_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                sample_rate * block_align, block_align, sample_width * 8)
+        + b"data" + struct.pack("<I", STREAMING_DATA_SIZE)
+    )
+
+
+def wav_to_pcm16(wav_bytes: bytes) -> Tuple[bytes, int, int]:
+    """將任意 WAV（含 float32）轉成 16-bit 交錯 PCM
+
+    Returns:
+        (pcm_bytes, sample_rate, channels)
+    """
+    data, sample_rate = sf.read(io.BytesIO(wav_bytes), dtype="int16", always_2d=True)
+    return data.tobytes(), sample_rate, data.shape[1]
+
+
+def silence_pcm16(seconds: float, sample_rate: int, channels: int = 1) -> bytes:
+    """產生指定長度的 16-bit 靜音"""
+    return b"\x00" * (int(sample_rate * seconds) * channels * 2)
+
+
+def wav_duration(wav_bytes: bytes) -> float:
+    """由檔頭讀取 WAV 音訊長度（秒），不解碼波形"""
+    info = sf.info(io.BytesIO(wav_bytes))
+    return info.frames / info.samplerate if info.samplerate else 0.0
@@ -0,0 +1,118 @@
+"""
+跨請求動態微批次
+在短時間窗（例如 20 ms）內收集同一引擎的請求，湊成一批後執行一次批次推論，
+再把結果分送回各請求。同一批次內的項目需共用生成參數，以 key 區分。
+"""
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.config import config
+from app.tracing import span, detached
+
+# 目前執行中的批次項目，供批次函式在開始運算前判斷哪些請求已取消
+_current_batch: contextvars.ContextVar = contextvars.ContextVar("micro_batch", default=None)
+
+
+def cancelled_items() -> List[bool]:
+    """於批次函式內呼叫：回傳各項目的請求是否已取消（不在批次中時為空列表）"""
+    entries = _current_batch.get()
+    if entries is None:
+        return []
+    return [future.done() for _, future in entries]
+
+
+class MicroBatcher:
+    """收集時間窗內的請求並合併成一次批次呼叫
+
+    batch_fn 接收項目列表，回傳等長的結果列表；
+    結果若為 Exception 實例，只有對應的請求會收到該例外。
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 4, max_wait_ms: float = 20,
+                 key_fn: Optional[Callable[[Any], Hashable]] = None):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.key_fn = key_fn or (lambda item: None)
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        # 統計
+        self.batches = 0
+        self.items = 0
+
+    @classmethod
+    def from_config(cls, name: str, config_path: str, batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                    key_fn: Optional[Callable[[Any], Hashable]] = None) -> Optional["MicroBatcher"]:
+        """依配置建立批次器，未啟用時回傳 None"""
+        batching_config = config.get(config_path, {}) or {}
+        if not batching_config.get("enabled", False):
+            return None
+        batcher = cls(
+            name,
+            batch_fn,
+            max_batch_size=batching_config.get("max_batch_size", 4),
+            max_wait_ms=batching_config.get("max_wait_ms", 20),
+            key_fn=key_fn,
+        )
+        print(f"{name} 微批次已啟用: max_batch_size={batcher.max_batch_size}, max_wait_ms={batcher.max_wait * 1000:.0f}")
+        return batcher
+
+    async def submit(self, item: Any) -> Any:
+        """加入批次並等待自己的結果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self.key_fn(item)
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        # 批次內部的 span 不屬於任何單一請求，這裡以等待時間代表本請求在批次中的耗時
+        with span("batch.wait", batcher=self.name):
+            return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        # 已取消的請求（例如客戶端斷線）不進入批次
+        entries = [(item, future) for item, future in self._pending.pop(key, []) if not future.done()]
+        if entries:
+            with detached():
+                asyncio.ensure_future(self._run_batch(entries))
+
+    async def _run_batch(self, entries: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(entries)
+        if len(entries) > 1:
+            print(f"{self.name} 批次推論: {len(entries)} 筆")
+        _current_batch.set(entries)
+        try:
+            results = await self.batch_fn([item for item, _ in entries])
+        except Exception as e:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(entries, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,137 @@
+"""
+客戶端斷線取消
+使用者關閉分頁或前端 axios 逾時後，伺服器原本仍會做完 STT、LLM 與 TTS，再把沒人要的音檔寫進 outputs：
+- cancel_on_disconnect 包裝端點：背景輪詢連線狀態，斷線時設定取消旗標並取消處理中的協程
+  （排程器中排隊的工作隨之移出佇列，已取消的請求也不會進入微批次）
+- 取消旗標以 contextvars 傳遞，會隨 executor 複製的上下文進入推論執行緒，
+  長文字分段合成等迴圈在段落之間呼叫 check_cancelled() 提早結束
+- 已在執行緒中運算的單次模型呼叫無法中斷，排程器會等它結束才歸還設備名額
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.batching import cancelled_items
+from app.config import config
+from app.metrics import cancelled_requests
+
+# nginx 慣例：客戶端在回應前關閉連線
+CLIENT_CLOSED_REQUEST = 499
+
+
+class RequestCancelled(Exception):
+    """請求已被取消（客戶端斷線）"""
+
+
+class CancelToken:
+    """跨執行緒的取消旗標"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "client disconnected"):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar("cancel_token", default=None)
+
+
+def check_cancelled():
+    """目前請求已取消時拋出 RequestCancelled（於分段迴圈之間呼叫）"""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise RequestCancelled(f"請求已取消: {token.reason}")
+
+
+class DisconnectWatcher:
+    """輪詢連線狀態，斷線時取消處理中的端點"""
+
+    def __init__(self):
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入斷線偵測參數"""
+        cancellation_config = config.get("cancellation", {}) or {}
+        self.enabled = cancellation_config.get("enabled", True)
+        self.poll_interval = cancellation_config.get("poll_interval_seconds", 0.5)
+
+    async def run(self, request: Request, endpoint: str, coro: Awaitable[Any]) -> Any:
+        """執行端點協程，客戶端斷線時取消它並回傳 499"""
+        token = CancelToken()
+        context_token = _current_token.set(token)
+        try:
+            # 工作建立時複製目前上下文，取消旗標會跟著進入排程器與推論執行緒
+            task = asyncio.ensure_future(coro)
+        finally:
+            _current_token.reset(context_token)
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.poll_interval)
+                if done:
+                    return task.result()
+                if await request.is_disconnected():
+                    break
+        except asyncio.CancelledError:
+            token.cancel("server cancelled")
+            task.cancel()
+            raise
+
+        token.cancel()
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        cancelled_requests.inc(endpoint=endpoint)
+        print(f"客戶端已斷線，取消請求: {endpoint}")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+
+# 全域斷線偵測器
+disconnect_watcher = DisconnectWatcher()
+
+
+def cancel_on_disconnect(endpoint: Callable) -> Callable:
+    """端點裝飾器：客戶端斷線時取消處理（端點參數需包含 Request）"""
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        request = next((value for value in kwargs.values() if isinstance(value, Request)), None)
+        if request is None or not disconnect_watcher.enabled:
+            return await endpoint(*args, **kwargs)
+        return await disconnect_watcher.run(request, request.url.path, endpoint(*args, **kwargs))
+
+    return wrapper
+
+
+def skip_cancelled(batch_fn: Callable[[List[Any]], List[Any]]) -> Callable[[List[Any]], List[Any]]:
+    """包裝同步批次函式：開始執行時略過請求已取消的項目
+
+    微批次送出後仍可能在排程器排隊一段時間，這段期間取消的請求在這裡剔除，不佔用 GPU。
+    """
+
+    @functools.wraps(batch_fn)
+    def run(items: List[Any]) -> List[Any]:
+        cancelled = cancelled_items()
+        if not any(cancelled):
+            return batch_fn(items)
+        results: List[Any] = [RequestCancelled("請求已取消") for _ in items]
+        live = [i for i in range(len(items)) if i >= len(cancelled) or not cancelled[i]]
+        if live:
+            for i, result in zip(live, batch_fn([items[i] for i in live])):
+                results[i] = result
+        return results
+
+    return run
@@ -1,14 +1,21 @@
 import uuid
+import time
 import os
 import sys
-from typing import Dict, Optional
+import threading
+from typing import AsyncIterator, Dict, Optional
 import asyncio
 from app.config import config
+from app.scheduler import scheduler
+from app.metrics import llm_latency
+from app.tracing import span, record_span
 
 # 加入 llm_tools 路徑
 sys.path.append('/app/llm_tools')
 
 class ChatService:
+    SYSTEM_PROMPT = "你是一個親切友善並善於誇讚人的語音助理，會用繁體中文回答問題。請保持回覆簡潔有趣，不要講太多話，適合語音對話。"
+
     def __init__(self):
         # 儲存對話歷史（簡單版本，生產環境建議用資料庫）
         self.conversations: Dict[str, list] = {}
@@ -25,6 +32,7 @@ class ChatService:
         self.device = chat_config.get("device", "auto")
         self.llm_tools_device = chat_config.get("llm_tools_device", self.device)
         print(f"Chat 配置載入: use_llm_tools={self.use_llm_tools}, device={self.device}, llm_tools_device={self.llm_tools_device}")
+        scheduler.register_engine("llm", self.llm_tools_device if self.use_llm_tools else self.device)
         
     async def initialize_llm(self, use_llm_tools: bool = None, 
                            llm_tools_config: str = None, 
@@ -77,6 +85,7 @@ class ChatService:
     async def get_response(self, user_message: str, conversation_id: Optional[str] = None) -> Dict:
         """取得機器人回覆"""
         try:
+            start_time = time.time()
             # 如果沒有對話 ID，建立新的
             if not conversation_id:
                 conversation_id = str(uuid.uuid4())
@@ -94,18 +103,8 @@ class ChatService:
                 bot_response = await self._generate_simple_response(user_message, self.conversations[conversation_id])
             
             # 更新對話歷史
-            self.conversations[conversation_id].append({
-                "role": "user",
-                "content": user_message
-            })
-            self.conversations[conversation_id].append({
-                "role": "assistant", 
-                "content": bot_response
-            })
-            
-            # 限制對話歷史長度（避免記憶體過度使用）
-            if len(self.conversations[conversation_id]) > 20:
-                self.conversations[conversation_id] = self.conversations[conversation_id][-20:]
+            self._append_history(conversation_id, user_message, bot_response)
+            llm_latency.observe(time.time() - start_time, mode="full")
             
             return {
                 "message": bot_response,
@@ -116,26 +115,121 @@ class ChatService:
             print(f"聊天處理錯誤: {e}")
             raise Exception(f"無法產生回覆: {str(e)}")
     
+    async def stream_response(self, user_message: str, conversation_id: str) -> AsyncIterator[str]:
+        """以增量方式產生機器人回覆，逐段 yield 新增的文字
+
+        LLM 支援 stream_chat 時逐 token 輸出，否則退回一次性回覆。
+        串流結束後會與 get_response 一樣更新對話歷史。
+        """
+        if conversation_id not in self.conversations:
+            self.conversations[conversation_id] = []
+        
+        chunks = []
+        start_time = time.time()
+        try:
+            if self.llm_chat and hasattr(self.llm_chat, "stream_chat"):
+                async for delta in self._stream_llm_response(user_message, conversation_id):
+                    chunks.append(delta)
+                    yield delta
+            else:
+                if self.llm_chat:
+                    bot_response = await self._generate_llm_response(user_message, conversation_id)
+                else:
+                    bot_response = await self._generate_simple_response(user_message, self.conversations[conversation_id])
+                chunks.append(bot_response)
+                yield bot_response
+        except Exception as e:
+            print(f"串流聊天處理錯誤: {e}")
+            raise Exception(f"無法產生回覆: {str(e)}")
+        
+        self._append_history(conversation_id, user_message, "".join(chunks).strip())
+        llm_latency.observe(time.time() - start_time, mode="stream")
+    
+    async def _stream_llm_response(self, user_message: str, conversation_id: str) -> AsyncIterator[str]:
+        """呼叫 LLM 的串流介面，統一轉換為增量文字
+
+        整個產生器在同一個排程工作中跑完（只佔一個設備名額、只排隊一次），
+        執行緒把每段輸出送進 asyncio.Queue，事件迴圈這端逐段取出。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stop = threading.Event()
+        history = self._build_llm_history(conversation_id)
+
+        def produce():
+            for item in self.llm_chat.stream_chat(query=user_message, history=history, system=self.SYSTEM_PROMPT):
+                if stop.is_set():
+                    break  # 呼叫端已停止讀取（例如客戶端斷線），提早結束解碼
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        emitted = ""
+        start_time = time.time()
+        first_token_time = None
+        job = asyncio.ensure_future(scheduler.run("llm", produce))
+        # 工作結束（含排隊逾時、執行失敗）時放入結束標記，排在執行緒送出的所有輸出之後
+        job.add_done_callback(lambda _: queue.put_nowait(finished))
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                # 部分實作回傳 (response, history)，部分回傳累積文字，部分回傳增量文字
+                text = item[0] if isinstance(item, tuple) else item
+                if not text:
+                    continue
+                if text.startswith(emitted):
+                    delta = text[len(emitted):]
+                    emitted = text
+                else:
+                    delta = text
+                    emitted += text
+                if delta:
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    yield delta
+            await job  # 產生器中途失敗時在這裡拋出
+        finally:
+            stop.set()
+            if not job.done():
+                job.cancel()
+        # 產生器跨越多次 yield，無法以 with 區塊包住，結束時再記錄
+        record_span("llm.stream", start_time, first_token_ms=round((first_token_time or 0) * 1000),
+                    response_chars=len(emitted))
+    
+    def _build_llm_history(self, conversation_id: str) -> list:
+        """將對話歷史轉換成 LLM 所需的格式"""
+        return [
+            {'role': msg['role'], 'content': msg['content']}
+            for msg in self.conversations.get(conversation_id, [])
+        ]
+    
+    def _append_history(self, conversation_id: str, user_message: str, bot_response: str):
+        """寫入一輪對話並限制歷史長度（避免記憶體過度使用）"""
+        history = self.conversations.setdefault(conversation_id, [])
+        history.append({
+            "role": "user",
+            "content": user_message
+        })
+        history.append({
+            "role": "assistant", 
+            "content": bot_response
+        })
+        if len(history) > 20:
+            self.conversations[conversation_id] = history[-20:]
+    
     async def _generate_llm_response(self, user_message: str, conversation_id: str) -> str:
         """使用 LLM 產生回覆"""
         try:
-            # 取得對話歷史
-            history = self.conversations.get(conversation_id, [])
-            
-            # 轉換成 LLM 所需的格式
-            llm_history = []
-            for msg in history:
-                llm_history.append({
-                    'role': msg['role'],
-                    'content': msg['content']
-                })
-            
-            # 呼叫 LLM
-            response, _ = self.llm_chat.chat(
-                query=user_message,
-                history=llm_history,
-                system="你是一個親切友善並善於誇讚人的語音助理，會用繁體中文回答問題。請保持回覆簡潔有趣，不要講太多話，適合語音對話。"
-            )
+            # 呼叫 LLM（於 LLM 執行緒池中執行，避免阻塞事件迴圈）
+            with span("llm.call", message_chars=len(user_message)):
+                response, _ = await scheduler.run(
+                    "llm",
+                    self.llm_chat.chat,
+                    query=user_message,
+                    history=self._build_llm_history(conversation_id),
+                    system=self.SYSTEM_PROMPT
+                )
             
             return response.strip()
             
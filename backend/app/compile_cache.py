@@ -0,0 +1,224 @@
+"""
+torch.compile 編譯快取
+torch.compile 的編譯成本原本在每次啟動都要重付一次（實際編譯發生在第一次前向，也就是預熱時）。
+這裡統一管理編譯設定與快取目錄，讓各引擎的編譯步驟重用上次（或映像建置時）產生的結果：
+- Inductor FX graph 快取與 Triton 核心快取寫入 compile_cache.dir 下依環境分開的子目錄，
+  環境鍵包含 torch / CUDA 版本、Python 版本與 GPU 型號，任一項改變即使用新目錄（舊目錄可自動清除）
+- 每個引擎另記錄 manifest：模型權重簽章（檔名、大小、修改時間）與編譯模式，
+  啟動時比對以回報快取命中，模型更新後會重新編譯
+- 各引擎是否編譯、編譯模式由 compile_cache.engines.<引擎> 設定（預設只有 BreezyVoice 開啟）
+
+映像建置或部署時預先編譯（需要 GPU 與模型，GPU 型號須與執行環境相同）：
+    python -m app.compile_cache --engines breezy,vibe
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import config
+
+# 權重檔副檔名（模型簽章只看這些檔案）
+WEIGHT_EXTENSIONS = (".pt", ".pth", ".bin", ".safetensors", ".onnx", ".ckpt")
+
+DEFAULT_ENGINES = {
+    "breezy": {"enabled": True, "mode": "reduce-overhead"},
+    "vibe": {"enabled": False, "mode": "default"},
+    "spark": {"enabled": False, "mode": "default"},
+}
+
+
+def model_signature(model_path: str) -> str:
+    """模型權重簽章：路徑下權重檔的相對路徑、大小與修改時間；路徑不存在時為模型名稱本身"""
+    if not os.path.exists(model_path):
+        return model_path
+    digest = hashlib.sha1()
+    paths = [model_path] if os.path.isfile(model_path) else sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(model_path)
+        for name in names
+        if name.endswith(WEIGHT_EXTENSIONS)
+    )
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, model_path)}:{stat.st_size}:{int(stat.st_mtime)}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CompileCache:
+    """管理 torch.compile 的設定與跨重啟的編譯快取目錄"""
+
+    def __init__(self):
+        self.cache_dir: Optional[str] = None  # 目前環境對應的子目錄，第一次編譯時決定
+        self.environment: Dict[str, Any] = {}
+        self.engine_status: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入編譯快取參數"""
+        cache_config = config.get("compile_cache", {}) or {}
+        self.enabled = cache_config.get("enabled", True)
+        self.root = cache_config.get("dir", "./cache/torch_compile")
+        self.prune_stale = cache_config.get("prune_stale", True)
+        engines = cache_config.get("engines", {}) or {}
+        self.engines = {name: {**DEFAULT_ENGINES.get(name, {}), **(engines.get(name) or {})}
+                        for name in set(DEFAULT_ENGINES) | set(engines)}
+
+    def is_enabled(self, engine: str) -> bool:
+        return self.enabled and self.engines.get(engine, {}).get("enabled", False)
+
+    def _environment(self, torch) -> Dict[str, Any]:
+        """影響編譯結果的環境：任一項不同，快取就不能共用"""
+        devices = []
+        if torch.cuda.is_available():
+            for i in range(torch.cuda.device_count()):
+                major, minor = torch.cuda.get_device_capability(i)
+                devices.append(f"{torch.cuda.get_device_name(i)} (sm_{major}{minor})")
+        return {
+            "torch": torch.__version__,
+            "cuda": torch.version.cuda,
+            "python": platform.python_version(),
+            "devices": sorted(set(devices)) or ["cpu"],
+        }
+
+    def _configure(self, torch):
+        """決定快取子目錄並指向 Inductor / Triton（整個行程共用，只設定一次）"""
+        with self._lock:
+            if self.cache_dir is not None:
+                return
+            self.environment = self._environment(torch)
+            key = hashlib.sha1(json.dumps(self.environment, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+            self.cache_dir = os.path.join(self.root, key)
+            os.makedirs(os.path.join(self.cache_dir, "manifests"), exist_ok=True)
+            with open(os.path.join(self.cache_dir, "environment.json"), "w", encoding="utf-8") as f:
+                json.dump(self.environment, f, ensure_ascii=False, indent=2)
+
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(self.cache_dir, "inductor")
+            os.environ["TRITON_CACHE_DIR"] = os.path.join(self.cache_dir, "triton")
+            try:
+                import torch._inductor.config as inductor_config
+                inductor_config.fx_graph_cache = True
+            except Exception as e:
+                print(f"無法啟用 FX graph 快取: {e}")
+            print(f"編譯快取目錄: {self.cache_dir}（{', '.join(self.environment['devices'])}，torch {self.environment['torch']}）")
+
+            if self.prune_stale:
+                self._prune(key)
+
+    def _prune(self, current_key: str):
+        """刪除其他環境（舊 torch / 驅動 / GPU）留下的快取目錄"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == current_key or not os.path.exists(os.path.join(path, "environment.json")):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"已清除過期的編譯快取: {path}")
+
+    def _manifest_path(self, engine: str) -> str:
+        return os.path.join(self.cache_dir, "manifests", f"{engine}.json")
+
+    def _read_manifest(self, engine: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._manifest_path(engine), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def compile(self, engine: str, target: Any, model_path: str) -> Any:
+        """依 compile_cache.engines.<engine> 以 torch.compile 包裝 target（模組或 forward）
+
+        停用、torch 不支援或編譯失敗時回傳原本的 target；實際編譯在第一次呼叫（預熱）時進行。
+        """
+        if not self.is_enabled(engine):
+            return target
+        import torch
+
+        if not hasattr(torch, "compile"):
+            print(f"torch {torch.__version__} 不支援 torch.compile，{engine} 不編譯")
+            return target
+
+        self._configure(torch)
+        engine_config = self.engines[engine]
+        manifest = {
+            "engine": engine,
+            "model": model_signature(model_path),
+            "model_path": model_path,
+            "mode": engine_config.get("mode", "default"),
+            "dynamic": engine_config.get("dynamic"),
+        }
+        previous = self._read_manifest(engine)
+        hit = previous is not None and all(previous.get(key) == value for key, value in manifest.items())
+        if previous is not None and not hit:
+            print(f"{engine} 的模型或編譯設定已變更，重新編譯")
+
+        try:
+            compiled = torch.compile(target, mode=manifest["mode"], dynamic=manifest["dynamic"])
+        except Exception as e:
+            print(f"⚠ {engine} torch.compile 失敗: {e}")
+            self.engine_status[engine] = {"compiled": False, "error": str(e)}
+            return target
+
+        with open(self._manifest_path(engine), "w", encoding="utf-8") as f:
+            json.dump({**manifest, "compiled_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, ensure_ascii=False, indent=2)
+        self.engine_status[engine] = {"compiled": True, "mode": manifest["mode"], "cache": "hit" if hit else "miss"}
+        print(f"✓ 已啟用 {engine} torch.compile（mode={manifest['mode']}，快取{'命中' if hit else '未命中'}）")
+        return compiled
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "dir": self.cache_dir,
+            "environment": self.environment,
+            "engines": self.engine_status,
+        }
+
+
+# 全域編譯快取
+compile_cache = CompileCache()
+
+
+async def precompile(engines: List[str]) -> Dict[str, Any]:
+    """載入引擎並以預熱輸入觸發編譯，讓結果寫入快取目錄"""
+    from app.tts_registry import tts_registry, call_synthesize
+    from app.warmup import warmup_runner
+
+    warmup_runner.enabled = True  # 編譯在第一次前向時發生，預熱停用時也要跑
+    for name in engines:
+        if not compile_cache.is_enabled(name):
+            print(f"略過 {name}：compile_cache.engines.{name}.enabled 未開啟")
+            continue
+        print(f"\n=== 預先編譯 {name} ===")
+        start_time = time.time()
+        service = await tts_registry.create_engine(name)
+        await warmup_runner.warm_tts(name, lambda text: call_synthesize(name, service, text))
+        print(f"{name} 預先編譯完成，耗時 {time.time() - start_time:.1f} 秒")
+        if hasattr(service, "cleanup"):
+            service.cleanup()
+    return compile_cache.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="預先編譯 TTS 引擎並寫入 torch.compile 快取")
+    parser.add_argument("--engines", default=",".join(name for name in DEFAULT_ENGINES if compile_cache.is_enabled(name)),
+                        help="逗號分隔的引擎名稱（預設為已開啟編譯的引擎）")
+    args = parser.parse_args()
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    if not engines:
+        print("沒有開啟編譯的引擎（compile_cache.engines）")
+        sys.exit(1)
+    stats = asyncio.run(precompile(engines))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
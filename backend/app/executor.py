@@ -0,0 +1,66 @@
+"""
+模型推論執行器
+所有同步的模型呼叫（Whisper 解碼、LLM、TTS 生成）都透過這裡丟到各引擎專屬的
+執行緒池，避免阻塞 asyncio 事件迴圈，不同引擎之間也能同時運算。
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import config
+
+
+class InferenceExecutor:
+    """以引擎名稱（stt / llm / tts_vibe ...）區分的執行緒池集合
+
+    模型物件常駐於主行程記憶體，因此使用執行緒池而非行程池；
+    PyTorch 與 CTranslate2 在運算期間會釋放 GIL，執行緒即可並行。
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入執行緒池大小"""
+        executor_config = config.get("executor", {})
+        self.default_workers = executor_config.get("default_workers", 1)
+        self.workers = executor_config.get("workers", {})
+
+    def get_workers(self, engine: str) -> int:
+        """取得引擎的執行緒數，查找順序：完整名稱 -> 前綴（tts_vibe -> tts）-> 預設值"""
+        if engine in self.workers:
+            return int(self.workers[engine])
+        prefix = engine.split("_")[0]
+        if prefix in self.workers:
+            return int(self.workers[prefix])
+        return int(self.default_workers)
+
+    def _get_pool(self, engine: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(engine)
+        if pool is None:
+            workers = self.get_workers(engine)
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"infer-{engine}")
+            self._pools[engine] = pool
+            print(f"建立推論執行緒池: {engine} (workers={workers})")
+        return pool
+
+    async def run(self, engine: str, fn: Callable, *args, **kwargs) -> Any:
+        """在引擎的執行緒池中執行同步函式並等待結果"""
+        loop = asyncio.get_running_loop()
+        # 複製 contextvars，讓執行緒內也能取得請求層級的上下文
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._get_pool(engine), call)
+
+    def shutdown(self, wait: bool = False):
+        """關閉所有執行緒池"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
+
+
+# 全域推論執行器實例
+inference_executor = InferenceExecutor()
@@ -0,0 +1,115 @@
+"""
+音檔 HTTP 回應
+/audio 使用的內容雜湊 ETag、Cache-Control、304 條件請求與 byte range（206）回應。
+產生的音檔檔名唯一且內容不再變動，因此可標記為 immutable。
+ETag 與 Range 解析不依賴 FastAPI，只有建立回應時才匯入。
+"""
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from fastapi import Request
+    from fastapi.responses import Response
+
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+
+_file_etags: Dict[Tuple[str, int, int], str] = {}
+_file_etags_lock = threading.Lock()
+
+
+def content_etag(data: bytes) -> str:
+    """以內容雜湊產生強 ETag"""
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def file_etag(path: str) -> str:
+    """磁碟檔案的內容雜湊 ETag，依 (路徑, 修改時間, 大小) 快取（同步，需在執行緒中呼叫）"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _file_etags_lock:
+        etag = _file_etags.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = '"' + digest.hexdigest()[:32] + '"'
+        with _file_etags_lock:
+            if len(_file_etags) >= 4096:
+                _file_etags.clear()
+            _file_etags[key] = etag
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """檢查 If-None-Match（支援 *、多個值與弱比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析單一 byte range，回傳 (start, end)（含 end）
+
+    格式不正確或為多段範圍時拋出 ValueError（呼叫端應忽略 Range 回傳完整內容）；
+    範圍無法滿足時回傳 None（應回 416）。
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("不支援的 Range")
+    start_text, _, end_text = spec.strip().partition("-")
+    if not start_text:
+        # 後綴範圍：最後 N bytes
+        length = int(end_text)
+        if length <= 0 or size <= 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+async def audio_response(request: "Request", filename: str, media_type: str, etag: str, size: int,
+                         read_range: Callable[[int, int], Awaitable[bytes]],
+                         full_response: Callable[[Dict[str, str]], "Response"]) -> "Response":
+    """依條件請求標頭回傳 304 / 206 / 416 或完整內容
+
+    Args:
+        read_range: 讀取 [start, end] 內容的協程
+        full_response: 以共用標頭建立 200 回應
+    """
+    from fastapi.responses import Response
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL_IMMUTABLE,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL_IMMUTABLE})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return full_response(headers)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+        start, end = byte_range
+        return Response(
+            content=await read_range(start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={"Content-Range": f"bytes {start}-{end}/{size}", **headers},
+        )
+    return full_response(headers)
@@ -0,0 +1,88 @@
+"""
+匯入耗時
+TTS 引擎模組與其相依套件（torch、torchaudio、vibevoice 等）只在被選用時才匯入，這裡追蹤匯入成本：
+- import_timer 記錄行程內實際發生的匯入耗時（app 本身與各 TTS 引擎模組），由 /startup 與
+  module_import_seconds 指標提供
+- run_importtime 以 `python -X importtime` 在子行程中匯入目標模組，解析出每個模組的自身 / 累計耗時，
+  供 benchmarks.import_profile 產生報告並與基準比較
+"""
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# import time:       123 |        456 |   package.module
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+class ImportTimer:
+    """行程內的匯入耗時記錄"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, module: str, seconds: float):
+        with self._lock:
+            self.seconds[module] = seconds
+
+    @contextmanager
+    def track(self, module: str):
+        """記錄區塊內匯入 module 的耗時（已匯入過的模組幾乎為 0）"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(module, time.perf_counter() - start_time)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {module: round(seconds, 3) for module, seconds in self.seconds.items()}
+
+
+# 全域匯入耗時記錄
+import_timer = ImportTimer()
+
+
+def parse_importtime(output: str) -> List[Dict[str, Any]]:
+    """解析 -X importtime 的 stderr，回傳各模組的自身 / 累計耗時（秒）與巢狀深度"""
+    entries = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        entries.append({
+            "module": module,
+            "self_seconds": int(self_us) / 1e6,
+            "cumulative_seconds": int(cumulative_us) / 1e6,
+            "depth": (len(indent) - 1) // 2,
+        })
+    return entries
+
+
+def run_importtime(target: str = "app.main", python: Optional[str] = None, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """在子行程中以 -X importtime 匯入 target，回傳總牆鐘時間與各模組耗時"""
+    start_time = time.perf_counter()
+    completed = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, cwd=cwd
+    )
+    wall_time = time.perf_counter() - start_time
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "未知錯誤"
+        raise Exception(f"匯入 {target} 失敗: {error}")
+    entries = parse_importtime(completed.stderr)
+    return {"target": target, "wall_seconds": wall_time, "modules": entries}
+
+
+def summarize_packages(entries: List[Dict[str, Any]]) -> Dict[str, float]:
+    """依頂層套件加總自身耗時（例如 torch.* 全部歸在 torch），由大到小排列"""
+    totals: Dict[str, float] = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        totals[package] = totals.get(package, 0.0) + entry["self_seconds"]
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
@@ -1,27 +1,50 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, Response
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import tempfile
+import asyncio
+import json
+import base64
 import os
 import uuid
 import time
+import numpy as np
 from datetime import datetime
 from typing import Optional, List
 
 from app.stt import STTService
-from app.tts_vibe import TTSVibeService
-from app.tts_breezy import TTSBreezyService
-from app.tts_index import TTSIndexService
-from app.tts_spark import TTSSparkService
+from app.tts_registry import tts_registry, call_synthesize
+from app.tts_router import tts_router, TTS_AUTO_PROVIDER, speaker_key
+from app.tracing import tracer, start_trace, span, current_trace_id, TRACE_HEADER
+from app.metrics import metrics, tts_latency, time_to_first_audio, queue_depth, active_conversations, outputs_dir_bytes, outputs_dir_files, warmup_duration, module_import_seconds
 from app.chat import ChatService
+from app.pipeline import SpeechPipeline, split_sentences
+from app.audio_utils import wav_stream_header, wav_to_pcm16, silence_pcm16
 from app.config import config  # 導入配置管理
+from app.executor import inference_executor
+from app.audio_store import audio_store
+from app.retention import retention_manager
+from app.http_audio import audio_response, file_etag
+from app.audio_codec import resolve_output_format, transcode_async, media_type_for, extension_for, media_type_for_filename
+from app.scheduler import scheduler, inference_priority, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from app.admission import admission_controller, Overloaded
+from app.cancellation import cancel_on_disconnect
+from app.startup import startup_report, STAGE_PENDING, STAGE_LOADING, STAGE_FAILED
+from app.warmup import warmup_runner
+from app.import_profile import import_timer
+from app.compile_cache import compile_cache
+from app import IMPORT_STARTED_AT
 
 # Pydantic 模型定義
 class TTSRequest(BaseModel):
     text: str = Field(..., description="要合成的文字")
     speaker_voice_path: Optional[str] = Field(None, description="語者音檔路徑")
     cfg_scale: Optional[float] = Field(1.0, description="CFG 尺度參數（0.5-2.0，僅 VibeVoice 使用）")
+    format: Optional[str] = Field(None, description="輸出格式：wav、opus、mp3、flac（未指定時依 Accept 標頭）")
+    sample_rate: Optional[int] = Field(None, description="輸出取樣率（8000-48000，預設為引擎原生取樣率）")
+    provider: Optional[str] = Field(None, description="TTS 引擎：breezy、vibe、index、spark、auto（預設為 tts.provider）")
+    latency_target: Optional[float] = Field(None, description="provider=auto 時的延遲目標（秒，預設為 tts.router.latency_target_seconds）")
 
 # 從配置文件讀取 API 設定
 api_config = config.get_api_config()
@@ -38,6 +61,7 @@ app.add_middleware(
     allow_credentials=cors_config.get("allow_credentials", True),
     allow_methods=cors_config.get("allow_methods", ["*"]),
     allow_headers=cors_config.get("allow_headers", ["*"]),
+    expose_headers=cors_config.get("expose_headers", [TRACE_HEADER, "Retry-After"]),
 )
 
 # 確保必要目錄存在
@@ -47,100 +71,207 @@ config.ensure_directories()
 stt_service = STTService() if config.is_service_enabled("stt") else None
 chat_service = ChatService() if config.is_service_enabled("chat") else None
 
-# 根據配置選擇 TTS 提供者
-tts_provider = config.get_tts_provider()
-if tts_provider == "vibe" and config.is_service_enabled("tts"):
-    tts_service = TTSVibeService()
-    print("使用 VibeVoice TTS")
-elif tts_provider == "breezy" and config.is_service_enabled("tts"):
-    tts_service = TTSBreezyService()
-    print("使用 BreezyVoice TTS")
-elif tts_provider == "index" and config.is_service_enabled("tts"):
-    tts_service = TTSIndexService()
-    print("使用 IndexTTS")
-elif tts_provider == "spark" and config.is_service_enabled("tts"):
-    tts_service = TTSSparkService()
-    print("使用 Spark-TTS")
+# app 套件與其相依（不含 TTS 引擎，引擎模組於選用時才匯入）的匯入耗時
+import_timer.record("app.main", time.perf_counter() - IMPORT_STARTED_AT)
+
+# TTS 引擎由註冊表依需求載入，tts.provider 為未指定 provider 時的預設引擎
+tts_provider = tts_registry.default_provider
+if tts_registry.enabled:
+    print(f"預設 TTS 引擎: {tts_provider}，可用引擎: {', '.join(tts_registry.available_providers())}")
 else:
-    tts_service = None
     print("TTS 服務已停用")
 
+# /metrics 的狀態指標於抓取時才計算
+queue_depth.set_function(lambda: {(engine,): depth for engine, depth in scheduler.get_queue_depths().items()})
+active_conversations.set_function(lambda: len(chat_service.conversations) if chat_service else 0)
+outputs_dir_bytes.set_function(lambda: retention_manager.total_bytes)
+outputs_dir_files.set_function(lambda: retention_manager.get_stats()["files"])
+module_import_seconds.set_function(lambda: {(module,): seconds for module, seconds in import_timer.get_stats().items()})
+warmup_duration.set_function(lambda: {(engine,): result["duration_seconds"] for engine, result in warmup_runner.results.items()})
+
+# 各端點的排程優先權：互動式對話優先，批次 TTS 墊後
+ROUTE_PRIORITIES = {
+    "/tts": PRIORITY_BULK,
+    "/tts_conversation": PRIORITY_BULK,
+}
+
+# 各端點會用到的推論引擎（入場控制依這些引擎的佇列判斷），"tts" 代表預設 TTS 引擎
+ROUTE_ENGINES = {
+    "/stt": ("stt",),
+    "/chat": ("llm",),
+    "/voice_chat": ("stt", "llm", "tts"),
+    "/text_chat": ("llm", "tts"),
+    "/conversation": ("stt", "llm", "tts"),
+    "/tts": ("tts",),
+    "/tts_conversation": ("tts_vibe",),
+}
+
+# 各端點開始受理前需要就緒的能力（啟動階段）；/text_chat 等在 TTS 載入中時先回文字，音檔稍後提供
+ROUTE_CAPABILITIES = {
+    "/stt": ("stt",),
+    "/chat": ("llm",),
+    "/voice_chat": ("stt", "llm"),
+    "/text_chat": ("llm",),
+    "/conversation": ("stt", "llm"),
+    "/tts": ("tts",),
+    "/tts_conversation": ("tts",),
+}
+
+startup_config = config.get("startup", {}) or {}
+LOADING_RETRY_AFTER = startup_config.get("loading_retry_after_seconds", 10)
+PENDING_AUDIO_RETRY_AFTER = startup_config.get("pending_audio_retry_after_seconds", 1)
+
+# 背景工作（背景載入、延後合成）保留參照，避免被垃圾回收
+_background_tasks = set()
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _unavailable_capability(capabilities) -> Optional[str]:
+    """回傳第一個尚未就緒（載入中或載入失敗）的能力；停用的服務由端點自行處理"""
+    for capability in capabilities:
+        if startup_report.status(capability) in (STAGE_PENDING, STAGE_LOADING, STAGE_FAILED):
+            return capability
+    return None
+
+def _capability_error(capability: str) -> dict:
+    if startup_report.status(capability) == STAGE_FAILED:
+        return {"code": "unavailable", "detail": f"{capability} 載入失敗，服務無法使用"}
+    return {"code": "loading", "detail": f"{capability} 模型載入中，請於 {LOADING_RETRY_AFTER} 秒後重試",
+            "retry_after": LOADING_RETRY_AFTER}
+
+def _capability_response(capability: str) -> JSONResponse:
+    error = _capability_error(capability)
+    headers = {"Retry-After": str(error["retry_after"])} if "retry_after" in error else None
+    return JSONResponse(status_code=503, content=error, headers=headers)
+
+def _tts_loading() -> bool:
+    """預設 TTS 引擎仍在啟動載入中（載入失敗時照常合成並回報錯誤）"""
+    return startup_report.status("tts") in (STAGE_PENDING, STAGE_LOADING)
+
+def _admission_engines(engines) -> List[str]:
+    return [f"tts_{tts_registry.default_provider}" if engine == "tts" else engine for engine in engines]
+
+def _overloaded_response(e: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.middleware("http")
+async def inference_priority_middleware(request, call_next):
+    """依請求路徑設定此請求所有模型呼叫的排程優先權與截止時間
+
+    過載時在讀取上傳內容前就以 429 + Retry-After 拒絕；所需模型仍在載入時回 503。
+    """
+    priority = ROUTE_PRIORITIES.get(request.url.path, PRIORITY_INTERACTIVE)
+    engines = ROUTE_ENGINES.get(request.url.path)
+    if request.method == "POST":
+        capability = _unavailable_capability(ROUTE_CAPABILITIES.get(request.url.path, ()))
+        if capability:
+            return _capability_response(capability)
+    if engines and request.method == "POST":
+        try:
+            admission_controller.admit(request.url.path, _admission_engines(engines), priority)
+        except Overloaded as e:
+            return _overloaded_response(e)
+    with inference_priority(priority):
+        return await call_next(request)
+
+@app.middleware("http")
+async def tracing_middleware(request, call_next):
+    """每個請求建立一個 trace（沿用 X-Trace-Id / traceparent），trace ID 以 X-Trace-Id 回傳
+
+    串流回應在標頭送出時根 span 即結束，之後各段合成的 span 仍會記錄在同一個 trace。
+    """
+    incoming = request.headers.get(TRACE_HEADER) or request.headers.get("traceparent")
+    with start_trace(f"{request.method} {request.url.path}", incoming) as root:
+        response = await call_next(request)
+        if root is not None:
+            root.set_attribute("status_code", response.status_code)
+            response.headers[TRACE_HEADER] = root.trace_id
+        return response
+
 @app.on_event("startup")
 async def startup_event():
-    """啟動時初始化模型"""
+    """啟動時初始化模型：STT、TTS、LLM 各自在專屬執行緒中同時載入
+
+    startup.background_loading 開啟時載入在背景進行，伺服器立即開始受理請求，
+    各端點在所需的能力就緒後即可使用（GET /health/ready 回報整體就緒狀態）。
+    """
     print("正在根據配置初始化服務...")
+    scheduler.bind_loop(asyncio.get_running_loop())
+    startup_report.begin()
+    startup_report.register("stt", enabled=stt_service is not None)
+    startup_report.register("tts", enabled=tts_registry.enabled)
+    startup_report.register("llm", enabled=chat_service is not None)
+    
+    # 建立輸出目錄索引並啟動背景清理
+    await retention_manager.start()
     
+    stages = []
     # 初始化 STT
     if stt_service:
-        print("初始化 STT...")
         stt_config = config.get_stt_config()
         model_name = stt_config.get("model", "large-v3-turbo")
         model_path = stt_config.get("model_path", "./models")
-        await stt_service.initialize(model_name=model_name, model_path=model_path)
-        print(f"STT 初始化完成 (模型: {model_name}, 路徑: {model_path})")
-    
-    # 初始化 TTS
-    if tts_service:
-        tts_config = config.get_tts_config()
-        print(f"初始化 {tts_provider.upper()} TTS...")
-        
-        if tts_provider == "vibe":
-            # VibeVoice 配置
-            model_name = tts_config.get("model_name", "microsoft/VibeVoice-1.5B")
-            await tts_service.initialize(model_name=model_name)
-            
-        elif tts_provider == "breezy":
-            # BreezyVoice 配置
-            model_repo = tts_config.get("model_repo", "MediaTek-Research/BreezyVoice-300M")
-            # 可以從配置中讀取預設語者設定
-            default_speaker = tts_config.get("default_speaker", {})
-            speaker_voices = None
-            speaker_names = None
-            speaker_transcriptions = None
-            
-            # 如果有預設語者配置
-            if default_speaker.get("audio_path"):
-                speaker_voices = [default_speaker["audio_path"]]
-                speaker_names = ["default_speaker"]
-                if default_speaker.get("transcription"):
-                    speaker_transcriptions = [default_speaker["transcription"]]
-            
-            await tts_service.initialize(
-                model_repo=model_repo,
-                speaker_voices=speaker_voices,
-                speaker_names=speaker_names,
-                speaker_transcriptions=speaker_transcriptions
-            )
-            
-        elif tts_provider == "index":
-            # IndexTTS 配置
-            await tts_service.initialize()
-            
-        elif tts_provider == "spark":
-            # Spark-TTS 配置
-            await tts_service.initialize()
         
-        print(f"{tts_provider.upper()} TTS 初始化完成")
+        async def load_stt():
+            await stt_service.initialize(model_name=model_name, model_path=model_path)
+            await warmup_runner.warm_stt(stt_service)
+        
+        stages.append(startup_report.run_stage("stt", load_stt))
+    
+    # 預先載入 TTS 引擎（其餘引擎於第一次使用時載入；註冊表在專屬執行緒中載入引擎，並在登記前預熱）
+    if tts_registry.enabled:
+        stages.append(startup_report.run_stage("tts", tts_registry.preload_engines, in_thread=False))
     
     # 初始化 Chat
     if chat_service:
-        print("初始化 LLM...")
         chat_config = config.get_chat_config()
-        
         use_llm_tools = chat_config.get("use_llm_tools", True)
-        llm_tools_config = chat_config.get("llm_tools_config", "./llm_tools/configs/models.yaml")
-        llm_tools_model = chat_config.get("llm_tools_model", "Qwen2.5-32B-Instruct-GPTQ-Int4")
-        local_model_path = chat_config.get("model_path")
-        
-        await chat_service.initialize_llm(
-            use_llm_tools=use_llm_tools,
-            llm_tools_config=llm_tools_config,
-            llm_tools_model=llm_tools_model,
-            local_model_path=local_model_path
-        )
-        print(f"LLM 初始化完成 (使用 {'llm_tools' if use_llm_tools else 'local'} 模式)")
+        
+        async def load_llm():
+            await chat_service.initialize_llm(
+                use_llm_tools=use_llm_tools,
+                llm_tools_config=chat_config.get("llm_tools_config", "./llm_tools/configs/models.yaml"),
+                llm_tools_model=chat_config.get("llm_tools_model", "Qwen2.5-32B-Instruct-GPTQ-Int4"),
+                local_model_path=chat_config.get("model_path")
+            )
+            await warmup_runner.warm_llm(chat_service)
+        
+        stages.append(startup_report.run_stage("llm", load_llm))
+    
+    if startup_config.get("background_loading", True):
+        _spawn(_load_models(stages))
+        print("模型於背景載入中，已就緒的服務會先開始受理請求")
+        return
     
-    print("所有配置的服務初始化完成!")
+    errors = await _load_models(stages)
+    if errors:
+        raise errors[0]
+
+async def _load_models(stages) -> List[Exception]:
+    """同時執行各載入階段並印出啟動報告，回傳失敗的例外"""
+    results = await asyncio.gather(*stages, return_exceptions=True)
+    startup_report.finish()
+    startup_report.print_summary()
+    errors = [result for result in results if isinstance(result, Exception)]
+    if not errors:
+        print("所有配置的服務初始化完成!")
+    return errors
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """關閉推論執行緒池，並等待音檔寫入磁碟完成"""
+    inference_executor.shutdown()
+    audio_store.shutdown()
+    await retention_manager.stop()
+    tracer.shutdown()
 
 @app.get("/")
 async def root():
@@ -150,26 +281,68 @@ async def root():
         "version": api_config.get('version', '1.0.0'),
         "services": {
             "stt": "enabled" if stt_service else "disabled",
-            "tts": f"enabled ({tts_provider})" if tts_service else "disabled",
+            "tts": f"enabled ({tts_provider})" if tts_registry.enabled else "disabled",
             "chat": "enabled" if chat_service else "disabled"
         },
-        "tts_provider": tts_provider if tts_service else None
+        "tts_provider": tts_provider if tts_registry.enabled else None,
+        "tts_providers": tts_registry.available_providers()
     }
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "stt_ready": stt_service.is_ready(),
-        "tts_ready": tts_service.is_ready(),
-        "llm_ready": chat_service.llm_chat is not None,
+        "stt_ready": stt_service.is_ready() if stt_service else False,
+        "tts_ready": tts_registry.is_ready() if tts_registry.enabled else False,
+        "llm_ready": chat_service is not None and chat_service.llm_chat is not None,
+        "capabilities": {name: startup_report.status(name) for name in ("stt", "llm", "tts")},
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/health/live")
+async def liveness_probe():
+    """存活探針：程序可回應即為存活；必要的能力載入失敗時回 503，交由編排器重新啟動"""
+    failed = [name for name in startup_config.get("ready_requires", ["stt", "llm"])
+              if startup_report.status(name) == STAGE_FAILED]
+    if failed:
+        return JSONResponse(status_code=503, content={"status": "failed", "failed": failed})
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_probe(capability: Optional[str] = None):
+    """就緒探針：startup.ready_requires 中的能力（或指定的 capability）皆已就緒時回 200，否則回 503"""
+    required = [capability] if capability else startup_config.get("ready_requires", ["stt", "llm"])
+    capabilities = {name: startup_report.status(name) for name in ("stt", "llm", "tts")}
+    if capability:
+        waiting = [] if startup_report.is_ready(capability) else [capability]
+    else:
+        waiting = [name for name in required if _unavailable_capability((name,))]
+    content = {"status": "not ready" if waiting else "ready", "waiting": waiting, "capabilities": capabilities}
+    return JSONResponse(status_code=503 if waiting else 200, content=content)
+
+@app.get("/startup")
+async def startup_stats():
+    """啟動報告：各模型載入階段的開始時間、耗時與結果、模組匯入耗時、編譯快取狀態，以及各引擎預熱的首次 / 穩態延遲"""
+    return {
+        **startup_report.get_stats(),
+        "imports": import_timer.get_stats(),
+        "compile_cache": compile_cache.get_stats(),
+        "warmup": warmup_runner.get_stats()
+    }
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """推論排程器的佇列深度、設備使用率與等待時間統計"""
+    return {
+        **scheduler.get_stats(),
+        "admission": admission_controller.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
 @app.get("/health/stt")
 async def health_check_stt():
     """STT 服務健康檢查"""
-    is_ready = stt_service.is_ready()
+    is_ready = stt_service.is_ready() if stt_service else False
     return {
         "service": "STT",
         "status": "healthy" if is_ready else "not ready",
@@ -180,7 +353,7 @@ async def health_check_stt():
 @app.get("/health/llm")
 async def health_check_llm():
     """LLM 服務健康檢查"""
-    is_ready = chat_service.llm_chat is not None
+    is_ready = chat_service is not None and chat_service.llm_chat is not None
     return {
         "service": "LLM", 
         "status": "healthy" if is_ready else "not ready",
@@ -190,17 +363,57 @@ async def health_check_llm():
 
 @app.get("/health/tts")
 async def health_check_tts():
-    """TTS 服務健康檢查"""
-    is_ready = tts_service.is_ready()
+    """TTS 服務健康檢查（預設引擎）"""
+    is_ready = tts_registry.is_ready() if tts_registry.enabled else False
     return {
         "service": "TTS",
         "status": "healthy" if is_ready else "not ready", 
         "ready": is_ready,
+        "loaded_providers": tts_registry.get_stats()["loaded"],
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/tts/engines")
+async def tts_engines():
+    """TTS 引擎註冊表狀態：可用 / 已載入引擎與記憶體用量"""
+    return {
+        **tts_registry.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/tts/router")
+async def tts_router_stats():
+    """TTS 路由狀態：各引擎 / 語者的 RTF 模型與路由次數"""
+    return {
+        **tts_router.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 指標（文字格式）"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="指標已停用")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _resolve_tts_provider(provider: Optional[str], allow_auto: bool = False) -> str:
+    """解析請求的 TTS 引擎，未啟用時回 503、不可用的引擎回 400
+
+    allow_auto 為 True 時保留 "auto"，由合成時依文字長度選擇引擎；
+    其餘需要固定引擎的端點（語者管理）以預設引擎處理 "auto"。
+    """
+    if not tts_registry.enabled:
+        raise HTTPException(status_code=503, detail="TTS 服務未啟用")
+    if provider and provider.lower() == TTS_AUTO_PROVIDER:
+        return TTS_AUTO_PROVIDER if allow_auto else tts_registry.default_provider
+    try:
+        return tts_registry.resolve(provider)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/stt")
-async def speech_to_text(file: UploadFile = File(...)):
+@cancel_on_disconnect
+async def speech_to_text(http_request: Request, file: UploadFile = File(...)):
     """語音轉文字 API"""
     try:
         if not file.content_type.startswith("audio/"):
@@ -209,7 +422,8 @@ async def speech_to_text(file: UploadFile = File(...)):
         start_time = time.time()
         
         # 讀取音檔
-        audio_data = await file.read()
+        with span("upload.read"):
+            audio_data = await file.read()
         
         # 使用 STT 服務轉換
         text = await stt_service.transcribe(audio_data)
@@ -230,111 +444,198 @@ async def speech_to_text(file: UploadFile = File(...)):
 @app.post("/set_speakers")
 async def set_speakers(
     speaker_names: str = Form(...),  # 逗號分隔的語者名稱
-    speaker_audio_files: List[UploadFile] = File(...)
+    speaker_audio_files: List[UploadFile] = File(...),
+    provider: str = Form(None, description="TTS 引擎（預設為 tts.provider）")
 ):
     """設定 TTS 系統的語者音檔"""
+    provider = _resolve_tts_provider(provider)
     try:
-        names = [name.strip() for name in speaker_names.split(',')]
+        # 使用期間標記引擎為使用中，避免同時載入其他引擎時被卸載
+        async with tts_registry.use(provider) as (_, service):
+            names = [name.strip() for name in speaker_names.split(',')]
         
-        if len(names) != len(speaker_audio_files):
-            raise HTTPException(status_code=400, detail="語者名稱數量與音檔數量不符")
+            if len(names) != len(speaker_audio_files):
+                raise HTTPException(status_code=400, detail="語者名稱數量與音檔數量不符")
         
-        # 儲存上傳的語者音檔
-        speaker_paths = []
-        for i, audio_file in enumerate(speaker_audio_files):
-            if not audio_file.content_type.startswith("audio/"):
-                raise HTTPException(status_code=400, detail=f"檔案 {i+1} 不是音頻檔案")
+            # 儲存上傳的語者音檔
+            speaker_paths = []
+            for i, audio_file in enumerate(speaker_audio_files):
+                if not audio_file.content_type.startswith("audio/"):
+                    raise HTTPException(status_code=400, detail=f"檔案 {i+1} 不是音頻檔案")
             
-            speaker_data = await audio_file.read()
-            speaker_path = await tts_service.save_temp_audio(speaker_data, f"speaker_{names[i]}")
-            speaker_paths.append(speaker_path)
+                speaker_data = await audio_file.read()
+                speaker_path = await service.save_temp_audio(speaker_data, f"speaker_{names[i]}")
+                speaker_paths.append(speaker_path)
         
-        # 設定語者音檔
-        await tts_service.set_speaker_voices(speaker_paths, names)
+            # 設定語者音檔
+            await service.set_speaker_voices(speaker_paths, names)
         
-        return {
-            "message": "語者音檔設定成功",
-            "speakers": tts_service.get_speaker_info()
-        }
+            return {
+                "message": "語者音檔設定成功",
+                "speakers": service.get_speaker_info()
+            }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"語者設定錯誤: {str(e)}")
 
 @app.get("/speaker_info")
-async def get_speaker_info():
+async def get_speaker_info(provider: Optional[str] = None):
     """取得目前使用的語者資訊"""
-    if not tts_service:
-        raise HTTPException(status_code=503, detail="TTS 服務未啟用")
-    return tts_service.get_speaker_info()
+    provider = _resolve_tts_provider(provider)
+    async with tts_registry.use(provider) as (_, service):
+        return service.get_speaker_info()
 
 @app.get("/speakers")
-async def list_available_speakers():
+async def list_available_speakers(provider: Optional[str] = None):
     """列出所有可用的語者"""
-    if not tts_service:
-        raise HTTPException(status_code=503, detail="TTS 服務未啟用")
+    provider = _resolve_tts_provider(provider)
     
     try:
-        speakers = tts_service.get_speaker_info()
+        async with tts_registry.use(provider) as (_, service):
+            speakers = service.get_speaker_info()
         return {
             "success": True,
-            "tts_provider": tts_provider,
+            "tts_provider": provider,
             "speakers": speakers,
             "count": len(speakers.get("speakers", [])) if isinstance(speakers, dict) else len(speakers)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取語者列表失敗: {str(e)}")
 
+# 串流 TTS 段落之間插入的靜音長度（秒），與 VibeVoice 合併長文字時一致
+STREAM_SEGMENT_GAP = 0.2
+
+def _split_tts_segments(text: str, service) -> List[str]:
+    """沿用 TTS 引擎長文字分段規則，引擎沒有分段方法時改用句子切分"""
+    splitter = getattr(service, "split_text", None)
+    segments = splitter(text) if splitter else split_sentences(text)
+    return segments or [text]
+
+def _resolve_audio_output(fmt: Optional[str], sample_rate: Optional[int], http_request: Request):
+    """解析輸出格式與取樣率（參數優先，其次 Accept 標頭），不合法時回 400"""
+    try:
+        return resolve_output_format(fmt, sample_rate, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _tts_stream_response(request: TTSRequest, provider: str, stream_format: str, start_time: float,
+                               sample_rate: Optional[int] = None) -> StreamingResponse:
+    """/tts 串流模式：先送 WAV 檔頭（長度未知）或裸 PCM，再依段落完成順序送出音訊
+    
+    第一段合成完成後才回應，取得取樣率並讓首段錯誤仍以 HTTP 500 回報；
+    之後的段落在傳送前一段的同時預先合成（上限 pipeline.max_inflight_tts）。
+    """
+    async with tts_registry.use(provider) as (_, service):
+        segments = _split_tts_segments(request.text, service)
+    max_inflight = max(1, config.get("pipeline.max_inflight_tts", 2))
+    pending: List[asyncio.Task] = []
+    next_index = 0
+    
+    def schedule():
+        nonlocal next_index
+        while next_index < len(segments) and len(pending) < max_inflight:
+            pending.append(asyncio.create_task(_synthesize_with_provider(
+                segments[next_index],
+                speaker_voice_path=request.speaker_voice_path,
+                provider=provider,
+                cfg_scale=request.cfg_scale
+            )))
+            next_index += 1
+    
+    async def next_segment() -> bytes:
+        schedule()
+        task = pending.pop(0)
+        audio = await task
+        schedule()
+        if sample_rate:
+            audio = await transcode_async(audio, "wav", sample_rate)
+        return audio
+    
+    def cancel_pending():
+        for task in pending:
+            task.cancel()
+    
+    try:
+        first_pcm, output_rate, channels = wav_to_pcm16(await next_segment())
+    except Exception:
+        cancel_pending()
+        raise
+    time_to_first_audio.observe(time.time() - start_time, endpoint="/tts", provider=provider)
+    print(f"TTS 串流開始: {len(segments)} 段，首段耗時 {time.time() - start_time:.2f} 秒")
+    
+    async def audio_stream():
+        try:
+            if stream_format == "wav":
+                yield wav_stream_header(output_rate, channels)
+            yield first_pcm
+            for _ in range(1, len(segments)):
+                pcm, _, _ = wav_to_pcm16(await next_segment())
+                yield silence_pcm16(STREAM_SEGMENT_GAP, output_rate, channels)
+                yield pcm
+            print(f"TTS 串流完成，耗時: {time.time() - start_time:.2f} 秒")
+        except Exception as e:
+            # 檔頭已送出，只能中止串流
+            print(f"TTS 串流錯誤: {str(e)}")
+        finally:
+            cancel_pending()
+    
+    headers = {
+        "X-TTS-Provider": provider,
+        "X-Sample-Rate": str(output_rate),
+        "X-Channels": str(channels),
+        "X-Segments": str(len(segments))
+    }
+    if stream_format == "pcm":
+        media_type = f"audio/L16;rate={output_rate};channels={channels}"
+    else:
+        media_type = "audio/wav"
+    return StreamingResponse(audio_stream(), media_type=media_type, headers=headers)
+
 @app.post("/tts", summary="文字轉語音")
-async def text_to_speech(request: TTSRequest):
-    """文字轉語音 API - 統一介面支援 BreezyVoice 和 VibeVoice"""
-    if not tts_service:
-        raise HTTPException(status_code=503, detail="TTS 服務未啟用")
+@cancel_on_disconnect
+async def text_to_speech(request: TTSRequest, http_request: Request, stream: bool = False, stream_format: str = "wav"):
+    """文字轉語音 API - 統一介面支援 BreezyVoice 和 VibeVoice
+    
+    輸出格式依 format / sample_rate 欄位或 Accept 標頭決定（wav、opus、mp3、flac）。
+    stream=true 時以分段串流回傳，stream_format 可選 "wav"（長度未知的 WAV）或 "pcm"（16-bit 裸 PCM）。
+    """
+    provider = _resolve_tts_provider(request.provider, allow_auto=True)
+    if provider == TTS_AUTO_PROVIDER:
+        provider = tts_router.choose(request.text, request.speaker_voice_path, request.latency_target)
+    if stream and stream_format not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail=f"不支援的串流格式: {stream_format}")
+    if stream and request.format and request.format.lower() != "wav":
+        raise HTTPException(status_code=400, detail="串流模式僅支援 wav / pcm 輸出")
+    output_format, output_rate = _resolve_audio_output(request.format, request.sample_rate, http_request)
     
     try:
-        print(f"TTS 請求: {request.text} (使用 {tts_provider})")
+        print(f"TTS 請求: {request.text} (使用 {provider})")
         start_time = time.time()
         
-        # 根據不同的 TTS 提供者調用對應的方法
-        if tts_provider == "vibe":
-            # VibeVoice 支援 cfg_scale 參數
-            audio_data = await tts_service.synthesize(
-                text=request.text,
-                speaker_voice_path=request.speaker_voice_path,
-                cfg_scale=request.cfg_scale
-            )
-        elif tts_provider == "breezy":
-            # BreezyVoice 不使用 cfg_scale
-            audio_data = await tts_service.synthesize(
-                text=request.text,
-                speaker_voice_path=request.speaker_voice_path
-            )
-        elif tts_provider == "index":
-            # IndexTTS 支援語者克隆
-            audio_data = await tts_service.synthesize(
-                text=request.text,
-                speaker_voice_path=request.speaker_voice_path
-            )
-        elif tts_provider == "spark":
-            # Spark-TTS 支援語者克隆和語音控制
-            audio_data = await tts_service.synthesize(
-                text=request.text,
-                speaker_voice_path=request.speaker_voice_path,
-                use_voice_cloning=True  # 預設使用語者克隆模式
-            )
-        else:
-            raise HTTPException(status_code=500, detail=f"未支援的 TTS 提供者: {tts_provider}")
+        if stream:
+            return await _tts_stream_response(request, provider, stream_format, start_time, request.sample_rate)
+        
+        audio_data = await _synthesize_with_provider(
+            request.text,
+            speaker_voice_path=request.speaker_voice_path,
+            provider=provider,
+            cfg_scale=request.cfg_scale
+        )
+        
+        audio_data = await transcode_async(audio_data, output_format, output_rate)
         
         end_time = time.time()
+        time_to_first_audio.observe(end_time - start_time, endpoint="/tts", provider=provider)
         print(f"TTS 完成，耗時: {end_time - start_time:.2f} 秒")
         
         # 返回音檔
         return Response(
             content=audio_data,
-            media_type="audio/wav",
+            media_type=media_type_for(output_format),
             headers={
-                "Content-Disposition": "attachment; filename=tts_output.wav",
+                "Content-Disposition": f"attachment; filename=tts_output.{extension_for(output_format)}",
                 "X-Processing-Time": f"{end_time - start_time:.2f}",
-                "X-TTS-Provider": tts_provider
+                "X-TTS-Provider": provider
             }
         )
         
@@ -344,7 +645,9 @@ async def text_to_speech(request: TTSRequest):
         raise HTTPException(status_code=500, detail=f"TTS 處理錯誤: {str(e)}")
 
 @app.post("/tts_conversation")
+@cancel_on_disconnect
 async def text_to_speech_conversation(
+    http_request: Request,
     conversation_text: str = Form(...),
     cfg_scale: float = Form(1.0)
 ):
@@ -353,8 +656,9 @@ async def text_to_speech_conversation(
         if not conversation_text.strip():
             raise HTTPException(status_code=400, detail="對話內容不能為空")
         
-        # 使用 VibeVoice 進行對話 TTS 合成
-        output_path = await tts_service.synthesize_conversation(conversation_text, cfg_scale=cfg_scale)
+        # 使用 VibeVoice 進行對話 TTS 合成（多語者對話僅 VibeVoice 支援）
+        async with tts_registry.use("vibe") as (_, service):
+            output_path = await service.synthesize_conversation(conversation_text, cfg_scale=cfg_scale)
         
         # 回傳音檔
         return FileResponse(
@@ -367,7 +671,9 @@ async def text_to_speech_conversation(
         raise HTTPException(status_code=500, detail=f"對話 TTS 處理錯誤: {str(e)}")
 
 @app.post("/chat")
+@cancel_on_disconnect
 async def chat_with_bot(
+    http_request: Request,
     text: str = Form(...),
     conversation_id: str = Form(None)
 ):
@@ -390,8 +696,17 @@ async def chat_with_bot(
         raise HTTPException(status_code=500, detail=f"聊天處理錯誤: {str(e)}")
 
 @app.post("/voice_chat")
-async def voice_chat(audio: UploadFile = File(...)):
+@cancel_on_disconnect
+async def voice_chat(
+    http_request: Request,
+    audio: UploadFile = File(...),
+    output_format: str = Form(None, alias="format", description="輸出格式：wav、opus、mp3、flac"),
+    sample_rate: int = Form(None, description="輸出取樣率"),
+    provider: str = Form(None, description="TTS 引擎，auto 依延遲目標自動選擇（預設為 tts.provider）")
+):
     """語音對話 API - 前端使用"""
+    output_format, sample_rate = _resolve_audio_output(output_format, sample_rate, http_request)
+    provider = _resolve_tts_provider(provider, allow_auto=True)
     try:
         if not audio.content_type.startswith("audio/"):
             raise HTTPException(status_code=400, detail="請上傳音檔")
@@ -400,7 +715,8 @@ async def voice_chat(audio: UploadFile = File(...)):
         
         # Step 1: STT - 語音轉文字
         stt_start = time.time()
-        audio_data = await audio.read()
+        with span("upload.read"):
+            audio_data = await audio.read()
         user_text = await stt_service.transcribe(audio_data)
         stt_time = time.time() - stt_start
         
@@ -410,29 +726,32 @@ async def voice_chat(audio: UploadFile = File(...)):
         bot_message = chat_response["message"]
         llm_time = time.time() - llm_start
         
-        # Step 3: TTS - 文字轉語音
+        # Step 3: TTS - 文字轉語音（TTS 仍在載入時先回傳文字，音檔於載入完成後合成）
         tts_start = time.time()
-        audio_bytes = await tts_service.synthesize(bot_message)
+        audio_pending = _tts_loading()
+        if audio_pending:
+            audio_filename = _synthesize_later(bot_message, "voice_chat", output_format, sample_rate, provider=provider)
+        else:
+            audio_bytes = await _synthesize_with_provider(bot_message, provider=provider)
+            audio_bytes = await transcode_async(audio_bytes, output_format, sample_rate)
+            # 保存音檔到音檔儲存（記憶體優先），由 /audio 取得
+            audio_filename = audio_store.put(audio_bytes, prefix="voice_chat", extension=extension_for(output_format))
         tts_time = time.time() - tts_start
         
-        # 保存音檔到 outputs 目錄
-        audio_filename = f"voice_chat_{uuid.uuid4().hex[:8]}.wav"
-        audio_filepath = os.path.join("./outputs", audio_filename)
-        
-        with open(audio_filepath, 'wb') as f:
-            f.write(audio_bytes)
-        
         total_time = time.time() - start_time
+        if not audio_pending:
+            time_to_first_audio.observe(total_time, endpoint="/voice_chat", provider=provider)
         
         return {
             "success": True,
             "transcription": user_text,
             "response": bot_message,
             "audio_url": f"/audio/{audio_filename}",
+            "audio_pending": audio_pending,
             "processing_times": {
                 "stt_time": round(stt_time * 1000),  # 轉換為毫秒
                 "llm_time": round(llm_time * 1000),
-                "tts_time": round(tts_time * 1000),
+                "tts_time": None if audio_pending else round(tts_time * 1000),
                 "total_time": round(total_time * 1000)
             },
             "timestamp": datetime.now().isoformat()
@@ -451,14 +770,101 @@ class TextChatRequest(BaseModel):
     gender: Optional[str] = Field(None, description="性別設定（僅Spark-TTS語音控制模式）")
     pitch: Optional[str] = Field(None, description="音調設定（僅Spark-TTS語音控制模式）")  
     speed: Optional[str] = Field(None, description="語速設定（僅Spark-TTS語音控制模式）")
+    # 管線模式：LLM 每完成一句即送 TTS，以 NDJSON 串流逐句回傳音訊
+    pipeline: Optional[bool] = Field(False, description="是否使用句子級管線串流回覆")
+    conversation_id: Optional[str] = Field(None, description="對話 ID（管線模式使用）")
+    # 輸出音訊格式
+    format: Optional[str] = Field(None, description="輸出格式：wav、opus、mp3、flac（未指定時依 Accept 標頭）")
+    sample_rate: Optional[int] = Field(None, description="輸出取樣率（8000-48000）")
+    provider: Optional[str] = Field(None, description="TTS 引擎：breezy、vibe、index、spark、auto（預設為 tts.provider）")
+
+def _text_chat_pipeline_response(request: TextChatRequest, provider: Optional[str], output_format: str = "wav",
+                                 sample_rate: Optional[int] = None) -> StreamingResponse:
+    """text_chat 管線模式：以 NDJSON 依序串流 token、逐句音訊與最終統計"""
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    tts_options = {
+        "use_voice_cloning": request.use_voice_cloning,
+        "gender": request.gender,
+        "pitch": request.pitch,
+        "speed": request.speed
+    }
+    
+    async def synthesize_sentence(sentence: str) -> Optional[bytes]:
+        if not provider:
+            return None
+        audio = await _synthesize_with_provider(
+            sentence,
+            speaker_voice_path=request.speaker_voice_path,
+            speaker_id=request.speaker_id,
+            provider=provider,
+            **tts_options
+        )
+        return await transcode_async(audio, output_format, sample_rate)
+    
+    async def event_stream():
+        start_time = time.time()
+        llm_time = None
+        first_audio_time = None
+        response_text = ""
+        pipeline = SpeechPipeline(synthesize_sentence)
+        try:
+            async for event in pipeline.run(chat_service.stream_response(request.message, conversation_id)):
+                if event["type"] == "token":
+                    line = {"type": "token", "text": event["text"]}
+                elif event["type"] == "llm_done":
+                    llm_time = time.time() - start_time
+                    response_text = event["text"]
+                    line = {"type": "llm_done", "text": response_text}
+                elif event["audio"]:
+                    if first_audio_time is None:
+                        first_audio_time = time.time() - start_time
+                        time_to_first_audio.observe(first_audio_time, endpoint="/text_chat", provider=provider)
+                    line = {
+                        "type": "audio",
+                        "index": event["index"],
+                        "text": event["text"],
+                        "format": output_format,
+                        "audio": base64.b64encode(event["audio"]).decode("ascii")
+                    }
+                else:
+                    continue
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            
+            yield json.dumps({
+                "type": "done",
+                "success": True,
+                "response": response_text,
+                "conversation_id": conversation_id,
+                "processing_times": {
+                    "llm_time": round(llm_time * 1000) if llm_time is not None else None,
+                    "first_audio_time": round(first_audio_time * 1000) if first_audio_time is not None else None,
+                    "total_time": round((time.time() - start_time) * 1000)
+                },
+                "timestamp": datetime.now().isoformat()
+            }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"文字對話管線錯誤: {str(e)}")
+            yield json.dumps({"type": "error", "detail": f"文字對話處理錯誤: {str(e)}"}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
 
 @app.post("/text_chat")
-async def text_chat(request: TextChatRequest):
+@cancel_on_disconnect
+async def text_chat(request: TextChatRequest, http_request: Request):
     """文字對話 API - 前端使用"""
+    output_format, sample_rate = _resolve_audio_output(request.format, request.sample_rate, http_request)
+    if request.pipeline and not tts_registry.enabled:
+        # 管線模式在 TTS 停用時只串流文字
+        provider = None
+    else:
+        provider = _resolve_tts_provider(request.provider, allow_auto=True)
     try:
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="訊息內容不能為空")
         
+        if request.pipeline:
+            return _text_chat_pipeline_response(request, provider, output_format, sample_rate)
+        
         start_time = time.time()
         
         # Step 1: Chat - 取得回應
@@ -469,57 +875,38 @@ async def text_chat(request: TextChatRequest):
         
         # Step 2: TTS - 文字轉語音（支援語者克隆）
         tts_start = time.time()
-        
-        # 根據 TTS 提供者使用不同的參數
-        if tts_provider == "vibe":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=request.speaker_voice_path
-            )
-        elif tts_provider == "breezy":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=request.speaker_voice_path
-            )
-        elif tts_provider == "index":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=request.speaker_voice_path,
-                speaker_id=request.speaker_id
-            )
-        elif tts_provider == "spark":
-            # Spark-TTS 支援語者克隆和語音控制兩種模式
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=request.speaker_voice_path,
-                speaker_id=request.speaker_id,
-                use_voice_cloning=request.use_voice_cloning,
-                gender=request.gender,
-                pitch=request.pitch,
-                speed=request.speed
-            )
+        tts_kwargs = {
+            "speaker_voice_path": request.speaker_voice_path,
+            "speaker_id": request.speaker_id,
+            "provider": provider,
+            "use_voice_cloning": request.use_voice_cloning,
+            "gender": request.gender,
+            "pitch": request.pitch,
+            "speed": request.speed
+        }
+        audio_pending = _tts_loading()
+        if audio_pending:
+            # TTS 仍在載入：先回傳文字與音檔位址，前端輪詢 /audio 直到合成完成
+            audio_filename = _synthesize_later(bot_message, "text_chat", output_format, sample_rate, **tts_kwargs)
         else:
-            # 其他引擎使用基本方法
-            audio_bytes = await tts_service.synthesize(bot_message)
-            
+            audio_bytes = await _synthesize_with_provider(bot_message, **tts_kwargs)
+            audio_bytes = await transcode_async(audio_bytes, output_format, sample_rate)
+            # 保存音檔到音檔儲存（記憶體優先），由 /audio 取得
+            audio_filename = audio_store.put(audio_bytes, prefix="text_chat", extension=extension_for(output_format))
         tts_time = time.time() - tts_start
         
-        # 保存音檔到 outputs 目錄
-        audio_filename = f"text_chat_{uuid.uuid4().hex[:8]}.wav"
-        audio_filepath = os.path.join("./outputs", audio_filename)
-        
-        with open(audio_filepath, 'wb') as f:
-            f.write(audio_bytes)
-        
         total_time = time.time() - start_time
+        if not audio_pending:
+            time_to_first_audio.observe(total_time, endpoint="/text_chat", provider=provider)
         
         return {
             "success": True,
             "response": bot_message,
             "audio_url": f"/audio/{audio_filename}",
+            "audio_pending": audio_pending,
             "processing_times": {
                 "llm_time": round(llm_time * 1000),  # 轉換為毫秒
-                "tts_time": round(tts_time * 1000),
+                "tts_time": None if audio_pending else round(tts_time * 1000),
                 "total_time": round(total_time * 1000)
             },
             "timestamp": datetime.now().isoformat()
@@ -530,59 +917,52 @@ async def text_chat(request: TextChatRequest):
         raise HTTPException(status_code=500, detail=f"文字對話處理錯誤: {str(e)}")
 
 @app.post("/conversation")
+@cancel_on_disconnect
 async def full_conversation(
+    http_request: Request,
     audio_file: UploadFile = File(...),
     conversation_id: str = Form(None),
     speaker_voice_path: str = Form(None, description="指定語者音檔路徑進行語音克隆"),
-    speaker_id: str = Form(None, description="使用預設語者ID")
+    speaker_id: str = Form(None, description="使用預設語者ID"),
+    output_format: str = Form(None, alias="format", description="輸出格式：wav、opus、mp3、flac"),
+    sample_rate: int = Form(None, description="輸出取樣率"),
+    provider: str = Form(None, description="TTS 引擎，auto 依延遲目標自動選擇（預設為 tts.provider）")
 ):
     """完整對話流程：語音 -> 文字 -> 聊天 -> 語音（支援語者克隆）"""
+    output_format, sample_rate = _resolve_audio_output(output_format, sample_rate, http_request)
+    provider = _resolve_tts_provider(provider, allow_auto=True)
     try:
+        start_time = time.time()
+        
         # Step 1: STT
         if not audio_file.content_type.startswith("audio/"):
             raise HTTPException(status_code=400, detail="請上傳音檔")
         
-        audio_data = await audio_file.read()
+        with span("upload.read"):
+            audio_data = await audio_file.read()
         user_text = await stt_service.transcribe(audio_data)
         
         # Step 2: Chat
         chat_response = await chat_service.get_response(user_text, conversation_id)
         bot_message = chat_response["message"]
         
-        # Step 3: TTS（支援語者克隆）
-        if tts_provider == "vibe":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=speaker_voice_path
-            )
-        elif tts_provider == "breezy":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=speaker_voice_path
-            )
-        elif tts_provider == "index":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=speaker_voice_path,
-                speaker_id=speaker_id
-            )
-        elif tts_provider == "spark":
-            audio_bytes = await tts_service.synthesize(
-                text=bot_message,
-                speaker_voice_path=speaker_voice_path,
-                speaker_id=speaker_id,
-                use_voice_cloning=True  # 預設使用語者克隆模式
-            )
+        # Step 3: TTS（支援語者克隆；TTS 仍在載入時音檔於載入完成後合成）
+        tts_kwargs = {"speaker_voice_path": speaker_voice_path, "speaker_id": speaker_id, "provider": provider}
+        audio_pending = _tts_loading()
+        if audio_pending:
+            audio_filename = _synthesize_later(bot_message, "conversation", output_format, sample_rate,
+                                               request_id=chat_response["conversation_id"], **tts_kwargs)
         else:
-            # 其他引擎使用基本方法
-            audio_bytes = await tts_service.synthesize(bot_message)
-        
-        # 保存音檔到 outputs 目錄
-        audio_filename = f"conversation_{uuid.uuid4().hex[:8]}.wav"
-        audio_filepath = os.path.join("./outputs", audio_filename)
-        
-        with open(audio_filepath, 'wb') as f:
-            f.write(audio_bytes)
+            audio_bytes = await _synthesize_with_provider(bot_message, **tts_kwargs)
+            audio_bytes = await transcode_async(audio_bytes, output_format, sample_rate)
+            # 保存音檔到音檔儲存（記憶體優先），由 /audio 取得
+            audio_filename = audio_store.put(
+                audio_bytes,
+                prefix="conversation",
+                extension=extension_for(output_format),
+                request_id=chat_response["conversation_id"]
+            )
+            time_to_first_audio.observe(time.time() - start_time, endpoint="/conversation", provider=provider)
         
         return {
             "success": True,
@@ -590,7 +970,8 @@ async def full_conversation(
             "bot_message": bot_message,
             "conversation_id": chat_response["conversation_id"],
             "audio_url": f"/audio/{audio_filename}",
-            "tts_provider": tts_provider,
+            "audio_pending": audio_pending,
+            "tts_provider": provider,
             "used_speaker": speaker_voice_path or speaker_id or "default",
             "timestamp": datetime.now().isoformat()
         }
@@ -598,6 +979,255 @@ async def full_conversation(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"完整對話處理錯誤: {str(e)}")
 
+async def _synthesize_with_provider(text: str, speaker_voice_path: Optional[str] = None,
+                                    speaker_id: Optional[str] = None, provider: Optional[str] = None,
+                                    **options) -> bytes:
+    """以指定 TTS 引擎合成語音（引擎未載入時由註冊表載入），並記錄合成延遲
+
+    provider 為 "auto" 時由 TTS 路由依文字長度選擇預估能在延遲目標內完成的引擎。
+    """
+    if provider == TTS_AUTO_PROVIDER:
+        provider = tts_router.choose(text, speaker_voice_path or speaker_id)
+    start_time = time.time()
+    async with tts_registry.use(provider) as (name, service):
+        with span("tts.synthesize", provider=name, text_chars=len(text)):
+            audio = await call_synthesize(name, service, text, speaker_voice_path, speaker_id, options)
+    tts_latency.observe(time.time() - start_time, provider=name, speaker=speaker_key(speaker_voice_path or speaker_id))
+    return audio
+
+def _synthesize_later(text: str, prefix: str, output_format: str, sample_rate: Optional[int],
+                      request_id: Optional[str] = None, **synth_kwargs) -> str:
+    """保留音檔檔名並於背景等待 TTS 載入完成後合成，回傳檔名（完成前 /audio 回 202）"""
+    filename = audio_store.reserve(prefix=prefix, extension=extension_for(output_format))
+    
+    async def synthesize():
+        try:
+            await startup_report.wait_ready("tts")
+            # 原請求的截止時間從請求抵達起算，等待載入後重新計算
+            with inference_priority(PRIORITY_INTERACTIVE):
+                audio_bytes = await _synthesize_with_provider(text, **synth_kwargs)
+                audio_bytes = await transcode_async(audio_bytes, output_format, sample_rate)
+            audio_store.put(audio_bytes, request_id=request_id, filename=filename)
+        except Exception as e:
+            print(f"延後合成失敗 {filename}: {e}")
+            audio_store.fail(filename, str(e))
+    
+    _spawn(synthesize())
+    return filename
+
+@app.websocket("/ws/voice_chat")
+async def voice_chat_websocket(websocket: WebSocket):
+    """全雙工語音對話 WebSocket
+
+    協定（client -> server）：
+      - {"type": "start", "sample_rate": 16000, "conversation_id": ..., "speaker_voice_path": ..., "speaker_id": ...}
+      - 二進位訊框：16-bit mono PCM
+      - {"type": "end"}：結束本輪語音，開始辨識與回覆
+      - {"type": "text", "text": ...}：略過 STT 直接以文字對話
+    回應（server -> client）：
+      partial_transcript / transcript / llm_token / llm_done / audio_chunk（其後緊接一個 WAV 二進位訊框）/ turn_done / error
+      過載時該輪回傳 {"type": "error", "code": "overloaded", "retry_after": 秒數}，連線保留
+    """
+    await websocket.accept()
+    
+    streaming_config = config.get("stt.streaming", {})
+    sample_rate = streaming_config.get("sample_rate", 16000)
+    partial_interval = streaming_config.get("partial_interval", 1.0)
+    partial_window = streaming_config.get("partial_window", 10.0)
+    
+    session = {
+        "conversation_id": str(uuid.uuid4()),
+        "speaker_voice_path": None,
+        "speaker_id": None,
+        "options": {}
+    }
+    pcm_buffer = bytearray()
+    last_partial_size = 0
+    
+    async def run_turn(user_text: str, turn_start: float, stt_time: float = 0.0):
+        """LLM 串流輸出，每個句子完成即透過 SpeechPipeline 並行送 TTS"""
+        await websocket.send_json({
+            "type": "transcript",
+            "text": user_text,
+            "conversation_id": session["conversation_id"]
+        })
+        if not user_text.strip():
+            await websocket.send_json({"type": "turn_done", "response": ""})
+            return
+        
+        llm_start = time.time()
+        llm_time = 0.0
+        chunk_index = 0
+        first_audio_time = None
+        tts_time = 0.0
+        
+        async def synthesize_sentence(sentence: str) -> Optional[bytes]:
+            nonlocal tts_time
+            if not tts_registry.enabled:
+                return None
+            tts_start = time.time()
+            audio_bytes = await _synthesize_with_provider(
+                sentence,
+                speaker_voice_path=session["speaker_voice_path"],
+                speaker_id=session["speaker_id"],
+                **session["options"]
+            )
+            tts_time += time.time() - tts_start
+            return audio_bytes
+        
+        full_response = ""
+        pipeline = SpeechPipeline(synthesize_sentence)
+        async for event in pipeline.run(chat_service.stream_response(user_text, session["conversation_id"])):
+            if event["type"] == "token":
+                await websocket.send_json({"type": "llm_token", "text": event["text"]})
+            elif event["type"] == "llm_done":
+                llm_time = time.time() - llm_start
+                full_response = event["text"]
+                await websocket.send_json({"type": "llm_done", "text": full_response})
+            elif event["type"] == "audio" and event["audio"]:
+                await websocket.send_json({
+                    "type": "audio_chunk",
+                    "index": event["index"],
+                    "text": event["text"],
+                    "format": "wav",
+                    "size": len(event["audio"])
+                })
+                await websocket.send_bytes(event["audio"])
+                if first_audio_time is None:
+                    first_audio_time = time.time() - turn_start
+                    time_to_first_audio.observe(first_audio_time, endpoint="/ws/voice_chat",
+                                                provider=session["options"].get("provider") or tts_provider)
+                chunk_index += 1
+        
+        await websocket.send_json({
+            "type": "turn_done",
+            "response": full_response,
+            "conversation_id": session["conversation_id"],
+            "audio_chunks": chunk_index,
+            "trace_id": current_trace_id(),
+            "processing_times": {
+                "stt_time": round(stt_time * 1000),
+                "llm_time": round(llm_time * 1000),
+                "tts_time": round(tts_time * 1000),
+                "first_audio_time": round(first_audio_time * 1000) if first_audio_time is not None else None,
+                "total_time": round((time.time() - turn_start) * 1000)
+            }
+        })
+    
+    def pcm_to_float(data: bytes) -> np.ndarray:
+        return np.frombuffer(bytes(data), dtype=np.int16).astype(np.float32) / 32768.0
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                # 累積 PCM 訊框，每累積 partial_interval 秒的新音訊就回傳一次部分辨識結果
+                pcm_buffer.extend(message["bytes"])
+                if stt_service and len(pcm_buffer) - last_partial_size >= int(sample_rate * partial_interval) * 2:
+                    last_partial_size = len(pcm_buffer)
+                    # 部分結果只是預覽：STT 未就緒或過載時直接略過，完整辨識仍於 "end" 時進行
+                    if (_unavailable_capability(["stt"])
+                            or (admission_controller.enabled and admission_controller.evaluate(["stt"], PRIORITY_INTERACTIVE))):
+                        continue
+                    # 只解碼最後 partial_window 秒，避免每次重新解碼整段持續增長的緩衝
+                    window = pcm_buffer[-int(sample_rate * partial_window) * 2:]
+                    with inference_priority(PRIORITY_INTERACTIVE):
+                        partial_text = await stt_service.transcribe(pcm_to_float(window), sample_rate=sample_rate)
+                    await websocket.send_json({"type": "partial_transcript", "text": partial_text})
+                continue
+            
+            if message.get("text") is None:
+                continue
+            
+            try:
+                payload = json.loads(message["text"])
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "無法解析的訊息格式"})
+                continue
+            
+            message_type = payload.get("type")
+            try:
+                # 每一輪對話各自計算截止時間
+                with inference_priority(PRIORITY_INTERACTIVE):
+                    if message_type == "start":
+                        sample_rate = payload.get("sample_rate", sample_rate)
+                        session["conversation_id"] = payload.get("conversation_id") or session["conversation_id"]
+                        session["speaker_voice_path"] = payload.get("speaker_voice_path")
+                        session["speaker_id"] = payload.get("speaker_id")
+                        session["options"] = {
+                            key: payload[key]
+                            for key in ("provider", "cfg_scale", "use_voice_cloning", "gender", "pitch", "speed")
+                            if key in payload
+                        }
+                        pcm_buffer.clear()
+                        last_partial_size = 0
+                        await websocket.send_json({
+                            "type": "ready",
+                            "conversation_id": session["conversation_id"],
+                            "tts_provider": (session["options"].get("provider") or tts_provider) if tts_registry.enabled else None
+                        })
+                    
+                    elif message_type in ("end", "text") and not chat_service:
+                        await websocket.send_json({"type": "error", "detail": "聊天服務未啟用"})
+                    
+                    elif message_type == "end":
+                        if not stt_service:
+                            await websocket.send_json({"type": "error", "detail": "STT 服務未啟用"})
+                            continue
+                        capability = _unavailable_capability(ROUTE_CAPABILITIES["/voice_chat"])
+                        if capability:
+                            pcm_buffer.clear()
+                            last_partial_size = 0
+                            await websocket.send_json({"type": "error", **_capability_error(capability)})
+                            continue
+                        admission_controller.admit("/ws/voice_chat", _admission_engines(ROUTE_ENGINES["/voice_chat"]),
+                                                   PRIORITY_INTERACTIVE)
+                        # WebSocket 不經過 HTTP middleware，每一輪對話各自建立 trace
+                        with start_trace("ws.voice_chat.turn", conversation_id=session["conversation_id"]):
+                            turn_start = time.time()
+                            user_text = ""
+                            if pcm_buffer:
+                                user_text = await stt_service.transcribe(pcm_to_float(pcm_buffer), sample_rate=sample_rate)
+                            stt_time = time.time() - turn_start
+                            pcm_buffer.clear()
+                            last_partial_size = 0
+                            await run_turn(user_text, turn_start, stt_time)
+                    
+                    elif message_type == "text":
+                        pcm_buffer.clear()
+                        last_partial_size = 0
+                        capability = _unavailable_capability(ROUTE_CAPABILITIES["/text_chat"])
+                        if capability:
+                            await websocket.send_json({"type": "error", **_capability_error(capability)})
+                            continue
+                        admission_controller.admit("/ws/voice_chat", _admission_engines(ROUTE_ENGINES["/text_chat"]),
+                                                   PRIORITY_INTERACTIVE)
+                        with start_trace("ws.voice_chat.turn", conversation_id=session["conversation_id"]):
+                            await run_turn(payload.get("text", ""), time.time())
+                    
+                    else:
+                        await websocket.send_json({"type": "error", "detail": f"未知的訊息類型: {message_type}"})
+                
+            except WebSocketDisconnect:
+                raise
+            except Overloaded as e:
+                # 本輪被拒絕，連線保留，客戶端可在 retry_after 秒後重送
+                pcm_buffer.clear()
+                last_partial_size = 0
+                await websocket.send_json({"type": "error", "code": "overloaded", "detail": str(e),
+                                           "retry_after": e.retry_after})
+            except Exception as e:
+                print(f"WebSocket 語音對話錯誤: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": f"語音對話處理錯誤: {str(e)}"})
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        print(f"WebSocket 語音對話結束 (conversation_id: {session['conversation_id']})")
+
 @app.post("/reset_conversation")
 async def reset_conversation():
     """重置對話歷史"""
@@ -610,6 +1240,7 @@ async def reset_conversation():
             # 清空所有活躍對話
             for conversation_id in conversation_ids:
                 chat_service.clear_conversation(conversation_id)
+                retention_manager.evict_request(conversation_id)  # 一併刪除該對話的輸出音檔
             cleared_count = len(conversation_ids)
         else:
             cleared_count = 0
@@ -625,17 +1256,54 @@ async def reset_conversation():
         raise HTTPException(status_code=500, detail=f"重置對話錯誤: {str(e)}")
 
 @app.get("/audio/{filename}")
-async def get_audio_file(filename: str):
-    """取得生成的音檔"""
-    # 更新路徑以配合實際的輸出目錄
-    file_path = os.path.join("./outputs", filename)
-    if not os.path.exists(file_path):
+async def get_audio_file(filename: str, request: Request):
+    """取得生成的音檔（先查記憶體，再查輸出目錄）
+    
+    支援內容雜湊 ETag（If-None-Match -> 304）、immutable 快取與單一 byte range（206）。
+    """
+    media_type = media_type_for_filename(filename)
+    audio_data = audio_store.get(filename)
+    if audio_data is not None:
+        async def read_memory_range(start: int, end: int) -> bytes:
+            return audio_data[start:end + 1]
+        
+        return await audio_response(
+            request, filename, media_type,
+            etag=audio_store.get_etag(filename, audio_data),
+            size=len(audio_data),
+            read_range=read_memory_range,
+            full_response=lambda headers: Response(content=audio_data, media_type=media_type, headers=headers)
+        )
+    
+    pending = audio_store.get_pending(filename)
+    if pending is not None:
+        if pending["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"音檔合成失敗: {pending['error']}")
+        # 合成中（TTS 仍在載入），前端依 Retry-After 再次請求
+        return JSONResponse(
+            status_code=202,
+            content={"status": "pending", "retry_after": PENDING_AUDIO_RETRY_AFTER},
+            headers={"Retry-After": str(PENDING_AUDIO_RETRY_AFTER)}
+        )
+    
+    file_path = audio_store.get_path(filename)
+    if not file_path:
         raise HTTPException(status_code=404, detail="音檔不存在")
     
-    return FileResponse(
-        file_path,
-        media_type="audio/wav",
-        filename=filename
+    def read_file_range(start: int, end: int) -> bytes:
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+    
+    async def read_disk_range(start: int, end: int) -> bytes:
+        return await asyncio.to_thread(read_file_range, start, end)
+    
+    return await audio_response(
+        request, filename, media_type,
+        etag=await asyncio.to_thread(file_etag, file_path),
+        size=os.path.getsize(file_path),
+        read_range=read_disk_range,
+        full_response=lambda headers: FileResponse(file_path, media_type=media_type, headers=headers)
     )
 
 if __name__ == "__main__":
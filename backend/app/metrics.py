@@ -0,0 +1,227 @@
+"""
+Prometheus 指標
+以 Prometheus 文字格式（0.0.4）提供 /metrics，不依賴 prometheus_client：
+- Histogram / Counter 於請求路徑上只做一次 bisect 與加法（每個指標一把鎖），可在正式環境常駐
+- Gauge 以回呼函式在抓取時才計算（佇列深度、活躍對話數、輸出目錄大小）
+- 每個指標的標籤組合數有上限，超過時歸入 "other"，避免上傳語者等高基數標籤撐爆記憶體
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import config
+
+# 延遲（秒）與 RTF 的預設分桶
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 7.5, 10.0, 20.0, 30.0, 60.0)
+RTF_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+OVERFLOW_LABEL = "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """具名指標，依標籤值組合保存子序列"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: int = 500):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self.enabled = True
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        key = tuple(str(labels.get(name) or "") for name in self.labelnames)
+        if key not in self._series and len(self._series) >= self.max_series:
+            return tuple(OVERFLOW_LABEL for _ in self.labelnames)
+        return key
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _header(self) -> List[str]:
+        # 0.0.4 文字格式中計數器的樣本名稱帶 _total，中繼資料需使用相同名稱
+        return [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        lines = self._header()
+        for key, value in series:
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS, max_series: int = 500):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [各分桶計數（最後一格為 +Inf）, 總和]
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = self._header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """抓取時呼叫回呼函式取值；回呼回傳數值，或 {標籤值 tuple: 數值}"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set_function(self, callback: Callable[[], object]):
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        if self.callback is None:
+            return lines
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"指標 {self.name} 取值失敗: {e}")
+            return lines
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for key, item in items:
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(float(item))}")
+        return lines
+
+
+class MetricsRegistry:
+    """指標註冊表，render() 產生 /metrics 的回應內容"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入指標參數"""
+        metrics_config = config.get("metrics", {}) or {}
+        self.enabled = metrics_config.get("enabled", True)
+        self.prefix = metrics_config.get("prefix", "dialogue_")
+        self.max_series = metrics_config.get("max_series_per_metric", 500)
+
+    def _register(self, metric: _Metric) -> _Metric:
+        metric.enabled = self.enabled
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames, self.max_series))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets, self.max_series))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], object]] = None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全域指標註冊表
+metrics = MetricsRegistry()
+
+# 各階段延遲
+stt_latency = metrics.histogram("stt_latency_seconds", "STT transcription latency")
+llm_latency = metrics.histogram("llm_latency_seconds", "LLM response latency", ["mode"])
+tts_latency = metrics.histogram("tts_latency_seconds", "TTS synthesis latency", ["provider", "speaker"])
+tts_rtf = metrics.histogram("tts_rtf", "TTS real-time factor (synthesis time / audio duration)",
+                            ["provider", "speaker"], buckets=RTF_BUCKETS)
+time_to_first_audio = metrics.histogram("time_to_first_audio_seconds", "Time from request to first audio",
+                                        ["endpoint", "provider"])
+
+# 快取命中
+cache_requests = metrics.counter("cache_requests", "Cache lookups", ["cache", "provider", "result"])
+
+# 入場控制：shed / (accepted + shed) 即為拒絕率
+admission_requests = metrics.counter("admission_requests", "Admission decisions at request entry",
+                                     ["endpoint", "result", "reason"])
+
+# 客戶端斷線而取消的請求
+cancelled_requests = metrics.counter("cancelled_requests", "Requests cancelled because the client disconnected",
+                                     ["endpoint"])
+
+# 模型預熱：每種輸入長度的首次與穩態延遲
+warmup_latency = metrics.histogram("warmup_latency_seconds", "Latency of warmup runs (first run vs steady state)",
+                                   ["engine", "length", "phase"])
+
+# 抓取時計算的狀態（回呼於 main 啟動時設定）
+queue_depth = metrics.gauge("inference_queue_depth", "Jobs waiting in the inference scheduler", ["engine"])
+active_conversations = metrics.gauge("active_conversations", "Conversations held in memory")
+outputs_dir_bytes = metrics.gauge("outputs_dir_bytes", "Total size of the outputs directory")
+outputs_dir_files = metrics.gauge("outputs_dir_files", "Number of files in the outputs directory")
+warmup_duration = metrics.gauge("warmup_duration_seconds", "Total warmup time per engine", ["engine"])
+module_import_seconds = metrics.gauge("module_import_seconds", "Time spent importing app and TTS engine modules",
+                                      ["module"])
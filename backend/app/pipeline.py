@@ -0,0 +1,148 @@
+"""
+LLM -> TTS 句子級管線
+LLM 每輸出完整一句就立即送 TTS 合成，LLM 繼續解碼的同時 TTS 並行工作，
+音訊依句子順序輸出。
+"""
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.config import config
+
+# 中英文句子邊界（句號、問號、驚嘆號、分號、換行；英文句點需後接空白）
+SENTENCE_BOUNDARY = re.compile(r'[。！？；!?;\n]+|\.(?=\s)')
+# 句子過長時退而求其次的切分點（逗號、頓號、冒號）
+CLAUSE_BOUNDARY = re.compile(r'[，、：,:]')
+
+
+class SentenceSplitter:
+    """增量句子切分器：餵入 LLM 的增量文字，吐出已完成的句子"""
+
+    def __init__(self, min_chars: int = 4, max_chars: int = 80):
+        self.min_chars = min_chars  # 過短的句子與下一句合併，避免 TTS 逐字呼叫
+        self.max_chars = max_chars  # 遲遲沒有句號時，在逗號處強制切分
+        self.buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """加入新文字，回傳本次可送出的完整句子"""
+        self.buffer += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            if len(self.buffer[start:match.end()].strip()) < self.min_chars:
+                continue
+            sentences.append(self.buffer[start:match.end()].strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+
+        if len(self.buffer) > self.max_chars:
+            clauses = list(CLAUSE_BOUNDARY.finditer(self.buffer))
+            if clauses:
+                cut = clauses[-1].end()
+                sentences.append(self.buffer[:cut].strip())
+                self.buffer = self.buffer[cut:]
+        return [s for s in sentences if s]
+
+    def flush(self) -> List[str]:
+        """LLM 結束後取出剩餘文字"""
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return [remainder] if remainder else []
+
+
+def split_sentences(text: str) -> List[str]:
+    """將完整文字一次切成句子（與串流切分規則一致）"""
+    splitter = SentenceSplitter(min_chars=1, max_chars=len(text) + 1)
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechPipeline:
+    """將 LLM 增量輸出與逐句 TTS 合成串接成單一事件流
+
+    產生的事件：
+      {"type": "token", "text": str}
+      {"type": "llm_done", "text": str}
+      {"type": "audio", "index": int, "text": str, "audio": bytes}
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[bytes]],
+                 min_chars: Optional[int] = None, max_chars: Optional[int] = None,
+                 max_inflight: Optional[int] = None):
+        pipeline_config = config.get("pipeline", {})
+        self.synthesize = synthesize
+        self.min_chars = min_chars if min_chars is not None else pipeline_config.get("min_sentence_chars", 4)
+        self.max_chars = max_chars if max_chars is not None else pipeline_config.get("max_sentence_chars", 80)
+        # 同時送進 TTS 的句子上限，避免 LLM 太快時一次塞滿 TTS
+        self.max_inflight = max_inflight if max_inflight is not None else pipeline_config.get("max_inflight_tts", 2)
+
+    async def run(self, deltas: AsyncIterator[str]) -> AsyncIterator[Dict]:
+        events: asyncio.Queue = asyncio.Queue()
+        sentence_tasks: asyncio.Queue = asyncio.Queue()
+        inflight = asyncio.Semaphore(self.max_inflight)
+        splitter = SentenceSplitter(self.min_chars, self.max_chars)
+        finished = object()
+
+        async def synthesize_sentence(sentence: str) -> bytes:
+            try:
+                return await self.synthesize(sentence)
+            finally:
+                inflight.release()
+
+        async def submit(sentence: str):
+            await inflight.acquire()
+            await sentence_tasks.put((sentence, asyncio.create_task(synthesize_sentence(sentence))))
+
+        async def produce():
+            full_text = ""
+            try:
+                async for delta in deltas:
+                    full_text += delta
+                    await events.put({"type": "token", "text": delta})
+                    for sentence in splitter.feed(delta):
+                        await submit(sentence)
+                for sentence in splitter.flush():
+                    await submit(sentence)
+                await events.put({"type": "llm_done", "text": full_text.strip()})
+            finally:
+                await sentence_tasks.put(None)
+
+        async def consume():
+            index = 0
+            while True:
+                item = await sentence_tasks.get()
+                if item is None:
+                    break
+                sentence, task = item
+                audio = await task
+                await events.put({"type": "audio", "index": index, "text": sentence, "audio": audio})
+                index += 1
+
+        async def guarded(coro):
+            try:
+                await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await events.put(e)
+            finally:
+                await events.put(finished)
+
+        workers = [asyncio.create_task(guarded(produce())), asyncio.create_task(guarded(consume()))]
+        remaining = len(workers)
+        try:
+            while remaining:
+                event = await events.get()
+                if event is finished:
+                    remaining -= 1
+                    continue
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            for worker in workers:
+                worker.cancel()
+            # 清掉尚未取用的合成工作
+            while not sentence_tasks.empty():
+                item = sentence_tasks.get_nowait()
+                if item is not None:
+                    item[1].cancel()
@@ -0,0 +1,172 @@
+"""
+輸出目錄保留策略
+記錄 outputs 目錄內每個檔案的大小、建立時間與所屬請求（依建立順序），
+超過總容量、檔案數或保存時間時從最舊的檔案開始刪除，不需重新掃描目錄。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from app.config import config
+
+
+class RetentionManager:
+    """以建立順序索引輸出檔案，依容量 / 數量 / 時間淘汰"""
+
+    def __init__(self):
+        # 檔名 -> (大小, 建立時間, 所屬請求)，依建立順序排列，最舊的在前
+        self._files: "OrderedDict[str, Tuple[int, float, Optional[str]]]" = OrderedDict()
+        self._by_request: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.total_bytes = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入保留參數"""
+        retention_config = config.get("settings.outputs_retention", {}) or {}
+        self.enabled = retention_config.get("enabled", True)
+        self.output_dir = config.get("paths.outputs", "./outputs")
+        self.max_total_bytes = int(retention_config.get("max_total_mb", 2048) * 1024 * 1024)
+        self.max_age = retention_config.get("max_age_hours", 24) * 3600
+        self.max_files = retention_config.get("max_files", 5000)
+        self.check_interval = retention_config.get("check_interval", 300)
+
+    def load_existing(self):
+        """啟動時掃描一次既有檔案建立索引（之後只靠 register 維護）"""
+        if not os.path.isdir(self.output_dir):
+            return
+        entries = []
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        with self._lock:
+            for mtime, name, size in entries:
+                self._add_locked(name, size, mtime, None)
+        print(f"輸出目錄索引完成: {len(entries)} 個檔案, {self.total_bytes / 1024 / 1024:.1f} MB")
+        self.enforce_limits()
+
+    def register(self, path: str, request_id: Optional[str] = None, size: Optional[int] = None):
+        """登記新寫入的輸出檔案，並立即套用容量與數量上限"""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.output_dir):
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        with self._lock:
+            self._add_locked(os.path.basename(path), size, time.time(), request_id)
+        self.enforce_limits()
+
+    def _add_locked(self, name: str, size: int, created_at: float, request_id: Optional[str]):
+        if name in self._files:
+            self._remove_locked(name)
+        self._files[name] = (size, created_at, request_id)
+        self.total_bytes += size
+        if request_id:
+            self._by_request.setdefault(request_id, set()).add(name)
+
+    def _remove_locked(self, name: str) -> int:
+        size, _, request_id = self._files.pop(name)
+        self.total_bytes -= size
+        if request_id and request_id in self._by_request:
+            self._by_request[request_id].discard(name)
+            if not self._by_request[request_id]:
+                del self._by_request[request_id]
+        return size
+
+    def _delete(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"刪除輸出檔案失敗 {name}: {e}")
+
+    def enforce_limits(self):
+        """超過總容量或檔案數時，由最舊的檔案開始刪除"""
+        if not self.enabled:
+            return
+        victims = []
+        with self._lock:
+            while self._files and (self.total_bytes > self.max_total_bytes or len(self._files) > self.max_files):
+                name = next(iter(self._files))
+                self.deleted_bytes += self._remove_locked(name)
+                victims.append(name)
+            self.deleted_files += len(victims)
+        self._delete(victims)
+
+    def expire_old(self):
+        """刪除超過保存時間的檔案（索引依建立順序，遇到未過期者即停止）"""
+        if not self.enabled:
+            return
+        cutoff = time.time() - self.max_age
+        victims = []
+        with self._lock:
+            while self._files:
+                name, (_, created_at, _) = next(iter(self._files.items()))
+                if created_at > cutoff:
+                    break
+                self.deleted_bytes += self._remove_locked(name)
+                victims.append(name)
+            self.deleted_files += len(victims)
+        if victims:
+            print(f"清除過期輸出檔案: {len(victims)} 個")
+        self._delete(victims)
+
+    def evict_request(self, request_id: str) -> int:
+        """刪除某個請求（對話）產生的所有檔案"""
+        with self._lock:
+            names = list(self._by_request.get(request_id, ()))
+            for name in names:
+                self.deleted_bytes += self._remove_locked(name)
+            self.deleted_files += len(names)
+        self._delete(names)
+        return len(names)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.expire_old)
+            except Exception as e:
+                print(f"輸出目錄清理錯誤: {e}")
+
+    async def start(self):
+        """建立索引並啟動背景清理工作"""
+        if not self.enabled:
+            print("輸出目錄保留策略已停用")
+            return
+        await asyncio.to_thread(self.load_existing)
+        await asyncio.to_thread(self.expire_old)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "total_bytes": self.total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "max_files": self.max_files,
+            "max_age_hours": self.max_age / 3600,
+            "deleted_files": self.deleted_files,
+            "deleted_bytes": self.deleted_bytes,
+        }
+
+
+# 全域保留策略實例
+retention_manager = RetentionManager()
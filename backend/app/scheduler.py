@@ -0,0 +1,301 @@
+"""
+推論排程器
+統一管理 STT / LLM / TTS 的所有模型呼叫：
+- 每個引擎一條優先權佇列（互動式語音對話優先於批次 /tts）
+- 依設備字串（cuda:0、cpu ...）限制同時執行的模型呼叫數
+- 支援排隊逾時，每個工作自送入佇列起算，逾時仍在排隊的工作直接失敗
+- 提供佇列深度與等待時間統計，並依各引擎的平均執行時間預估新工作的排隊時間（供入場控制使用）
+"""
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import config
+from app.executor import inference_executor
+
+# 優先權：數字越小越優先
+PRIORITY_INTERACTIVE = 0  # 即時語音 / 文字對話
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10  # 批次 /tts 等非互動請求
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BULK: "bulk",
+}
+
+# 請求層級的排程參數，由 API 端點設定，沿著 await 鏈傳到各服務的模型呼叫
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("inference_priority", default=PRIORITY_NORMAL)
+_current_timeout: contextvars.ContextVar = contextvars.ContextVar("inference_timeout", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """工作排隊超過逾時仍未開始執行"""
+
+
+@contextmanager
+def inference_priority(priority: int, timeout: Optional[float] = None):
+    """設定目前請求的排程優先權與排隊逾時（秒）
+
+    逾時是每個工作的排隊時間上限，自該工作送入佇列起算：同一請求中較晚送出的工作
+    （例如長對話後段的 TTS 句子）不會因請求本身已執行很久而失敗。
+    """
+    if timeout is None:
+        timeout = scheduler.get_default_timeout(priority)
+    priority_token = _current_priority.set(priority)
+    timeout_token = _current_timeout.set(timeout or None)
+    try:
+        yield
+    finally:
+        _current_priority.reset(priority_token)
+        _current_timeout.reset(timeout_token)
+
+
+class _Job:
+    __slots__ = ("engine", "device", "priority", "deadline", "seq", "enqueued_at", "granted")
+
+    def __init__(self, engine: str, device: str, priority: int, timeout: Optional[float], seq: int):
+        self.engine = engine
+        self.device = device
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + timeout if timeout else None
+        self.granted = asyncio.get_running_loop().create_future()
+
+    def sort_key(self):
+        return (self.priority, self.deadline if self.deadline is not None else float("inf"), self.seq)
+
+    def __lt__(self, other: "_Job") -> bool:
+        return self.sort_key() < other.sort_key()
+
+
+class InferenceScheduler:
+    """以設備為單位分配執行名額的優先權排程器"""
+
+    def __init__(self):
+        self._queues: Dict[str, List[_Job]] = {}  # engine -> heap
+        self._engine_devices: Dict[str, str] = {}
+        self._device_active: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入排程參數"""
+        scheduler_config = config.get("scheduler", {})
+        self.device_limits = scheduler_config.get("device_concurrency", {})
+        self.default_timeouts = scheduler_config.get("default_timeouts", {})
+        self.service_time_alpha = scheduler_config.get("service_time_alpha", 0.2)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """指定排程器所屬的事件迴圈（啟動時呼叫），其他執行緒的事件迴圈送來的工作會轉交到這裡排隊"""
+        self._loop = loop
+
+    def register_engine(self, engine: str, device: str):
+        """登記引擎所在設備（服務載入配置時呼叫）"""
+        self._engine_devices[engine] = device or "cpu"
+        self._queues.setdefault(engine, [])
+        self._get_stats(engine)
+
+    def get_device(self, engine: str) -> str:
+        return self._engine_devices.get(engine, "cpu")
+
+    def get_device_limit(self, device: str) -> int:
+        if device in self.device_limits:
+            return int(self.device_limits[device])
+        return int(self.device_limits.get("default", 1))
+
+    def get_default_timeout(self, priority: int) -> Optional[float]:
+        return self.default_timeouts.get(PRIORITY_NAMES.get(priority, "normal"))
+
+    def _get_stats(self, engine: str) -> Dict[str, Any]:
+        stats = self._stats.get(engine)
+        if stats is None:
+            stats = {
+                "submitted": 0,
+                "completed": 0,
+                "failed": 0,
+                "expired": 0,
+                "cancelled": 0,
+                "granted": 0,
+                "running": 0,
+                "wait_time_total": 0.0,
+                "wait_time_max": 0.0,
+                "recent_waits": deque(maxlen=200),
+                "service_time": None,  # 單次執行時間的指數移動平均（秒）
+            }
+            self._stats[engine] = stats
+        return stats
+
+    async def run(self, engine: str, fn: Callable, *args, **kwargs) -> Any:
+        """排隊取得設備名額後，於引擎執行緒池執行同步函式"""
+        if self._loop is not None and asyncio.get_running_loop() is not self._loop:
+            # 由背景載入執行緒的事件迴圈呼叫（例如引擎載入時的預熱）：轉交主事件迴圈，與請求共用設備名額
+            future = asyncio.run_coroutine_threadsafe(self.run(engine, fn, *args, **kwargs), self._loop)
+            return await asyncio.wrap_future(future)
+        if engine not in self._engine_devices:
+            self.register_engine(engine, "cpu")
+        device = self.get_device(engine)
+        job = _Job(engine, device, _current_priority.get(), _current_timeout.get(), next(self._seq))
+        stats = self._get_stats(engine)
+        stats["submitted"] += 1
+        heapq.heappush(self._queues.setdefault(engine, []), job)
+        self._dispatch(device)
+
+        try:
+            await job.granted
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            if job.granted.done() and not job.granted.cancelled():
+                # 已取得名額但尚未開始執行，歸還名額
+                self._release(job)
+            else:
+                self._remove(job)
+            raise
+
+        stats["running"] += 1
+        start_time = time.monotonic()
+        task = asyncio.ensure_future(inference_executor.run(engine, fn, *args, **kwargs))
+        abandoned = False
+        try:
+            result = await asyncio.shield(task)
+            stats["completed"] += 1
+            self._update_service_time(stats, time.monotonic() - start_time)
+            return result
+        except asyncio.CancelledError:
+            # 呼叫端已取消（例如客戶端斷線），但執行緒中的運算無法中斷：
+            # 等它結束才歸還設備名額，避免同一設備超出同時執行上限
+            abandoned = True
+            stats["cancelled"] += 1
+            task.add_done_callback(functools.partial(self._finish_abandoned, job))
+            raise
+        except Exception:
+            stats["failed"] += 1
+            raise
+        finally:
+            if not abandoned:
+                stats["running"] -= 1
+                self._release(job)
+
+    def _finish_abandoned(self, job: _Job, task: asyncio.Future):
+        if not task.cancelled():
+            task.exception()  # 取出例外，避免 "exception was never retrieved" 警告
+        self._get_stats(job.engine)["running"] -= 1
+        self._release(job)
+
+    def _update_service_time(self, stats: Dict[str, Any], elapsed: float):
+        if stats["service_time"] is None:
+            stats["service_time"] = elapsed
+        else:
+            stats["service_time"] += self.service_time_alpha * (elapsed - stats["service_time"])
+
+    def predict_wait(self, engine: str, priority: int = PRIORITY_NORMAL) -> float:
+        """預估以此優先權送入 engine 的新工作要排隊多久（秒）
+
+        同設備上優先權相同或更高的排隊工作都排在前面，執行中的工作以剩下一半計；
+        還沒有執行紀錄的引擎無法預估，以 0 計。
+        """
+        device = self.get_device(engine)
+        work = 0.0
+        for other, other_device in self._engine_devices.items():
+            if other_device != device:
+                continue
+            stats = self._get_stats(other)
+            service_time = stats["service_time"]
+            if not service_time:
+                continue
+            ahead = sum(1 for job in self._queues.get(other, []) if job.priority <= priority and not job.granted.done())
+            work += ahead * service_time + stats["running"] * service_time / 2
+        return work / max(1, self.get_device_limit(device))
+
+    def get_service_time(self, engine: str) -> Optional[float]:
+        return self._get_stats(engine)["service_time"]
+
+    def _remove(self, job: _Job):
+        queue = self._queues.get(job.engine, [])
+        if job in queue:
+            queue.remove(job)
+            heapq.heapify(queue)
+
+    def _release(self, job: _Job):
+        self._device_active[job.device] -= 1
+        self._dispatch(job.device)
+
+    def _dispatch(self, device: str):
+        """在設備仍有名額時，從同設備各引擎的佇列頭挑出最優先的工作"""
+        limit = self.get_device_limit(device)
+        engines = [engine for engine, dev in self._engine_devices.items() if dev == device]
+        while self._device_active.get(device, 0) < limit:
+            heads = [self._queues[engine][0] for engine in engines if self._queues.get(engine)]
+            if not heads:
+                return
+            job = min(heads)
+            heapq.heappop(self._queues[job.engine])
+            if job.granted.done():
+                continue
+
+            now = time.monotonic()
+            if job.deadline is not None and now > job.deadline:
+                self._get_stats(job.engine)["expired"] += 1
+                job.granted.set_exception(DeadlineExceeded(f"{job.engine} 工作排隊逾時"))
+                continue
+
+            wait_time = now - job.enqueued_at
+            stats = self._get_stats(job.engine)
+            stats["granted"] += 1
+            stats["wait_time_total"] += wait_time
+            stats["wait_time_max"] = max(stats["wait_time_max"], wait_time)
+            stats["recent_waits"].append(wait_time)
+
+            self._device_active[device] = self._device_active.get(device, 0) + 1
+            job.granted.set_result(None)
+
+    def get_queue_depth(self, engine: str) -> int:
+        return len(self._queues.get(engine, []))
+
+    def get_queue_depths(self) -> Dict[str, int]:
+        """所有已註冊引擎的佇列深度"""
+        return {engine: self.get_queue_depth(engine) for engine in self._engine_devices}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """佇列深度、執行中數量與等待時間統計"""
+        engines = {}
+        for engine, stats in self._stats.items():
+            waits = sorted(stats["recent_waits"])
+            granted = stats["granted"]
+            engines[engine] = {
+                "device": self.get_device(engine),
+                "queue_depth": self.get_queue_depth(engine),
+                "running": stats["running"],
+                "submitted": stats["submitted"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "expired": stats["expired"],
+                "cancelled": stats["cancelled"],
+                "avg_wait_ms": round(stats["wait_time_total"] / granted * 1000, 1) if granted > 0 else 0.0,
+                "max_wait_ms": round(stats["wait_time_max"] * 1000, 1),
+                "p50_wait_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "p95_wait_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                "avg_service_ms": round(stats["service_time"] * 1000, 1) if stats["service_time"] else None,
+                "predicted_wait_ms": round(self.predict_wait(engine) * 1000, 1),
+            }
+        devices = {
+            device: {
+                "active": self._device_active.get(device, 0),
+                "limit": self.get_device_limit(device),
+            }
+            for device in sorted(set(self._engine_devices.values()))
+        }
+        return {"engines": engines, "devices": devices}
+
+
+# 全域排程器實例
+scheduler = InferenceScheduler()
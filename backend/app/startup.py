@@ -0,0 +1,127 @@
+"""
+啟動載入
+STT、TTS、LLM 的模型載入彼此獨立，各自在專屬執行緒中同時進行，冷啟動時間接近最慢的一項而非三者總和：
+- run_in_thread 在新執行緒中以獨立事件迴圈執行載入協程，載入期間的同步阻塞不影響主事件迴圈
+  （載入過程中呼叫 scheduler.run 會轉交主事件迴圈排隊）
+- StartupReport 記錄各階段的開始時間、耗時與結果，啟動完成後印出報告並由 /startup 提供
+- 各階段即各項能力（stt / llm / tts）的就緒狀態：可在背景載入，先就緒的能力先開始服務，
+  其他協程可用 wait_ready() 等待某項能力載入完成
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 階段（能力）狀態
+STAGE_PENDING = "pending"
+STAGE_LOADING = "loading"
+STAGE_READY = "ready"
+STAGE_FAILED = "failed"
+STAGE_DISABLED = "disabled"
+
+
+async def run_in_thread(factory: Callable[[], Awaitable[Any]]) -> Any:
+    """在專屬執行緒的新事件迴圈中執行 factory() 產生的協程"""
+    return await asyncio.to_thread(lambda: asyncio.run(factory()))
+
+
+class StartupReport:
+    """各載入階段的耗時與狀態"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def begin(self):
+        self.started_at = time.time()
+
+    def register(self, name: str, enabled: bool = True):
+        """登記一項能力（尚未開始載入）；停用的服務登記為 disabled"""
+        self.stages[name] = {
+            "status": STAGE_PENDING if enabled else STAGE_DISABLED,
+            "started_at": None,
+            "duration": None,
+            "error": None,
+        }
+        self._events.setdefault(name, asyncio.Event())
+        if not enabled:
+            self._events[name].set()
+
+    def status(self, name: str) -> str:
+        stage = self.stages.get(name)
+        return stage["status"] if stage else STAGE_DISABLED
+
+    def is_ready(self, name: str) -> bool:
+        return self.status(name) == STAGE_READY
+
+    async def wait_ready(self, name: str):
+        """等待能力載入結束；載入失敗或服務停用時拋出例外"""
+        event = self._events.setdefault(name, asyncio.Event())
+        await event.wait()
+        if not self.is_ready(name):
+            stage = self.stages.get(name) or {}
+            raise Exception(f"{name} 無法使用（{self.status(name)}）: {stage.get('error') or ''}")
+
+    async def run_stage(self, name: str, factory: Callable[[], Awaitable[Any]], in_thread: bool = True) -> Any:
+        """執行單一載入階段並記錄結果；in_thread=False 時於主事件迴圈執行（階段本身已自行卸載阻塞工作）"""
+        if name not in self.stages:
+            self.register(name)
+        stage = self.stages[name]
+        stage.update(status=STAGE_LOADING, started_at=time.time())
+        print(f"開始載入 {name}...")
+        try:
+            result = await (run_in_thread(factory) if in_thread else factory())
+        except BaseException as e:
+            # 包含背景載入被取消（伺服器關閉），等待此能力的協程不會永遠卡住
+            stage["status"] = STAGE_FAILED
+            stage["error"] = str(e) or type(e).__name__
+            print(f"{name} 載入失敗: {stage['error']}")
+            raise
+        else:
+            stage["status"] = STAGE_READY
+        finally:
+            stage["duration"] = time.time() - stage["started_at"]
+            self._events[name].set()
+        print(f"{name} 載入完成，耗時 {stage['duration']:.1f} 秒")
+        return result
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def print_summary(self):
+        total = (self.finished_at or time.time()) - (self.started_at or time.time())
+        serial = sum(stage["duration"] or 0.0 for stage in self.stages.values())
+        print("=" * 48)
+        print("啟動報告")
+        for name, stage in self.stages.items():
+            if stage["started_at"] is None:
+                print(f"  {name:<8} {stage['status']}")
+                continue
+            offset = stage["started_at"] - (self.started_at or stage["started_at"])
+            duration = stage["duration"] or 0.0
+            print(f"  {name:<8} {stage['status']:<8} +{offset:6.1f}s  耗時 {duration:7.1f} 秒"
+                  + (f"  錯誤: {stage['error']}" if stage["error"] else ""))
+        print(f"  總耗時 {total:.1f} 秒（依序載入約需 {serial:.1f} 秒）")
+        print("=" * 48)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "total_seconds": round(self.finished_at - self.started_at, 2) if self.finished_at and self.started_at else None,
+            "stages": {
+                name: {
+                    "status": stage["status"],
+                    "offset_seconds": (round(stage["started_at"] - self.started_at, 2)
+                                       if self.started_at and stage["started_at"] else None),
+                    "duration_seconds": round(stage["duration"], 2) if stage["duration"] is not None else None,
+                    "error": stage["error"],
+                }
+                for name, stage in self.stages.items()
+            },
+        }
+
+
+# 全域啟動報告
+startup_report = StartupReport()
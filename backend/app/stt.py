@@ -1,12 +1,21 @@
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_suppressed_tokens
 import tempfile
+import time
 import os
 import io
 import numpy as np
 import soundfile as sf
-from typing import Optional, Union
+from typing import List, Optional, Union
 from opencc import OpenCC
 from app.config import config
+from app.scheduler import scheduler
+from app.batching import MicroBatcher
+from app.metrics import stt_latency
+from app.tracing import span
+from app.cancellation import skip_cancelled
 
 class STTService:
     def __init__(self):
@@ -15,10 +24,23 @@ class STTService:
         self.model_name = "large-v3-turbo"
         self.model_path = "./models"
         self.device = "auto"  # 預設自動選擇
+        self.language = "zh"
+        self.compute_type = "auto"
+        # 解碼參數（stt.decoding），可用 benchmarks.benchmark_stt 量測不同設定的速度與準確度
+        self.beam_size = 5
+        self.best_of = 5
+        self.vad_filter = False
         self.converter = OpenCC('s2twp')
+        self.tokenizer = None  # 批次解碼用，模型載入後建立
         
         # 從配置文件載入參數
         self._load_config()
+        
+        # 跨請求微批次：同時到達的短語音合併成一次 encoder / decoder 呼叫
+        self.batcher = MicroBatcher.from_config(
+            "STT", "stt.batching",
+            lambda items: scheduler.run("stt", skip_cancelled(self._transcribe_batch_sync), items)
+        )
     
     def _load_config(self):
         """從配置文件載入 STT 參數"""
@@ -26,9 +48,16 @@ class STTService:
         self.model_name = stt_config.get("model", self.model_name)
         self.model_path = stt_config.get("model_path", self.model_path)
         self.device = stt_config.get("device", self.device)
+        self.language = stt_config.get("language", self.language)
+        self.compute_type = stt_config.get("compute_type", self.compute_type)
+        decoding_config = stt_config.get("decoding", {}) or {}
+        self.beam_size = decoding_config.get("beam_size", self.beam_size)
+        self.best_of = decoding_config.get("best_of", self.best_of)
+        self.vad_filter = decoding_config.get("vad_filter", self.vad_filter)
         self.device_name = 'cuda' if 'cuda' in self.device else 'cpu'
         self.device_index = [int(self.device[-1])]
         print(f"STT 配置載入: 模型={self.model_name}, 路徑={self.model_path}, 設備={self.device}")
+        scheduler.register_engine("stt", self.device)
     
     async def initialize(self, model_name: str = None, model_path: str = None):
         """初始化 Faster-Whisper 模型
@@ -53,7 +82,7 @@ class STTService:
                 download_root=self.model_path,
                 device=self.device_name,
                 device_index=self.device_index,
-                compute_type="auto"
+                compute_type=self.compute_type
             )
             print("Faster-Whisper 模型載入完成!")
         except Exception as e:
@@ -66,13 +95,20 @@ class STTService:
                     download_root=self.model_path,
                     device=self.device_name,
                     device_index=self.device_index,
-                    compute_type="auto"
+                    compute_type=self.compute_type
                 )
                 self.model_name = "base"
                 print("Faster-Whisper base 模型載入完成!")
             except Exception as e2:
                 print(f"所有模型載入都失敗: {e2}")
                 raise e2
+        
+        self.tokenizer = Tokenizer(
+            self.model.hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language=self.language
+        )
     
     def is_ready(self) -> bool:
         """檢查模型是否準備就緒"""
@@ -84,50 +120,138 @@ class STTService:
             raise Exception("STT 模型尚未初始化")
         
         try:
-            # 創建臨時文件
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
-                tmp_file_path = tmp_file.name
-            
-            # 根據輸入類型處理音頻數據
-            if isinstance(audio_data, np.ndarray):
-                # 如果是 numpy 陣列，使用 soundfile 寫入 WAV 文件
-                sf.write(tmp_file_path, audio_data, sample_rate)
-            elif isinstance(audio_data, bytes):
-                # 如果是 bytes，直接寫入文件
-                with open(tmp_file_path, 'wb') as f:
-                    f.write(audio_data)
-            else:
-                raise ValueError(f"不支持的音頻數據類型: {type(audio_data)}")
+            start_time = time.time()
+            with span("stt.transcribe"):
+                if self.batcher:
+                    text = await self.batcher.submit((audio_data, sample_rate))
+                else:
+                    text = await scheduler.run("stt", self._transcribe_sync, audio_data, sample_rate)
+            stt_latency.observe(time.time() - start_time)
+            return text
+        except Exception as e:
+            print(f"STT 轉換錯誤: {e}")
+            raise Exception(f"語音辨識失敗: {str(e)}")
+    
+    def _transcribe_sync(self, audio_data: Union[bytes, np.ndarray], sample_rate: int) -> str:
+        """同步辨識流程（於 STT 執行緒池中執行）"""
+        # 創建臨時文件
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
+            tmp_file_path = tmp_file.name
+        
+        try:
+            with span("stt.temp_write"):
+                # 根據輸入類型處理音頻數據
+                if isinstance(audio_data, np.ndarray):
+                    # 如果是 numpy 陣列，使用 soundfile 寫入 WAV 文件
+                    sf.write(tmp_file_path, audio_data, sample_rate)
+                elif isinstance(audio_data, bytes):
+                    # 如果是 bytes，直接寫入文件
+                    with open(tmp_file_path, 'wb') as f:
+                        f.write(audio_data)
+                else:
+                    raise ValueError(f"不支持的音頻數據類型: {type(audio_data)}")
             
-            # 使用 Faster-Whisper 進行語音辨識
+            return self._transcribe_audio_sync(tmp_file_path)
+        finally:
+            # 清理暫存檔
+            try:
+                os.unlink(tmp_file_path)
+            except OSError:
+                pass
+    
+    def _transcribe_audio_sync(self, audio: Union[str, np.ndarray]) -> str:
+        """使用 Faster-Whisper 進行語音辨識（segments 為惰性產生器，解碼發生在迭代時）"""
+        with span("stt.whisper_decode") as decode_span:
             segments, info = self.model.transcribe(
-                tmp_file_path,
-                language="zh",  # 指定中文
+                audio,
+                language=self.language,  # 指定中文
                 task="transcribe",
-                beam_size=5,  # 提升準確度
-                best_of=5
+                beam_size=self.beam_size,
+                best_of=self.best_of,
+                vad_filter=self.vad_filter
             )
             
-            # 清理暫存檔
-            os.unlink(tmp_file_path)
-            
             # 合併所有 segments 的文字
             text = "".join([segment.text for segment in segments]).strip()
+            if decode_span:
+                decode_span.set_attribute("audio_duration", round(info.duration, 2))
+        with span("stt.opencc"):
             text = self.converter.convert(text)  # 繁體中文轉換
-            # print(f"STT 辨識結果: {text}")
-            
-            return text
+        # print(f"STT 辨識結果: {text}")
         
-        except Exception as e:
-            print(f"STT 轉換錯誤: {e}")
-            # 嘗試清理暫存檔
+        return text
+    
+    def _load_audio(self, audio_data: Union[str, bytes, np.ndarray], sample_rate: Optional[int]) -> np.ndarray:
+        """將各種輸入解碼成 16kHz 單聲道 float32 波形"""
+        if isinstance(audio_data, np.ndarray):
+            # numpy 陣列先包成 WAV，交給 decode_audio 統一重取樣
+            buffer = io.BytesIO()
+            sf.write(buffer, audio_data, sample_rate or 16000, format="WAV")
+            buffer.seek(0)
+            return decode_audio(buffer, sampling_rate=self.model.feature_extractor.sampling_rate)
+        if isinstance(audio_data, bytes):
+            return decode_audio(io.BytesIO(audio_data), sampling_rate=self.model.feature_extractor.sampling_rate)
+        if isinstance(audio_data, str):
+            return decode_audio(audio_data, sampling_rate=self.model.feature_extractor.sampling_rate)
+        raise ValueError(f"不支持的音頻數據類型: {type(audio_data)}")
+    
+    def _transcribe_batch_sync(self, items: List[tuple]) -> List[Union[str, Exception]]:
+        """同步批次辨識（於 STT 執行緒池中執行）
+        
+        BatchedInferencePipeline 只會把單一音檔的 VAD 片段湊批，這裡沿用相同的
+        encode / generate 流程，但批次的每一列來自不同請求。
+        超過 30 秒的音訊需要滑動視窗解碼、開啟 vad_filter 時需要先切出語音片段，這兩種情況改走一般 transcribe 流程。
+        回傳與 items 等長的列表，失敗的項目為 Exception。
+        """
+        results: List[Union[str, Exception, None]] = [None] * len(items)
+        audios = []
+        batch_indices = []
+        for i, (audio_data, sample_rate) in enumerate(items):
             try:
-                if 'tmp_file_path' in locals():
-                    os.unlink(tmp_file_path)
-            except:
-                pass
-            
-            raise Exception(f"語音辨識失敗: {str(e)}")
+                audio = self._load_audio(audio_data, sample_rate)
+                if self.vad_filter or len(audio) > self.model.feature_extractor.n_samples:
+                    results[i] = self._transcribe_audio_sync(audio)
+                    continue
+            except Exception as e:
+                results[i] = e
+                continue
+            audios.append(audio)
+            batch_indices.append(i)
+        
+        if audios:
+            try:
+                for i, text in zip(batch_indices, self._decode_batch_sync(audios)):
+                    results[i] = text
+            except Exception as e:
+                for i in batch_indices:
+                    results[i] = e
+        return results
+    
+    def _decode_batch_sync(self, audios: List[np.ndarray]) -> List[str]:
+        """將多段 30 秒內的音訊一次送進 Whisper encoder 與 beam search decoder"""
+        feature_extractor = self.model.feature_extractor
+        features = np.stack([
+            pad_or_trim(feature_extractor(audio)[..., :feature_extractor.nb_max_frames])
+            for audio in audios
+        ])
+        encoder_output = self.model.encode(features)
+        
+        prompt = self.model.get_prompt(self.tokenizer, [], without_timestamps=True)
+        outputs = self.model.model.generate(
+            encoder_output,
+            [prompt] * len(audios),
+            beam_size=self.beam_size,  # 與單筆辨識一致
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=get_suppressed_tokens(self.tokenizer, [-1]),
+        )
+        
+        texts = []
+        for output in outputs:
+            tokens = [token for token in output.sequences_ids[0] if token < self.tokenizer.eot]
+            text = self.tokenizer.decode(tokens).strip()
+            texts.append(self.converter.convert(text))  # 繁體中文轉換
+        return texts
     
     async def transcribe_file(self, file_path: str) -> str:
         """直接從檔案路徑進行語音辨識"""
@@ -135,21 +259,9 @@ class STTService:
             raise Exception("STT 模型尚未初始化")
         
         try:
-            segments, info = self.model.transcribe(
-                file_path,
-                language="zh",
-                task="transcribe",
-                beam_size=5,
-                best_of=5
-            )
-            
-            # 合併所有 segments 的文字
-            text = "".join([segment.text for segment in segments]).strip()
-            text = self.converter.convert(text)  # 繁體中文轉換
-            # print(f"STT 辨識結果: {text}")
-            
-            return text
-        
+            if self.batcher:
+                return await self.batcher.submit((file_path, None))
+            return await scheduler.run("stt", self._transcribe_audio_sync, file_path)
         except Exception as e:
             print(f"STT 轉換錯誤: {e}")
             raise Exception(f"語音辨識失敗: {str(e)}")
@@ -0,0 +1,254 @@
+"""
+請求追蹤
+每個 HTTP 請求（與每一輪 WebSocket 對話）建立一個 trace，trace ID 以 X-Trace-Id 標頭回傳：
+- span() 以 contextvars 記錄目前的 span，可巢狀，且會隨 executor 複製的上下文進入推論執行緒
+- 結束的 span 放入佇列，由背景執行緒批次寫入 JSONL（或 OTLP JSON 檔），不阻塞請求
+- 不在任何 trace 中（例如預熱、跨請求批次內部）時 span() 不做任何事
+"""
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from app.config import config
+
+TRACE_HEADER = "X-Trace-Id"
+
+
+class Span:
+    """單一計時區段"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "status", "sampled")
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) * 1000, 2) if self.end else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)),
+            "endTimeUnixNano": str(int((self.end or self.start) * 1e9)),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1},
+        }
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+class Tracer:
+    """收集結束的 span 並由背景執行緒寫檔"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入追蹤參數"""
+        tracing_config = config.get("tracing", {}) or {}
+        self.enabled = tracing_config.get("enabled", True)
+        self.exporter = tracing_config.get("exporter", "jsonl")  # jsonl 或 otlp（OTLP JSON 檔）
+        self.export_path = tracing_config.get("export_path", "./logs/traces.jsonl")
+        self.max_file_bytes = int(tracing_config.get("max_file_mb", 100) * 1024 * 1024)
+        self.sample_rate = tracing_config.get("sample_rate", 1.0)
+        self.service_name = tracing_config.get("service_name", "realtime-dialogue-bot")
+
+    def export(self, span: Span):
+        if not span.sampled:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            self._start_writer()
+
+    def _start_writer(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self):
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            # 一次取出佇列中所有已完成的 span 合併寫入
+            while len(batch) < 500:
+                try:
+                    span = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if span is None:
+                    self._write(batch)
+                    return
+                batch.append(span)
+            self._write(batch)
+
+    def _write(self, spans: List[Span]):
+        try:
+            os.makedirs(os.path.dirname(self.export_path) or ".", exist_ok=True)
+            if os.path.exists(self.export_path) and os.path.getsize(self.export_path) > self.max_file_bytes:
+                os.replace(self.export_path, self.export_path + ".1")
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                if self.exporter == "otlp":
+                    f.write(json.dumps(self._otlp_payload(spans), ensure_ascii=False) + "\n")
+                else:
+                    for span in spans:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+            self.exported += len(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            print(f"追蹤資料寫入失敗: {e}")
+
+    def _otlp_payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+
+    def shutdown(self):
+        """送出剩餘的 span 並停止寫入執行緒"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "exporter": self.exporter,
+            "export_path": self.export_path,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
+
+
+# 全域追蹤器
+tracer = Tracer()
+
+
+def _parse_trace_id(value: Optional[str]) -> Optional[str]:
+    """接受 X-Trace-Id（32 位十六進位）或 W3C traceparent（00-<trace_id>-<span_id>-<flags>）"""
+    if not value:
+        return None
+    value = value.strip().lower()
+    parts = value.split("-")
+    if len(parts) == 4:
+        value = parts[1]
+    if len(value) == 32 and all(c in "0123456789abcdef" for c in value):
+        return value
+    return None
+
+
+@contextmanager
+def start_trace(name: str, incoming: Optional[str] = None, **attributes):
+    """建立請求層級的根 span，yield 根 span（追蹤停用時為 None）"""
+    if not tracer.enabled:
+        yield None
+        return
+    trace_id = _parse_trace_id(incoming) or secrets.token_hex(16)
+    sampled = tracer.sample_rate >= 1.0 or secrets.randbelow(10000) < tracer.sample_rate * 10000
+    root = Span(trace_id, name, attributes=attributes, sampled=sampled)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.status = "error"
+        root.attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end = time.time()
+        tracer.export(root)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """在目前的 trace 下記錄一個子 span；不在 trace 中時不做任何事"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    child = Span(parent.trace_id, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = "error"
+        child.attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end = time.time()
+        tracer.export(child)
+
+
+def record_span(name: str, start: float, end: Optional[float] = None, **attributes):
+    """以已量測的起訖時間記錄 span（用於無法包成 with 區塊的非同步產生器）"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    child = Span(parent.trace_id, name, parent.span_id, attributes)
+    child.start = start
+    child.end = end or time.time()
+    tracer.export(child)
+
+
+@contextmanager
+def detached():
+    """暫時離開目前的 trace（跨請求批次在其中執行，避免算到第一個請求的 trace 上）"""
+    token = _current_span.set(None)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current else None
@@ -10,7 +10,13 @@ from huggingface_hub import snapshot_download
 import torch
 import torchaudio
 from app.config import config
-from app.config import config
+from app.scheduler import scheduler
+from app.tts_router import tts_router
+from app.metrics import cache_requests
+from app.tracing import span
+from app.cancellation import check_cancelled
+from app.warmup import warmup_runner, is_warming_up
+from app.compile_cache import compile_cache
 
 class TTSBreezyService:
     def __init__(self):
@@ -37,7 +43,6 @@ class TTSBreezyService:
         self.word_utils_imported = False  # 標記 word_utils 是否已匯入
         
         # === 進階優化設置 ===
-        self.model_warmed_up = False  # 模型預熱狀態
         self.use_mixed_precision = True  # 是否使用混合精度
         self.quantization_enabled = False  # 是否啟用量化（需要支持）
         self.parallel_synthesis = True  # 是否啟用並行合成
@@ -57,6 +62,7 @@ class TTSBreezyService:
         tts_config = config.get_tts_config("breezy")
         self.device = tts_config.get("device", "cuda:1" if torch.cuda.is_available() else "cpu")
         print(f"TTS Breezy 配置載入: device={self.device}")
+        scheduler.register_engine("tts_breezy", self.device)
         
         # 更新設備相關設置
         if "cpu" in self.device:
@@ -124,12 +130,9 @@ class TTSBreezyService:
             # === 初始化 ASR 和轉換器（避免重複載入） ===
             await self._init_asr_tools()
             
-            # 設定固定語者
+            # 設定固定語者（模型預熱由 app.warmup 在註冊表載入引擎後統一執行）
             await self._setup_speakers(speaker_voices, speaker_names, speaker_transcriptions)
             
-            # === 模型預熱 ===
-            await self._warmup_model()
-            
             self.is_initialized = True
             print("BreezyVoice TTS 初始化完成!")
             
@@ -217,86 +220,14 @@ class TTSBreezyService:
                     print(f"⚠ 量化失敗: {e}")
                     self.quantization_enabled = False
             
-            # === 模型編譯優化（PyTorch 2.0+） ===
-            if hasattr(torch, 'compile') and torch.__version__.startswith('2.'):
-                try:
-                    self.cosyvoice.model = torch.compile(self.cosyvoice.model, mode="reduce-overhead")
-                    print("✓ 已啟用 torch.compile 優化")
-                except Exception as e:
-                    print(f"⚠ torch.compile 失敗: {e}")
+            # === 模型編譯優化（PyTorch 2.0+，編譯結果快取於 compile_cache.dir，重啟後重用） ===
+            self.cosyvoice.model = compile_cache.compile("breezy", self.cosyvoice.model, self.model_path)
             
             print("模型優化完成")
             
         except Exception as e:
             print(f"模型優化失敗: {e}")
 
-    async def _warmup_model(self):
-        """模型預熱機制"""
-        if self.model_warmed_up:
-            return
-        
-        try:
-            print("正在進行模型預熱...")
-            
-            # 獲取預設語者進行預熱
-            default_speaker_id = self.get_default_speaker_id()
-            if not default_speaker_id or default_speaker_id not in self.speaker_audio_cache:
-                print("⚠ 沒有可用語者進行預熱")
-                return
-            
-            # 預熱文本（短且常見的句子）
-            warmup_texts = [
-                "你好",
-                "測試語音",
-            ]
-            
-            start_time = time.time()
-            
-            for i, text in enumerate(warmup_texts):
-                try:
-                    print(f"  預熱 {i+1}/{len(warmup_texts)}: {text}")
-                    # 直接調用核心合成，不保存結果
-                    await self._run_warmup_synthesis(text, default_speaker_id)
-                except Exception as e:
-                    print(f"  預熱失敗 {i+1}: {e}")
-            
-            end_time = time.time()
-            self.model_warmed_up = True
-            print(f"✓ 模型預熱完成 ({end_time - start_time:.2f}秒)")
-            
-        except Exception as e:
-            print(f"模型預熱失敗: {e}")
-
-    async def _run_warmup_synthesis(self, text: str, speaker_id: str):
-        """執行預熱合成（簡化版本）"""
-        try:
-            # 獲取緩存的語者數據
-            prompt_speech_16k = self.speaker_audio_cache[speaker_id]
-            cached_data = self.speaker_processed_cache[speaker_id]
-            
-            # 處理合成內容
-            normalized_content = self.cosyvoice.frontend.text_normalize_new(text, split=False)
-            content_with_bopomofo = self._get_bopomofo_rare_cached(normalized_content)
-            
-            # 執行合成（不保存結果）
-            with torch.no_grad():  # 節省內存
-                if self.use_mixed_precision and torch.cuda.is_available():
-                    with torch.cuda.amp.autocast():
-                        _ = self.cosyvoice.inference_zero_shot_no_normalize(
-                            content_with_bopomofo,
-                            cached_data["bopomofo"],
-                            prompt_speech_16k
-                        )
-                else:
-                    _ = self.cosyvoice.inference_zero_shot_no_normalize(
-                        content_with_bopomofo,
-                        cached_data["bopomofo"], 
-                        prompt_speech_16k
-                    )
-            
-        except Exception as e:
-            raise Exception(f"預熱合成失敗: {e}")
-
     async def _init_asr_tools(self):
         """初始化 ASR 和轉換工具（只執行一次）"""
         try:
@@ -509,8 +440,10 @@ class TTSBreezyService:
                 print("ASR 初始化失敗，無法進行語音轉文字")
                 return ""
             
-            # 使用緩存的 Pipeline 進行 ASR
-            result = self.whisper_asr(
+            # 使用緩存的 Pipeline 進行 ASR（於 TTS 執行緒池中執行）
+            result = await scheduler.run(
+                "tts_breezy",
+                self.whisper_asr,
                 audio_path,
                 generate_kwargs={
                     "language": "zh",  # 指定中文
@@ -591,21 +524,25 @@ class TTSBreezyService:
 
             # 檢查是否已在快取中
             cache_key = f"{text}:{final_voice_path}"
-            if cache_key in self.speaker_cache:
+            use_cache = not is_warming_up()  # 預熱不讀寫快取，否則穩態各次會直接命中
+            if use_cache and cache_key in self.speaker_cache:
+                cache_requests.inc(cache="speaker_cache", provider="breezy", result="hit")
                 print("使用快取的語音")
                 return self.speaker_cache[cache_key]
 
+            if use_cache:
+                cache_requests.inc(cache="speaker_cache", provider="breezy", result="miss")
             # 合成語音
             print(f"合成文本: {text}")
             audio_data = await self._run_synthesis(text, final_voice_path, speaker_transcription)
 
             # 加入快取（限制快取大小避免記憶體溢出）
-            if len(self.speaker_cache) >= 50:  # 最多快取50個結果
-                # 刪除最舊的快取項目
-                oldest_key = next(iter(self.speaker_cache))
-                del self.speaker_cache[oldest_key]
-
-            self.speaker_cache[cache_key] = audio_data
+            if use_cache:
+                if len(self.speaker_cache) >= 50:  # 最多快取50個結果
+                    # 刪除最舊的快取項目
+                    oldest_key = next(iter(self.speaker_cache))
+                    del self.speaker_cache[oldest_key]
+                self.speaker_cache[cache_key] = audio_data
 
             return audio_data
 
@@ -613,14 +550,16 @@ class TTSBreezyService:
             print(f"TTS 合成失敗: {str(e)}")
             raise
     
-    async def _synthesize_long_text(self, text: str, speaker_voice_path: Optional[str] = None) -> bytes:
-        """分段處理長文字（並行優化版本）"""
+    def split_text(self, text: str) -> List[str]:
+        """以句號、問號、驚嘆號將長文字分段（也供 /tts 串流使用）"""
         import re
-        import asyncio
         
-        # 以句號、問號、驚嘆號分段
         sentences = re.split(r'[。！？.!?]', text)
-        sentences = [s.strip() for s in sentences if s.strip()]
+        return [s.strip() for s in sentences if s.strip()]
+
+    async def _synthesize_long_text(self, text: str, speaker_voice_path: Optional[str] = None) -> bytes:
+        """分段處理長文字（並行優化版本）"""
+        sentences = self.split_text(text)
         
         print(f"長文字分為 {len(sentences)} 段處理")
         
@@ -628,6 +567,8 @@ class TTSBreezyService:
             # 序列處理（原始方式）
             audio_segments = []
             for i, sentence in enumerate(sentences):
+                # 客戶端已斷線時不再合成後續段落
+                check_cancelled()
                 print(f"處理第 {i+1}/{len(sentences)} 段: {sentence}")
                 segment_audio = await self.synthesize(sentence, speaker_voice_path, save_file=True)
                 audio_segments.append(segment_audio)
@@ -648,6 +589,8 @@ class TTSBreezyService:
         
         async def synthesize_with_semaphore(i: int, sentence: str) -> tuple:
             async with semaphore:
+                # 等待名額期間客戶端已斷線時直接放棄（不列為失敗段落）
+                check_cancelled()
                 try:
                     print(f"  並行處理第 {i+1} 段: {sentence}")
                     audio_data = await self.synthesize(sentence, speaker_voice_path, save_file=True)
@@ -660,6 +603,7 @@ class TTSBreezyService:
         # 並行執行所有片段
         tasks = [synthesize_with_semaphore(i, sentence) for i, sentence in enumerate(sentences)]
         results = await asyncio.gather(*tasks, return_exceptions=True)
+        check_cancelled()
         
         # 按順序排列結果
         audio_segments = [None] * len(sentences)
@@ -725,18 +669,38 @@ class TTSBreezyService:
                 )
                 speaker_text_with_bopomofo = self._get_bopomofo_rare_cached(normalized_speaker_text)
             
-            # === 處理合成內容（只需處理一次） ===
-            print("正在處理合成內容...")
+            # === 文字處理與模型推論於 TTS 執行緒池中執行 ===
+            return await scheduler.run(
+                "tts_breezy", self._synthesize_sync,
+                text, speaker_text_with_bopomofo, prompt_speech_16k, voice_path
+            )
+            
+        except Exception as e:
+            print(f"語音合成錯誤: {e}")
+            import traceback
+            traceback.print_exc()
+            raise Exception(f"語音合成失敗: {str(e)}")
+    
+    def _synthesize_sync(self, text: str, speaker_text_with_bopomofo: str, prompt_speech_16k,
+                         voice_path: Optional[str] = None) -> bytes:
+        """同步執行文字正規化、注音標註、語音合成與 WAV 編碼
+
+        指定 voice_path 時將實測時間回報給 TTS 路由（預熱不回報）。
+        """
+        # === 處理合成內容（只需處理一次） ===
+        print("正在處理合成內容...")
+        with span("tts.normalize_g2p", provider="breezy"):
             normalized_content = self.cosyvoice.frontend.text_normalize_new(text, split=False)
             content_with_bopomofo = self._get_bopomofo_rare_cached(normalized_content)
-            
-            print(f"說話者逐字稿（含注音）: {speaker_text_with_bopomofo}")
-            print(f"合成內容（含注音）: {content_with_bopomofo}")
-            
-            # === 語音合成（混合精度優化） ===
-            print("開始語音合成...")
-            start_time = time.time()
-            
+        
+        print(f"說話者逐字稿（含注音）: {speaker_text_with_bopomofo}")
+        print(f"合成內容（含注音）: {content_with_bopomofo}")
+        
+        # === 語音合成（混合精度優化） ===
+        print("開始語音合成...")
+        start_time = time.time()
+        
+        with span("tts.generate", provider="breezy", text_chars=len(text)):
             # 使用混合精度加速
             if self.use_mixed_precision and torch.cuda.is_available():
                 with torch.cuda.amp.autocast():
@@ -753,36 +717,34 @@ class TTSBreezyService:
                         speaker_text_with_bopomofo, 
                         prompt_speech_16k
                     )
-            
-            end_time = time.time()
-            print(f"合成時間: {end_time - start_time:.2f} 秒")
-            print(f"生成音檔長度: {output['tts_speech'].shape[1]/22050:.2f} 秒")
-            
-            # === 優化的 tensor 轉換 ===
-            # 確保在正確的設備和精度下處理
-            audio_tensor = output['tts_speech']
-            if self.use_mixed_precision:
-                # 轉換回 float32 進行音檔保存
-                audio_tensor = audio_tensor.float()
-            
-            # 轉移到 CPU（如果在 GPU 上）
-            if audio_tensor.is_cuda:
-                audio_tensor = audio_tensor.cpu()
-            
-            # 將 tensor 轉換為 bytes
-            import io
+        
+        end_time = time.time()
+        audio_duration = output['tts_speech'].shape[1] / 22050
+        print(f"合成時間: {end_time - start_time:.2f} 秒")
+        print(f"生成音檔長度: {audio_duration:.2f} 秒")
+        if voice_path:
+            tts_router.observe("breezy", voice_path, len(text), end_time - start_time, audio_duration)
+        
+        # === 優化的 tensor 轉換 ===
+        # 確保在正確的設備和精度下處理
+        audio_tensor = output['tts_speech']
+        if self.use_mixed_precision:
+            # 轉換回 float32 進行音檔保存
+            audio_tensor = audio_tensor.float()
+        
+        # 轉移到 CPU（如果在 GPU 上）
+        if audio_tensor.is_cuda:
+            audio_tensor = audio_tensor.cpu()
+        
+        # 將 tensor 轉換為 bytes
+        import io
+        with span("tts.wav_encode", provider="breezy"):
             buffer = io.BytesIO()
             torchaudio.save(buffer, audio_tensor, 22050, format="wav")
             audio_bytes = buffer.getvalue()
             buffer.close()
-            
-            return audio_bytes
-            
-        except Exception as e:
-            print(f"語音合成錯誤: {e}")
-            import traceback
-            traceback.print_exc()
-            raise Exception(f"語音合成失敗: {str(e)}")
+        
+        return audio_bytes
     
     async def set_speaker_reference(self, speaker_audio_path: str, speaker_name: str = "custom", speaker_transcription: Optional[str] = None):
         """動態設定參考音檔（如果需要更換固定參考音檔時使用）
@@ -830,7 +792,7 @@ class TTSBreezyService:
             "quantization": self.quantization_enabled,
             "parallel_synthesis": self.parallel_synthesis,
             "max_concurrent_segments": self.max_concurrent_segments,
-            "model_warmed_up": self.model_warmed_up,
+            "model_warmed_up": "tts_breezy" in warmup_runner.results,
             "cache_size": {
                 "speaker_cache": len(self.speaker_cache),
                 "audio_cache": len(self.speaker_audio_cache),
@@ -1,3 +1,4 @@
+import io
 import os
 import uuid
 import time
@@ -5,7 +6,13 @@ from typing import Optional, List
 import sys
 import torch
 import shutil
+import soundfile as sf
 from app.config import config
+from app.scheduler import scheduler
+from app.retention import retention_manager
+from app.tts_router import tts_router
+from app.audio_utils import wav_duration
+from app.tracing import span
 
 # 添加 IndexTTS 路徑
 sys.path.append('/app/index-tts')
@@ -47,6 +54,7 @@ class TTSIndexService:
         self.default_speaker_path = default_speaker_config.get("audio_path", None)
         
         print(f"TTS Index 配置載入: device={self.device}, model_dir={self.model_dir}")
+        scheduler.register_engine("tts_index", self.device)
         if self.default_speaker_path:
             print(f"預設語者: {self.default_speaker_path}")
 
@@ -153,7 +161,7 @@ class TTSIndexService:
             print(f"新增語者失敗: {e}")
             raise e
     
-    async def synthesize(self, text: str, speaker_voice_path: str = None, speaker_id: str = None) -> str:
+    async def synthesize(self, text: str, speaker_voice_path: str = None, speaker_id: str = None) -> bytes:
         """合成語音"""
         if not self.is_ready():
             raise Exception("IndexTTS 尚未初始化")
@@ -185,31 +193,17 @@ class TTSIndexService:
             if not os.path.exists(voice_path):
                 raise Exception(f"語者音檔不存在: {voice_path}")
             
-            # 生成輸出檔名
-            output_filename = f"indextts_output_{uuid.uuid4().hex[:8]}.wav"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
             print(f"開始合成語音...")
             print(f"文字: {text}")
             print(f"語者音檔: {voice_path}")
-            print(f"輸出檔案: {output_path}")
-            
-            # 調用 IndexTTS 進行推論
-            self.tts.infer(voice_path, text, output_path=output_path)
             
-            # 檢查輸出檔案是否存在
-            if not os.path.exists(output_path):
-                raise Exception("語音合成失敗，未產生輸出檔案")
+            # 調用 IndexTTS 進行推論（於 TTS 執行緒池中執行），音檔直接編碼在記憶體中
+            audio_data = await scheduler.run("tts_index", self._infer_to_bytes, voice_path, text)
             
             synthesis_time = time.time() - start_time
             print(f"IndexTTS 語音合成完成! 耗時: {synthesis_time:.2f} 秒")
-            
-            # 讀取音檔內容為 bytes（與其他 TTS 引擎保持一致）
-            with open(output_path, "rb") as f:
-                audio_data = f.read()
-            
             print(f"音檔大小: {len(audio_data)} bytes")
-            print(f"音檔儲存於: {output_path}")
+            tts_router.observe("index", voice_path, len(text), synthesis_time, wav_duration(audio_data))
             
             return audio_data
             
@@ -217,6 +211,15 @@ class TTSIndexService:
             print(f"IndexTTS 語音合成失敗: {e}")
             raise e
     
+    def _infer_to_bytes(self, voice_path: str, text: str) -> bytes:
+        """同步推論並在記憶體中編碼成 WAV（output_path=None 時 infer 回傳取樣率與 int16 波形）"""
+        with span("tts.generate", provider="index", text_chars=len(text)):
+            sampling_rate, wav_data = self.tts.infer(voice_path, text, output_path=None)
+        with span("tts.wav_encode", provider="index"):
+            buffer = io.BytesIO()
+            sf.write(buffer, wav_data, sampling_rate, format="WAV", subtype="PCM_16")
+            return buffer.getvalue()
+    
     async def synthesize_with_speaker_file(self, text: str, speaker_file_path: str) -> bytes:
         """使用指定語者檔案合成語音"""
         return await self.synthesize(text, speaker_voice_path=speaker_file_path)
@@ -255,8 +258,9 @@ class TTSIndexService:
             print(f"語者音檔: {voice_path}")
             print(f"輸出檔案: {output_path}")
             
-            # 調用 IndexTTS 進行推論
-            self.tts.infer(voice_path, text, output_path=output_path)
+            # 調用 IndexTTS 進行推論（於 TTS 執行緒池中執行）
+            with span("tts.generate_to_file", provider="index", text_chars=len(text)):
+                await scheduler.run("tts_index", self.tts.infer, voice_path, text, output_path=output_path)
             
             # 檢查輸出檔案是否存在
             if not os.path.exists(output_path):
@@ -265,6 +269,7 @@ class TTSIndexService:
             synthesis_time = time.time() - start_time
             print(f"IndexTTS 語音合成到檔案完成! 耗時: {synthesis_time:.2f} 秒")
             print(f"檔案路徑: {output_path}")
+            retention_manager.register(output_path)
             
             return output_path
             
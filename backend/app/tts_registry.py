@@ -0,0 +1,277 @@
+"""
+TTS 引擎註冊表
+同一個行程可同時提供 BreezyVoice、VibeVoice、IndexTTS 與 Spark-TTS：
+- 引擎模組（連同 torch 等重量級相依）與模型在第一次使用時才匯入、載入，匯入耗時記錄在 import_timer
+- 已載入的引擎依最近使用順序排列，超過記憶體預算時卸載最久未使用且閒置的引擎
+- 請求以 provider 欄位選擇引擎，未指定時使用 tts.provider
+"""
+import asyncio
+import gc
+import importlib
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from app.config import config
+from app.import_profile import import_timer
+from app.startup import run_in_thread
+from app.warmup import warmup_runner
+
+# provider -> (模組, 類別)，模組於第一次載入時才匯入
+TTS_ENGINES = {
+    "breezy": ("app.tts_breezy", "TTSBreezyService"),
+    "vibe": ("app.tts_vibe", "TTSVibeService"),
+    "index": ("app.tts_index", "TTSIndexService"),
+    "spark": ("app.tts_spark", "TTSSparkService"),
+}
+
+# 無法量測時使用的預估記憶體用量（GB）
+DEFAULT_ENGINE_MEMORY_GB = {
+    "breezy": 2.0,
+    "vibe": 7.0,
+    "index": 4.0,
+    "spark": 3.0,
+}
+
+
+class TTSEngineRegistry:
+    """依需求載入 TTS 引擎，並以 LRU 方式在記憶體預算內保留引擎"""
+
+    def __init__(self):
+        self._engines: "OrderedDict[str, Any]" = OrderedDict()  # 已載入的引擎，最久未使用的在前
+        self._memory: Dict[str, float] = {}  # 各引擎記憶體用量（GB）
+        self._in_use: Dict[str, int] = {}
+        self._load_lock = asyncio.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入註冊表參數"""
+        self.enabled = config.is_service_enabled("tts")
+        self.default_provider = config.get_tts_provider()
+        registry_config = config.get("tts.registry", {}) or {}
+        self.memory_budget_gb = registry_config.get("memory_budget_gb", 16)
+        self.engine_memory_gb = {**DEFAULT_ENGINE_MEMORY_GB, **registry_config.get("engine_memory_gb", {})}
+        self.preload = registry_config.get("preload", [self.default_provider])
+
+    def available_providers(self) -> List[str]:
+        """可使用的引擎：tts.<provider>.enabled 為 true 者，加上預設引擎"""
+        if not self.enabled:
+            return []
+        return [
+            name for name in TTS_ENGINES
+            if name == self.default_provider or config.get(f"tts.{name}.enabled", False)
+        ]
+
+    def resolve(self, provider: Optional[str] = None) -> str:
+        """解析請求指定的引擎名稱，不可用時拋出 ValueError"""
+        name = (provider or self.default_provider).lower()
+        if name not in self.available_providers():
+            raise ValueError(f"TTS 引擎不可用: {name}（可用: {', '.join(self.available_providers())}）")
+        return name
+
+    def is_loaded(self, provider: Optional[str] = None) -> bool:
+        name = provider or self.default_provider
+        return name in self._engines
+
+    def is_ready(self, provider: Optional[str] = None) -> bool:
+        service = self._engines.get(provider or self.default_provider)
+        return service is not None and service.is_ready()
+
+    def peek(self, provider: Optional[str] = None) -> Optional[Any]:
+        """取得已載入的引擎（不觸發載入）"""
+        return self._engines.get(provider or self.default_provider)
+
+    async def get(self, provider: Optional[str] = None) -> Any:
+        """取得引擎，尚未載入時載入（必要時先卸載其他閒置引擎）"""
+        name = self.resolve(provider)
+        service = self._engines.get(name)
+        if service is not None:
+            self._engines.move_to_end(name)
+            return service
+
+        async with self._load_lock:
+            service = self._engines.get(name)
+            if service is None:
+                service = await self._load(name)
+            self._engines.move_to_end(name)
+            return service
+
+    @asynccontextmanager
+    async def use(self, provider: Optional[str] = None):
+        """取得引擎並在使用期間標記為使用中（使用中的引擎不會被卸載）
+
+        yield (provider 名稱, 引擎)
+        """
+        name = self.resolve(provider)
+        self._in_use[name] = self._in_use.get(name, 0) + 1
+        try:
+            yield name, await self.get(name)
+        finally:
+            self._in_use[name] -= 1
+
+    def register_instance(self, name: str, service: Any, memory_gb: float = 0.0):
+        """登記已建立的引擎實例（例如基準測試用的替身引擎），不經過匯入與 initialize"""
+        self._engines[name] = service
+        self._memory[name] = memory_gb
+
+    def _gpu_memory_gb(self) -> float:
+        # torch 尚未匯入時不可能有 torch 配置的 GPU 記憶體，也避免在事件迴圈中匯入 torch
+        torch = sys.modules.get("torch")
+        if torch is None or not torch.cuda.is_available():
+            return 0.0
+        return sum(torch.cuda.memory_allocated(i) for i in range(torch.cuda.device_count())) / 1024 ** 3
+
+    def _used_memory_gb(self) -> float:
+        return sum(self._memory.get(name, 0.0) for name in self._engines)
+
+    async def _load(self, name: str) -> Any:
+        estimate = self.engine_memory_gb.get(name, 0.0)
+        self._evict_for(estimate, keep=name)
+
+        print(f"載入 TTS 引擎: {name}...")
+        start_time = time.time()
+        before = self._gpu_memory_gb()
+
+        # 在專屬執行緒中載入，數分鐘的模型載入期間主事件迴圈仍可服務其他請求
+        service = await run_in_thread(lambda: self.create_engine(name))
+        # 登記前先預熱，等待此引擎的請求不會承擔首次呼叫成本
+        await warmup_runner.warm_tts(name, lambda text: call_synthesize(name, service, text))
+
+        measured = self._gpu_memory_gb() - before
+        self._memory[name] = measured if measured > 0.1 else estimate
+        self._engines[name] = service
+        self.loads += 1
+        print(f"TTS 引擎 {name} 載入完成，耗時 {time.time() - start_time:.1f} 秒，"
+              f"記憶體 {self._memory[name]:.1f} GB（總計 {self._used_memory_gb():.1f}/{self.memory_budget_gb} GB）")
+        return service
+
+    async def create_engine(self, name: str) -> Any:
+        """匯入並以配置初始化引擎，不登記到註冊表（基準測試等獨立使用）"""
+        module_name, class_name = TTS_ENGINES[name]
+        with import_timer.track(module_name):
+            module = importlib.import_module(module_name)
+        service = getattr(module, class_name)()
+        # Spark / Index 初始化失敗時回傳 False，BreezyVoice 缺少程式碼時直接返回：一律以 is_ready() 確認
+        initialized = await self._initialize(name, service)
+        if initialized is False or not service.is_ready():
+            if hasattr(service, "cleanup"):
+                service.cleanup()
+            raise Exception(f"TTS 引擎 {name} 初始化失敗")
+        return service
+
+    async def _initialize(self, name: str, service: Any) -> Any:
+        """依引擎呼叫對應的 initialize 參數組合，回傳 initialize 的結果"""
+        tts_config = config.get_tts_config(name)
+        if name == "vibe":
+            model_name = tts_config.get("model_name", "microsoft/VibeVoice-1.5B")
+            return await service.initialize(model_name=model_name)
+        elif name == "breezy":
+            model_repo = tts_config.get("model_repo", "MediaTek-Research/BreezyVoice-300M")
+            # 可以從配置中讀取預設語者設定
+            default_speaker = tts_config.get("default_speaker", {})
+            speaker_voices = None
+            speaker_names = None
+            speaker_transcriptions = None
+            if default_speaker.get("audio_path"):
+                speaker_voices = [default_speaker["audio_path"]]
+                speaker_names = ["default_speaker"]
+                if default_speaker.get("transcription"):
+                    speaker_transcriptions = [default_speaker["transcription"]]
+            return await service.initialize(
+                model_repo=model_repo,
+                speaker_voices=speaker_voices,
+                speaker_names=speaker_names,
+                speaker_transcriptions=speaker_transcriptions
+            )
+        else:
+            return await service.initialize()
+
+    def _evict_for(self, required_gb: float, keep: Optional[str] = None):
+        """卸載最久未使用的閒置引擎，直到放得下 required_gb"""
+        for name in list(self._engines):
+            if self._used_memory_gb() + required_gb <= self.memory_budget_gb:
+                return
+            if name == keep or self._in_use.get(name, 0) > 0:
+                continue
+            self.unload(name)
+        if self._used_memory_gb() + required_gb > self.memory_budget_gb:
+            print(f"警告: TTS 引擎記憶體超出預算（{self._used_memory_gb() + required_gb:.1f}/{self.memory_budget_gb} GB），"
+                  f"其餘引擎使用中無法卸載")
+
+    def unload(self, name: str):
+        """卸載引擎並釋放模型記憶體"""
+        service = self._engines.pop(name, None)
+        if service is None:
+            return
+        self._memory.pop(name, None)
+        if hasattr(service, "cleanup"):
+            service.cleanup()
+        del service
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self.evictions += 1
+        print(f"已卸載 TTS 引擎: {name}")
+
+    async def preload_engines(self):
+        """啟動時預先載入的引擎（預設為 tts.provider）"""
+        for name in self.preload:
+            try:
+                await self.get(name)
+            except ValueError as e:
+                print(f"略過預先載入: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "default_provider": self.default_provider,
+            "available": self.available_providers(),
+            "loaded": list(self._engines),
+            "memory_gb": {name: round(self._memory.get(name, 0.0), 2) for name in self._engines},
+            "memory_budget_gb": self.memory_budget_gb,
+            "in_use": {name: count for name, count in self._in_use.items() if count},
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+async def call_synthesize(name: str, service: Any, text: str, speaker_voice_path: Optional[str] = None,
+                          speaker_id: Optional[str] = None, options: Optional[dict] = None) -> bytes:
+    """依 TTS 引擎呼叫對應的 synthesize 參數組合"""
+    options = options or {}
+    if name == "vibe":
+        return await service.synthesize(
+            text=text,
+            speaker_voice_path=speaker_voice_path,
+            cfg_scale=options.get("cfg_scale", 1.0)
+        )
+    elif name == "breezy":
+        return await service.synthesize(
+            text=text,
+            speaker_voice_path=speaker_voice_path
+        )
+    elif name == "index":
+        return await service.synthesize(
+            text=text,
+            speaker_voice_path=speaker_voice_path,
+            speaker_id=speaker_id
+        )
+    elif name == "spark":
+        return await service.synthesize(
+            text=text,
+            speaker_voice_path=speaker_voice_path,
+            speaker_id=speaker_id,
+            use_voice_cloning=options.get("use_voice_cloning", True),
+            gender=options.get("gender"),
+            pitch=options.get("pitch"),
+            speed=options.get("speed")
+        )
+    return await service.synthesize(text)
+
+
+# 全域 TTS 引擎註冊表
+tts_registry = TTSEngineRegistry()
@@ -0,0 +1,185 @@
+"""
+TTS 引擎路由
+依實測的即時率（RTF）為每個引擎與語者維護線上模型，請求指定 provider="auto" 時，
+依文字長度預估各引擎的合成時間，選擇能在延遲目標內完成的引擎：
+- 預估合成時間 = 文字長度 × 每字音訊秒數 × RTF，兩者皆以指數移動平均更新
+- 啟動時以 tts_test_results 的測試結果作為初始值，之後由每次合成的實測時間修正
+- 預設引擎能達標時優先使用；其他引擎都無法達標或沒有資料時退回預設引擎
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import config
+from app.tts_registry import tts_registry
+from app.metrics import tts_rtf
+from app.warmup import is_warming_up
+
+TTS_AUTO_PROVIDER = "auto"
+
+# 測試結果中的引擎名稱 -> provider
+SEED_ENGINE_NAMES = {
+    "BreezyVoice": "breezy",
+    "VibeVoice": "vibe",
+    "IndexTTS": "index",
+    "Spark-TTS": "spark",
+}
+
+# 引擎層級的統計使用此語者鍵
+ENGINE_KEY = "*"
+
+
+def speaker_key(speaker: Optional[str]) -> str:
+    """語者音檔路徑或語者 ID -> 模型使用的語者鍵"""
+    if not speaker:
+        return "default"
+    return os.path.splitext(os.path.basename(speaker))[0]
+
+
+class RTFModel:
+    """單一 (引擎, 語者) 的 RTF 與每字音訊秒數移動平均"""
+
+    def __init__(self, rtf: float, seconds_per_char: float, samples: int = 1):
+        self.rtf = rtf
+        self.seconds_per_char = seconds_per_char
+        self.samples = samples
+
+    def update(self, rtf: float, seconds_per_char: float, alpha: float):
+        self.rtf += alpha * (rtf - self.rtf)
+        self.seconds_per_char += alpha * (seconds_per_char - self.seconds_per_char)
+        self.samples += 1
+
+    def predict(self, text_length: int) -> float:
+        return text_length * self.seconds_per_char * self.rtf
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rtf": round(self.rtf, 3),
+            "seconds_per_char": round(self.seconds_per_char, 3),
+            "samples": self.samples,
+        }
+
+
+class TTSRouter:
+    """以線上 RTF 模型為 provider="auto" 的請求選擇 TTS 引擎"""
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str], RTFModel] = {}
+        self._lock = threading.Lock()
+        self.routed: Dict[str, int] = {}
+        self.fallbacks = 0
+        self._load_config()
+        self._load_seed()
+
+    def _load_config(self):
+        """從配置文件載入路由參數"""
+        router_config = config.get("tts.router", {}) or {}
+        self.enabled = router_config.get("enabled", True)
+        self.latency_target = router_config.get("latency_target_seconds", 5.0)
+        self.alpha = router_config.get("ewma_alpha", 0.2)
+        # 尚未載入的引擎需先載入模型，預估時間加上此懲罰
+        self.load_penalty = router_config.get("load_penalty_seconds", 30.0)
+        self.seed_results = router_config.get(
+            "seed_results", "./outputs/tts_test_results/tts_test_results_fixed.json"
+        )
+
+    def _load_seed(self):
+        """以離線測試結果初始化模型（檔案不存在時由實測資料逐步建立）"""
+        if not self.seed_results or not os.path.exists(self.seed_results):
+            return
+        try:
+            with open(self.seed_results, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"讀取 TTS 測試結果失敗 {self.seed_results}: {e}")
+            return
+
+        seeded = 0
+        for engine_name, engine_result in results.items():
+            provider = SEED_ENGINE_NAMES.get(engine_name)
+            if provider is None:
+                continue
+            for test in engine_result.get("tests", []):
+                if not test.get("success") or not test.get("text_length") or not test.get("audio_duration"):
+                    continue
+                self._update(provider, test.get("speaker"), test["text_length"],
+                             test["synthesis_time"], test["audio_duration"])
+                seeded += 1
+        if seeded:
+            print(f"TTS 路由已載入 {seeded} 筆測試結果: {self.seed_results}")
+
+    def observe(self, provider: str, speaker: Optional[str], text_length: int,
+                synthesis_time: float, audio_duration: float):
+        """記錄一次合成的實測時間（可在 TTS 執行緒池中呼叫；預熱的冷啟動延遲不列入）"""
+        if is_warming_up():
+            return
+        if audio_duration > 0:
+            tts_rtf.observe(synthesis_time / audio_duration, provider=provider, speaker=speaker_key(speaker))
+        self._update(provider, speaker, text_length, synthesis_time, audio_duration)
+
+    def _update(self, provider: str, speaker: Optional[str], text_length: int,
+                synthesis_time: float, audio_duration: float):
+        if text_length <= 0 or audio_duration <= 0 or synthesis_time <= 0:
+            return
+        rtf = synthesis_time / audio_duration
+        seconds_per_char = audio_duration / text_length
+        with self._lock:
+            for key in ((provider, speaker_key(speaker)), (provider, ENGINE_KEY)):
+                model = self._models.get(key)
+                if model is None:
+                    self._models[key] = RTFModel(rtf, seconds_per_char)
+                else:
+                    model.update(rtf, seconds_per_char, self.alpha)
+
+    def predict(self, provider: str, text_length: int, speaker: Optional[str] = None) -> Optional[float]:
+        """預估合成時間（秒），語者沒有資料時使用引擎整體的模型，都沒有時回傳 None"""
+        with self._lock:
+            model = self._models.get((provider, speaker_key(speaker))) or self._models.get((provider, ENGINE_KEY))
+            return model.predict(text_length) if model else None
+
+    def choose(self, text: str, speaker: Optional[str] = None, latency_target: Optional[float] = None) -> str:
+        """選擇預估能在延遲目標內完成的引擎"""
+        default = tts_registry.default_provider
+        if not self.enabled:
+            return default
+
+        target = latency_target or self.latency_target
+        predictions = {}
+        for name in tts_registry.available_providers():
+            predicted = self.predict(name, len(text), speaker)
+            if predicted is None:
+                continue
+            if not tts_registry.is_loaded(name):
+                predicted += self.load_penalty
+            predictions[name] = predicted
+
+        if default in predictions and predictions[default] <= target:
+            choice = default
+        else:
+            meeting = [name for name, predicted in predictions.items() if predicted <= target]
+            if meeting:
+                choice = min(meeting, key=predictions.get)
+            else:
+                choice = default
+                self.fallbacks += 1
+        self.routed[choice] = self.routed.get(choice, 0) + 1
+        return choice
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models: Dict[str, Dict[str, Any]] = {}
+            for (provider, speaker), model in self._models.items():
+                models.setdefault(provider, {})[speaker] = model.to_dict()
+        return {
+            "enabled": self.enabled,
+            "latency_target_seconds": self.latency_target,
+            "load_penalty_seconds": self.load_penalty,
+            "models": models,
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+        }
+
+
+# 全域 TTS 路由實例
+tts_router = TTSRouter()
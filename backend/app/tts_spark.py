@@ -1,12 +1,23 @@
+import copy
+import io
 import os
 import uuid
 import time
 import sys
 import torch
 import soundfile as sf
-from typing import Optional, List
+from typing import Optional, List, Union
 import shutil
+import re
 from app.config import config
+from app.scheduler import scheduler
+from app.retention import retention_manager
+from app.batching import MicroBatcher
+from app.cancellation import skip_cancelled
+from app.tts_router import tts_router
+from app.audio_utils import wav_duration
+from app.tracing import span
+from app.compile_cache import compile_cache
 
 # 添加 Spark-TTS 路徑
 sys.path.append('/app/Spark-TTS')
@@ -16,6 +27,7 @@ class TTSSparkService:
     def __init__(self):
         self.is_initialized = False
         self.spark_tts = None
+        self._batch_tokenizer = None  # 批次推論專用的 tokenizer 副本（左側 padding）
         
         # 路徑設定
         self.model_dir = "./models/Spark-TTS-0.5B"
@@ -31,6 +43,12 @@ class TTSSparkService:
         # 從配置文件載入參數
         self._load_config()
         
+        # 跨請求微批次：多筆提示合併成一次 LLM generate
+        self.batcher = MicroBatcher.from_config(
+            "Spark-TTS", "tts.spark.batching",
+            lambda items: scheduler.run("tts_spark", skip_cancelled(self._inference_batch_sync), items)
+        )
+        
         # 確保所有必要目錄存在
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.uploads_dir, exist_ok=True)
@@ -57,6 +75,7 @@ class TTSSparkService:
             self.default_prompt_text = default_speaker_config.get("transcription")
         
         print(f"TTS Spark 配置載入: device={self.device}, model_dir={self.model_dir}")
+        scheduler.register_engine("tts_spark", self.device)
         if self.default_speaker_path:
             print(f"預設語者: {self.default_speaker_path}")
             print(f"預設提示文字: {self.default_prompt_text}")
@@ -101,6 +120,10 @@ class TTSSparkService:
                 model_dir=self.model_dir,
                 device=device
             )
+            # 編譯語意 token 生成用的 LLM forward（compile_cache.engines.spark）
+            llm = getattr(self.spark_tts, "model", None)
+            if llm is not None:
+                llm.forward = compile_cache.compile("spark", llm.forward, llm_dir)
             
             self.is_initialized = True
             print(f"Spark-TTS 初始化完成! 使用設備: {device}")
@@ -229,10 +252,6 @@ class TTSSparkService:
                 if not voice_path or not os.path.exists(voice_path):
                     raise Exception(f"語者音檔不存在: {voice_path}")
             
-            # 生成輸出檔名
-            output_filename = f"spark_output_{uuid.uuid4().hex[:8]}.wav"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
             # 記錄使用的模式和參數
             if use_voice_cloning:
                 print(f"開始合成語音 (語者克隆模式)...")
@@ -244,46 +263,21 @@ class TTSSparkService:
                 print(f"文字: {text}")
                 print(f"參數: gender={gender or self.default_gender}, pitch={pitch or self.default_pitch}, speed={speed or self.default_speed}")
             
-            print(f"輸出檔案: {output_path}")
-            
-            # 調用 Spark-TTS 進行推論
-            with torch.no_grad():
-                if use_voice_cloning:
-                    # 語者克隆模式：使用語者音檔，不傳遞 gender/pitch/speed
-                    wav = self.spark_tts.inference(
-                        text,
-                        prompt_speech_path=voice_path,
-                        prompt_text=used_prompt_text,
-                        # 注意：不傳遞 gender, pitch, speed 參數
-                    )
-                else:
-                    # 語音控制模式：使用性別/音調/語速參數，不使用語者音檔
-                    wav = self.spark_tts.inference(
-                        text,
-                        prompt_speech_path=None,  # 不使用語者音檔
-                        prompt_text=None,
-                        gender=gender or self.default_gender,
-                        pitch=pitch or self.default_pitch,
-                        speed=speed or self.default_speed,
-                    )
-                
-                # 保存音頻文件
-                sf.write(output_path, wav, samplerate=16000)
+            # 調用 Spark-TTS 進行推論（於 TTS 執行緒池中執行），音檔直接編碼在記憶體中
+            audio_data = await self._run_inference(
+                text, None, voice_path, used_prompt_text,
+                gender, pitch, speed, use_voice_cloning
+            )
             
-            # 檢查輸出檔案是否存在
-            if not os.path.exists(output_path):
-                raise Exception("語音合成失敗，未產生輸出檔案")
+            if not audio_data:
+                raise Exception("語音合成失敗，未產生音訊")
             
             synthesis_time = time.time() - start_time
             mode_str = "語者克隆" if use_voice_cloning else "語音控制"
             print(f"Spark-TTS 語音合成完成! ({mode_str}模式) 耗時: {synthesis_time:.2f} 秒")
-            
-            # 讀取音檔內容為 bytes（與其他 TTS 引擎保持一致）
-            with open(output_path, "rb") as f:
-                audio_data = f.read()
-            
             print(f"音檔大小: {len(audio_data)} bytes")
-            print(f"音檔儲存於: {output_path}")
+            tts_router.observe("spark", voice_path if use_voice_cloning else "voice_control",
+                               len(text), synthesis_time, wav_duration(audio_data))
             
             return audio_data
             
@@ -293,6 +287,138 @@ class TTSSparkService:
             traceback.print_exc()
             raise e
     
+    async def _run_inference(self, text: str, output_path: Optional[str], voice_path: Optional[str],
+                             prompt_text: Optional[str], gender: Optional[str], pitch: Optional[str],
+                             speed: Optional[str], use_voice_cloning: bool) -> Optional[bytes]:
+        """執行推論，啟用微批次時與其他請求合併
+        
+        output_path 為 None 時回傳 WAV bytes，否則寫入該路徑。
+        """
+        item = (text, output_path, voice_path, prompt_text, gender, pitch, speed, use_voice_cloning)
+        if self.batcher:
+            return await self.batcher.submit(item)
+        return await scheduler.run("tts_spark", self._inference_sync, *item)
+    
+    def _write_wav(self, wav, output_path: Optional[str]) -> Optional[bytes]:
+        """寫入音檔；未指定路徑時在記憶體中編碼並回傳 WAV bytes"""
+        if output_path:
+            with span("tts.file_write", provider="spark"):
+                sf.write(output_path, wav, samplerate=16000)
+            return None
+        with span("tts.wav_encode", provider="spark"):
+            buffer = io.BytesIO()
+            sf.write(buffer, wav, samplerate=16000, format="WAV")
+            return buffer.getvalue()
+    
+    def _inference_sync(self, text: str, output_path: Optional[str], voice_path: Optional[str],
+                        prompt_text: Optional[str], gender: Optional[str], pitch: Optional[str],
+                        speed: Optional[str], use_voice_cloning: bool) -> Optional[bytes]:
+        """同步執行 Spark-TTS 推論並寫入音檔"""
+        with torch.no_grad(), span("tts.generate", provider="spark", text_chars=len(text)):
+            if use_voice_cloning:
+                # 語者克隆模式：使用語者音檔，不傳遞 gender/pitch/speed
+                wav = self.spark_tts.inference(
+                    text,
+                    prompt_speech_path=voice_path,
+                    prompt_text=prompt_text,
+                    # 注意：不傳遞 gender, pitch, speed 參數
+                )
+            else:
+                # 語音控制模式：使用性別/音調/語速參數，不使用語者音檔
+                wav = self.spark_tts.inference(
+                    text,
+                    prompt_speech_path=None,  # 不使用語者音檔
+                    prompt_text=None,
+                    gender=gender or self.default_gender,
+                    pitch=pitch or self.default_pitch,
+                    speed=speed or self.default_speed,
+                )
+        
+        # 保存音頻文件
+        return self._write_wav(wav, output_path)
+    
+    def _get_batch_tokenizer(self):
+        """批次生成需左側 padding，讓所有提示在同一位置結束
+        
+        使用 tokenizer 副本設定 padding，不影響單筆推論共用的 spark.tokenizer。
+        """
+        if self._batch_tokenizer is None:
+            tokenizer = copy.deepcopy(self.spark_tts.tokenizer)
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            self._batch_tokenizer = tokenizer
+        return self._batch_tokenizer
+    
+    def _inference_batch_sync(self, items: List[tuple]) -> List[Union[bytes, None, Exception]]:
+        """同步批次推論：多筆提示 padding 後一次 generate，再逐筆解碼寫檔
+        
+        重現 SparkTTS.inference 的流程，差別在於 tokenizer 與 generate 一次處理整批。
+        回傳與 items 等長的列表，成功為 WAV bytes（寫檔時為 None），失敗為 Exception。
+        """
+        spark = self.spark_tts
+        results: List[Union[bytes, None, Exception]] = [None] * len(items)
+        prompts = []
+        global_ids = []
+        batch_indices = []
+        for i, (text, _, voice_path, prompt_text, gender, pitch, speed, use_voice_cloning) in enumerate(items):
+            # 單筆提示失敗（例如語者音檔無法讀取）只影響該筆，其餘照常送入 generate
+            try:
+                if use_voice_cloning:
+                    prompt, global_token_ids = spark.process_prompt(text, voice_path, prompt_text)
+                else:
+                    prompt = spark.process_prompt_control(
+                        gender or self.default_gender,
+                        pitch or self.default_pitch,
+                        speed or self.default_speed,
+                        text
+                    )
+                    global_token_ids = None  # 語音控制模式由模型生成 global tokens
+            except Exception as e:
+                print(f"Spark-TTS 批次項目提示處理失敗: {e}")
+                results[i] = e
+                continue
+            prompts.append(prompt)
+            global_ids.append(global_token_ids)
+            batch_indices.append(i)
+        if not prompts:
+            return results
+        
+        tokenizer = self._get_batch_tokenizer()
+        model_inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(spark.device)
+        
+        with torch.no_grad():
+            generated_ids = spark.model.generate(
+                **model_inputs,
+                max_new_tokens=3000,
+                do_sample=True,
+                top_k=50,
+                top_p=0.95,
+                temperature=0.8,
+            )
+        generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+        predicts = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+        
+        for i, predict, global_token_ids in zip(batch_indices, predicts, global_ids):
+            try:
+                pred_semantic_ids = torch.tensor(
+                    [int(token) for token in re.findall(r"bicodec_semantic_(\d+)", predict)]
+                ).long().unsqueeze(0)
+                if global_token_ids is None:
+                    global_token_ids = torch.tensor(
+                        [int(token) for token in re.findall(r"bicodec_global_(\d+)", predict)]
+                    ).long().unsqueeze(0).unsqueeze(0)
+                with torch.no_grad():
+                    wav = spark.audio_tokenizer.detokenize(
+                        global_token_ids.to(spark.device).squeeze(0),
+                        pred_semantic_ids.to(spark.device),
+                    )
+                results[i] = self._write_wav(wav, items[i][1])
+            except Exception as e:
+                print(f"Spark-TTS 批次項目失敗: {e}")
+                results[i] = e
+        return results
+    
     async def synthesize_with_speaker_file(self, text: str, speaker_file_path: str, 
                                           prompt_text: str = None, use_voice_cloning: bool = True) -> bytes:
         """使用指定語者檔案合成語音
@@ -364,29 +490,11 @@ class TTSSparkService:
             
             print(f"輸出檔案: {output_path}")
             
-            # 調用 Spark-TTS 進行推論
-            with torch.no_grad():
-                if use_voice_cloning:
-                    # 語者克隆模式：使用語者音檔，不傳遞 gender/pitch/speed
-                    wav = self.spark_tts.inference(
-                        text,
-                        prompt_speech_path=voice_path,
-                        prompt_text=used_prompt_text,
-                        # 注意：不傳遞 gender, pitch, speed 參數
-                    )
-                else:
-                    # 語音控制模式：使用性別/音調/語速參數，不使用語者音檔
-                    wav = self.spark_tts.inference(
-                        text,
-                        prompt_speech_path=None,  # 不使用語者音檔
-                        prompt_text=None,
-                        gender=gender or self.default_gender,
-                        pitch=pitch or self.default_pitch,
-                        speed=speed or self.default_speed,
-                    )
-                
-                # 保存音頻文件
-                sf.write(output_path, wav, samplerate=16000)
+            # 調用 Spark-TTS 進行推論（於 TTS 執行緒池中執行）
+            await self._run_inference(
+                text, output_path, voice_path, used_prompt_text,
+                gender, pitch, speed, use_voice_cloning
+            )
             
             # 檢查輸出檔案是否存在
             if not os.path.exists(output_path):
@@ -396,6 +504,7 @@ class TTSSparkService:
             mode_str = "語者克隆" if use_voice_cloning else "語音控制"
             print(f"Spark-TTS 語音合成到檔案完成! ({mode_str}模式) 耗時: {synthesis_time:.2f} 秒")
             print(f"檔案路徑: {output_path}")
+            retention_manager.register(output_path)
             
             return output_path
             
@@ -415,6 +524,7 @@ class TTSSparkService:
                 if hasattr(self.spark_tts, 'audio_tokenizer'):
                     self.spark_tts.audio_tokenizer = None
                 self.spark_tts = None
+            self._batch_tokenizer = None
             self.is_initialized = False
             print("Spark-TTS 資源清理完成")
         except Exception as e:
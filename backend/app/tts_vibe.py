@@ -1,10 +1,21 @@
+import io
 import os
 import uuid
 import time
 from typing import Optional, List
 import torch
+import soundfile as sf
 from huggingface_hub import snapshot_download
 from app.config import config
+from app.scheduler import scheduler
+from app.retention import retention_manager
+from app.batching import MicroBatcher
+from app.cancellation import check_cancelled, skip_cancelled
+from app.tts_router import tts_router
+from app.metrics import cache_requests
+from app.tracing import span
+from app.compile_cache import compile_cache
+from app.warmup import is_warming_up
 
 from vibevoice.modular.modeling_vibevoice_inference import VibeVoiceForConditionalGenerationInference
 from vibevoice.processor.vibevoice_processor import VibeVoiceProcessor
@@ -28,6 +39,7 @@ class TTSVibeService:
         tts_config = config.get_tts_config("vibe")
         self.device = tts_config.get("device", "cuda:1" if torch.cuda.is_available() else "cpu")
         print(f"TTS Vibe 配置載入: device={self.device}")
+        scheduler.register_engine("tts_vibe", self.device)
         
         self.voices_dir = "./voices"
         
@@ -35,6 +47,11 @@ class TTSVibeService:
         self.speakers = {}  # {speaker_id: {"name": str, "path": str, "processed": bool}}
         self.speaker_cache = {}  # 緩存處理過的語者特徵
         
+        # 跨請求微批次（同一批次需共用 cfg_scale）
+        self.batcher = MicroBatcher.from_config(
+            "VibeVoice", "tts.vibe.batching", self._run_batch, key_fn=lambda item: item[2]
+        )
+        
         # 確保所有必要目錄存在
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.uploads_dir, exist_ok=True)
@@ -91,6 +108,8 @@ class TTSVibeService:
             
             self.model.eval()
             self.model.set_ddpm_inference_steps(num_steps=10)
+            # generate() 經由 self(...) 呼叫 forward，編譯 forward 即可（compile_cache.engines.vibe）
+            self.model.forward = compile_cache.compile("vibe", self.model.forward, self.model_path)
             
             # 設定固定語者
             await self._setup_speakers(speaker_voices, speaker_names)
@@ -261,21 +280,25 @@ class TTSVibeService:
             
             # 檢查是否已在快取中
             cache_key = f"{text}:{final_voice_path}:{cfg_scale}"
-            if cache_key in self.speaker_cache:
+            use_cache = not is_warming_up()  # 預熱不讀寫快取，否則穩態各次會直接命中
+            if use_cache and cache_key in self.speaker_cache:
+                cache_requests.inc(cache="speaker_cache", provider="vibe", result="hit")
                 print("使用快取的語音")
                 return self.speaker_cache[cache_key]
             
+            if use_cache:
+                cache_requests.inc(cache="speaker_cache", provider="vibe", result="miss")
             # 合成語音
             print(f"合成文本: {text}")
             audio_data = await self._run_synthesis(text, final_voice_path, cfg_scale, save_file=False)
             
             # 加入快取（限制快取大小避免記憶體溢出）
-            if len(self.speaker_cache) >= 50:  # 最多快取50個結果
-                # 刪除最舊的快取項目
-                oldest_key = next(iter(self.speaker_cache))
-                del self.speaker_cache[oldest_key]
-            
-            self.speaker_cache[cache_key] = audio_data
+            if use_cache:
+                if len(self.speaker_cache) >= 50:  # 最多快取50個結果
+                    # 刪除最舊的快取項目
+                    oldest_key = next(iter(self.speaker_cache))
+                    del self.speaker_cache[oldest_key]
+                self.speaker_cache[cache_key] = audio_data
             
             return audio_data
             
@@ -316,14 +339,36 @@ class TTSVibeService:
         print(f"文字: {text}")
         print(f"CFG Scale: {cfg_scale}")
         
-        # 準備輸入
-        inputs = self.processor(
-            text=[formatted_text],
-            voice_samples=[[voice_path]],
-            padding=True,
-            return_tensors="pt",
-            return_attention_mask=True,
-        )
+        item = (formatted_text, voice_path, cfg_scale, max_new_tokens, save_file, text_length)
+        if self.batcher:
+            # 與同時間窗內的其他請求合併成一次批次推論
+            return await self.batcher.submit(item)
+        
+        # 模型推論與存檔於 TTS 執行緒池中執行，避免阻塞事件迴圈
+        results = await scheduler.run("tts_vibe", self._run_batch_sync, [item])
+        if isinstance(results[0], Exception):
+            raise results[0]
+        return results[0]
+
+    async def _run_batch(self, items: List[tuple]) -> List:
+        """微批次回呼：整批送進排程器執行一次 generate"""
+        return await scheduler.run("tts_vibe", skip_cancelled(self._run_batch_sync), items)
+
+    def _run_batch_sync(self, items: List[tuple]) -> List:
+        """同步執行 VibeVoice 批次生成，回傳與 items 等長的音檔 bytes（失敗項目為 Exception）
+        
+        items: [(formatted_text, voice_path, cfg_scale, max_new_tokens, save_file, text_length), ...]
+        同一批次共用 cfg_scale，max_new_tokens 取最大值
+        """
+        # 準備輸入（processor 支援多筆文字與語者並自動 padding）
+        with span("tts.preprocess", provider="vibe"):
+            inputs = self.processor(
+                text=[item[0] for item in items],
+                voice_samples=[[item[1]] for item in items],
+                padding=True,
+                return_tensors="pt",
+                return_attention_mask=True,
+            )
         
         # 移動到指定設備
         target_device = self.device if "cuda" in self.device else "cpu"
@@ -340,8 +385,66 @@ class TTSVibeService:
         
         # 生成語音 - 使用優化的參數
         start_time = time.time()
+        cfg_scale = items[0][2]
+        max_new_tokens = max(item[3] for item in items)
+        with span("tts.generate", provider="vibe", batch_size=len(items)):
+            outputs = self._generate_sync(inputs, max_new_tokens, cfg_scale, generation_config)
+        
+        generation_time = time.time() - start_time
+        if len(items) > 1:
+            print(f"批次生成 {len(items)} 筆，生成時間: {generation_time:.2f} 秒")
+        
+        speech_outputs = outputs.speech_outputs or []
+        results = []
+        for i, item in enumerate(items):
+            speech = speech_outputs[i] if i < len(speech_outputs) else None
+            if speech is None:
+                results.append(Exception("TTS 未生成音頻輸出"))
+                continue
+            results.append(self._save_speech_output(speech, generation_time, save_file=item[4]))
+            # 回報實測時間給 TTS 路由；批次的生成時間由整批共用，無法歸給單一語者，不列入
+            if len(items) == 1:
+                tts_router.observe("vibe", item[1], item[5], generation_time, speech.shape[-1] / 24000)
+        return results
+
+    def _save_speech_output(self, speech, generation_time: float, save_file: bool) -> bytes:
+        """將單筆生成結果存成 WAV 並回傳 bytes"""
+        # 計算音頻時長
+        sample_rate = 24000  # VibeVoice 使用 24kHz
+        audio_samples = speech.shape[-1] if len(speech.shape) > 0 else len(speech)
+        audio_duration = audio_samples / sample_rate
+        rtf = generation_time / audio_duration if audio_duration > 0 else float('inf')
+        
+        print(f"生成時間: {generation_time:.2f} 秒")
+        print(f"音頻時長: {audio_duration:.2f} 秒")
+        print(f"RTF: {rtf:.2f}x")
+        
+        if save_file is False:
+            # 直接在記憶體中編碼，不經過暫存檔
+            with span("tts.wav_encode", provider="vibe"):
+                buffer = io.BytesIO()
+                waveform = speech.detach().float().cpu().numpy().squeeze()
+                sf.write(buffer, waveform, sample_rate, format="WAV")
+                audio_data = buffer.getvalue()
+        else:
+            output_filename = f"tts_output_{uuid.uuid4().hex[:8]}.wav"
+            output_path = os.path.join(self.output_dir, output_filename)
+            with span("tts.file_write", provider="vibe"):
+                self.processor.save_audio(
+                    speech,
+                    output_path=output_path,
+                )
+                with open(output_path, "rb") as f:
+                    audio_data = f.read()
+            retention_manager.register(output_path, size=len(audio_data))
+            print(f"TTS 合成完成，音檔路徑: {output_path}")
+        print(f"TTS 合成完成，音檔大小: {len(audio_data)} bytes")
+        return audio_data
+
+    def _generate_sync(self, inputs: dict, max_new_tokens: Optional[int], cfg_scale: float, generation_config: dict):
+        """呼叫 model.generate（同步，須在執行緒池中呼叫）"""
         with torch.no_grad():
-            outputs = self.model.generate(
+            return self.model.generate(
                 **inputs,
                 max_new_tokens=max_new_tokens,  # 限制生成長度
                 cfg_scale=cfg_scale,
@@ -349,47 +452,6 @@ class TTSVibeService:
                 generation_config=generation_config,
                 verbose=False,
             )
-        
-        generation_time = time.time() - start_time
-        
-        # 檢查輸出
-        if outputs.speech_outputs and outputs.speech_outputs[0] is not None:
-            # 計算音頻時長
-            sample_rate = 24000  # VibeVoice 使用 24kHz
-            audio_samples = outputs.speech_outputs[0].shape[-1] if len(outputs.speech_outputs[0].shape) > 0 else len(outputs.speech_outputs[0])
-            audio_duration = audio_samples / sample_rate
-            rtf = generation_time / audio_duration if audio_duration > 0 else float('inf')
-            
-            print(f"生成時間: {generation_time:.2f} 秒")
-            print(f"音頻時長: {audio_duration:.2f} 秒")
-            print(f"RTF: {rtf:.2f}x")
-            
-            # 準備暫存檔案路徑
-            output_filename = f"tts_output_{uuid.uuid4().hex[:8]}.wav"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            # 儲存音頻到暫存檔案
-            self.processor.save_audio(
-                outputs.speech_outputs[0],
-                output_path=output_path,
-            )
-            
-            # 讀取音檔內容為 bytes
-            with open(output_path, "rb") as f:
-                audio_data = f.read()
-            
-            # 清理暫存檔案
-            if save_file is False:
-                try:
-                    os.remove(output_path)
-                except:
-                    pass  # 忽略清理錯誤
-            else:
-                print(f"TTS 合成完成，音檔路徑: {output_path}")
-            print(f"TTS 合成完成，音檔大小: {len(audio_data)} bytes")
-            return audio_data
-        else:
-            raise Exception("TTS 未生成音頻輸出")
 
     async def synthesize_conversation(self, conversation_text: str, cfg_scale: float = 1.0) -> str:
         """合成對話格式的語音
@@ -425,17 +487,10 @@ class TTSVibeService:
                 return_attention_mask=True,
             )
             
-            # 生成語音
+            # 生成語音（於 TTS 執行緒池中執行）
             start_time = time.time()
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=None,
-                    cfg_scale=cfg_scale,
-                    tokenizer=self.processor.tokenizer,
-                    generation_config={'do_sample': False},
-                    verbose=False,
-                )
+            with span("tts.generate", provider="vibe", mode="conversation"):
+                outputs = await scheduler.run("tts_vibe", self._generate_sync, inputs, None, cfg_scale, {'do_sample': False})
             
             generation_time = time.time() - start_time
             
@@ -452,12 +507,14 @@ class TTSVibeService:
                 print(f"RTF: {rtf:.2f}x")
                 
                 # 儲存音頻
-                self.processor.save_audio(
-                    outputs.speech_outputs[0],
-                    output_path=output_path,
-                )
+                with span("tts.file_write", provider="vibe"):
+                    self.processor.save_audio(
+                        outputs.speech_outputs[0],
+                        output_path=output_path,
+                    )
                 
                 print(f"對話合成完成: {output_path}")
+                retention_manager.register(output_path)
                 return output_path
             else:
                 raise Exception("TTS 未生成音頻輸出")
@@ -490,17 +547,8 @@ class TTSVibeService:
         
         print(f"已更新語者音檔: {len(speaker_voices)} 個語者")
 
-    async def _synthesize_long_text(self, text: str, speaker_voice_path: Optional[str], cfg_scale: float) -> bytes:
-        """處理長文字的分段合成
-        
-        Args:
-            text: 長文字內容
-            speaker_voice_path: 語者音檔路徑
-            cfg_scale: CFG 參數
-            
-        Returns:
-            bytes: 合併後的音檔內容
-        """
+    def split_text(self, text: str) -> List[str]:
+        """按標點符號將長文字切成段落，每段保持在 100 字元內（也供 /tts 串流使用）"""
         import re
         
         # 按標點符號分段，但保持合理長度
@@ -525,11 +573,28 @@ class TTSVibeService:
         if current_segment:
             segments.append(current_segment.rstrip("。"))
         
+        return segments
+
+    async def _synthesize_long_text(self, text: str, speaker_voice_path: Optional[str], cfg_scale: float) -> bytes:
+        """處理長文字的分段合成
+        
+        Args:
+            text: 長文字內容
+            speaker_voice_path: 語者音檔路徑
+            cfg_scale: CFG 參數
+            
+        Returns:
+            bytes: 合併後的音檔內容
+        """
+        segments = self.split_text(text)
+        
         print(f"文字分為 {len(segments)} 段處理")
         
         # 為每段合成音檔
         audio_segments = []
         for i, segment in enumerate(segments):
+            # 客戶端已斷線時不再合成後續段落
+            check_cancelled()
             print(f"處理第 {i+1}/{len(segments)} 段: {segment[:30]}...")
             # 使用 save_file=True 避免遞迴分段
             audio_data = await self.synthesize(segment, speaker_voice_path, cfg_scale * 0.9, save_file=True)
@@ -0,0 +1,169 @@
+"""
+模型預熱
+部署後的第一個請求原本要承擔 CUDA 核心選擇、記憶體配置器擴張與 tokenizer 初始化等一次性成本。
+各服務載入後、標記為就緒前，以合成輸入依多種長度各跑數次：
+- STT：合成音訊（預設 1 / 5 / 15 秒，可改用 warmup.stt_audio_path 的音檔），啟用微批次時另跑一次滿批次
+- LLM：短 / 中 / 長提示
+- TTS：短 / 中 / 長文字，由註冊表在每個引擎載入後執行，延遲載入的引擎同樣會先預熱再開始服務
+- 每種長度第一次（冷）與之後各次（穩態）的延遲記錄在 warmup_latency_seconds{phase="first"|"steady"}，
+  各引擎的總預熱時間由 warmup_duration_seconds 提供
+STT / LLM 預熱直接以同步推論函式送進排程器，不計入各服務的延遲指標，也不會留下對話歷史；
+TTS 預熱經過各引擎的 synthesize，預熱期間（is_warming_up()）不更新 TTS 路由的 RTF 模型與指標，
+也不讀寫語者快取（冷啟動的延遲不會影響路由，穩態各次也不會直接命中快取）。
+"""
+import contextvars
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import config
+from app.metrics import warmup_latency
+from app.scheduler import scheduler
+
+DEFAULT_LLM_PROMPTS = [
+    "你好",
+    "請用一句話介紹你自己。",
+    "請簡單說明語音辨識、大型語言模型與語音合成如何組成一個即時語音對話系統，並各舉一個可能的延遲來源。",
+]
+
+DEFAULT_TTS_TEXTS = [
+    "你好",
+    "今天天氣很好，適合出門走走。",
+    "語音合成的速度通常以即時率來衡量，也就是合成所需的時間除以產生音訊的長度，數值越低代表越快。",
+]
+
+WarmupInput = Tuple[str, Callable[[], Awaitable[Any]]]
+
+# 預熱進行中的旗標，隨上下文進入排程器與推論執行緒
+_warming_up: contextvars.ContextVar = contextvars.ContextVar("warming_up", default=False)
+
+
+def is_warming_up() -> bool:
+    """目前呼叫是否來自預熱（各服務據此略過路由觀測、指標與快取）"""
+    return _warming_up.get()
+
+
+def synthetic_speech(seconds: float, sample_rate: int = 16000) -> np.ndarray:
+    """類語音的合成訊號：基頻約 150 Hz 的諧波，以每秒約 4 個音節的包絡調變，加上少量雜訊"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 150 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.3 * voice * envelope / 2 + noise).astype(np.float32)
+
+
+class WarmupRunner:
+    """以合成輸入預熱各推論服務，並記錄冷 / 穩態延遲"""
+
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._load_config()
+
+    def _load_config(self):
+        """從配置文件載入預熱參數"""
+        warmup_config = config.get("warmup", {}) or {}
+        self.enabled = warmup_config.get("enabled", True)
+        self.steady_runs = warmup_config.get("steady_runs", 2)
+        self.stt_durations = warmup_config.get("stt_durations_seconds", [1, 5, 15])
+        self.stt_audio_path = warmup_config.get("stt_audio_path")
+        self.llm_prompts = warmup_config.get("llm_prompts") or DEFAULT_LLM_PROMPTS
+        self.tts_texts = warmup_config.get("tts_texts") or DEFAULT_TTS_TEXTS
+
+    async def run(self, engine: str, inputs: List[WarmupInput]):
+        """依序執行各長度的預熱輸入：每種長度先冷跑一次，再跑 steady_runs 次（失敗只記錄，不影響載入）"""
+        if not self.enabled or not inputs:
+            return
+        print(f"正在預熱 {engine}...")
+        start_time = time.time()
+        lengths = {}
+        warming_token = _warming_up.set(True)
+        try:
+            for label, call in inputs:
+                entry = await self._run_length(engine, label, call)
+                if entry is not None:
+                    lengths[label] = entry
+        finally:
+            _warming_up.reset(warming_token)
+        duration = time.time() - start_time
+        self.results[engine] = {"duration_seconds": round(duration, 2), "lengths": lengths}
+        print(f"{engine} 預熱完成，耗時 {duration:.1f} 秒")
+
+    async def _run_length(self, engine: str, label: str, call: Callable[[], Awaitable[Any]]) -> Optional[Dict[str, Any]]:
+        """同一長度冷跑一次再跑 steady_runs 次，回傳冷 / 穩態延遲（全部失敗時為 None）"""
+        latencies = []
+        for run in range(1 + self.steady_runs):
+            run_start = time.time()
+            try:
+                await call()
+            except Exception as e:
+                print(f"  {engine} 預熱失敗（{label}）: {e}")
+                break
+            latency = time.time() - run_start
+            latencies.append(latency)
+            warmup_latency.observe(latency, engine=engine, length=label, phase="first" if run == 0 else "steady")
+        if not latencies:
+            return None
+        steady = statistics.median(latencies[1:]) if len(latencies) > 1 else None
+        print(f"  {engine} {label:<8} 首次 {latencies[0]:.2f} 秒"
+              + (f"，穩態 {steady:.2f} 秒" if steady is not None else ""))
+        return {
+            "first_seconds": round(latencies[0], 3),
+            "steady_seconds": round(steady, 3) if steady is not None else None,
+            "first_to_steady": round(latencies[0] / steady, 2) if steady else None,
+        }
+
+    async def warm_stt(self, service):
+        """STT：各長度的合成音訊走單筆辨識流程；啟用微批次時另以滿批次跑一次批次解碼"""
+        sample_rate = 16000
+        if self.stt_audio_path:
+            source = service._load_audio(self.stt_audio_path, None)
+        else:
+            source = synthetic_speech(max(self.stt_durations, default=1), sample_rate)
+
+        def clip(seconds: float) -> np.ndarray:
+            samples = int(seconds * sample_rate)
+            return np.resize(source, samples)  # 音檔不夠長時重複填滿
+
+        inputs: List[WarmupInput] = [
+            (f"{seconds}s", lambda audio=clip(seconds): scheduler.run("stt", service._transcribe_sync, audio, sample_rate))
+            for seconds in self.stt_durations
+        ]
+        if service.batcher and service.batcher.max_batch_size > 1:
+            batch = [(clip(min(self.stt_durations, default=1)), sample_rate)] * service.batcher.max_batch_size
+            inputs.append((f"batch{len(batch)}", lambda: scheduler.run("stt", service._transcribe_batch_sync, batch)))
+        await self.run("stt", inputs)
+
+    async def warm_llm(self, chat_service):
+        """LLM：短 / 中 / 長提示，不帶對話歷史"""
+        if chat_service.llm_chat is None:
+            return  # 簡單回覆模式沒有模型可預熱
+        inputs: List[WarmupInput] = [
+            (f"{len(prompt)}chars", lambda prompt=prompt: scheduler.run(
+                "llm", chat_service.llm_chat.chat, query=prompt, history=[], system=chat_service.SYSTEM_PROMPT
+            ))
+            for prompt in self.llm_prompts
+        ]
+        await self.run("llm", inputs)
+
+    async def warm_tts(self, name: str, synthesize: Callable[[str], Awaitable[bytes]]):
+        """TTS：以引擎預設語者合成短 / 中 / 長文字（synthesize 由註冊表提供）"""
+        inputs: List[WarmupInput] = [
+            (f"{len(text)}chars", lambda text=text: synthesize(text))
+            for text in self.tts_texts
+        ]
+        await self.run(f"tts_{name}", inputs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "steady_runs": self.steady_runs,
+            "engines": self.results,
+        }
+
+
+# 全域預熱執行器
+warmup_runner = WarmupRunner()
@@ -0,0 +1,3 @@
+"""
+效能基準測試工具（不含於服務本身，於 backend 目錄下以 python -m benchmarks.<name> 執行）
+"""
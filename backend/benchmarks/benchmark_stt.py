@@ -0,0 +1,259 @@
+"""
+STT 速度／準確度基準測試
+對一個資料夾的音檔（例如 local_voice）以多組解碼設定執行 STTService，回報 RTF、吞吐量與字錯誤率（CER）：
+- 設定矩陣：beam size × compute_type × 批次大小 × VAD 開關
+- 批次大小 1 走單筆辨識流程（_transcribe_audio_sync），大於 1 走跨請求批次流程（_transcribe_batch_sync）；
+  VAD 與 best_of 只作用於單筆辨識，因此 VAD 開啟時只測批次大小 1
+- 參考逐字稿：--references 指定的 JSON（{檔名: 文字}）或 TSV（檔名<TAB>文字），否則讀取同名 .txt；
+  比對前兩邊都經 OpenCC 轉為繁體並去除標點與空白
+
+用法（於 backend 目錄）：
+    python -m benchmarks.benchmark_stt --audio-dir ./local_voice --beam-sizes 1,5 --batch-sizes 1,8 --vad off,on
+    python -m benchmarks.benchmark_stt --compute-types float16,int8_float16 --output stt_benchmark.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import soundfile as sf
+
+from app.stt import STTService
+from benchmarks.stats import summarize
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".ogg")
+
+
+def normalize_text(text: str, converter) -> str:
+    """CER 比對用：轉繁體、去除標點符號與空白、英文轉小寫"""
+    text = converter.convert(text).lower()
+    return "".join(c for c in text if unicodedata.category(c)[0] not in ("P", "Z", "S", "C"))
+
+
+def edit_distance(reference: str, hypothesis: str) -> int:
+    """字元層級 Levenshtein 距離"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(
+                previous[j] + 1,  # 刪除
+                current[j - 1] + 1,  # 插入
+                previous[j - 1] + (ref_char != hyp_char),  # 替換
+            ))
+        previous = current
+    return previous[-1]
+
+
+def load_references(audio_dir: str, references_path: Optional[str]) -> Dict[str, str]:
+    """讀取參考逐字稿，key 為不含副檔名的檔名"""
+    references: Dict[str, str] = {}
+    if references_path:
+        with open(references_path, "r", encoding="utf-8") as f:
+            if references_path.endswith(".json"):
+                items = json.load(f).items()
+            else:
+                items = [line.rstrip("\n").split("\t", 1) for line in f if "\t" in line]
+        for name, text in items:
+            references[os.path.splitext(os.path.basename(name))[0]] = text.strip()
+        return references
+
+    for filename in os.listdir(audio_dir):
+        stem, ext = os.path.splitext(filename)
+        if ext == ".txt":
+            with open(os.path.join(audio_dir, filename), "r", encoding="utf-8") as f:
+                references[stem] = f.read().strip()
+    return references
+
+
+def load_corpus(audio_dir: str, references: Dict[str, str]) -> List[Dict[str, Any]]:
+    """列出音檔與長度（依檔名排序，結果可重現）"""
+    corpus = []
+    for filename in sorted(os.listdir(audio_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        path = os.path.join(audio_dir, filename)
+        try:
+            info = sf.info(path)
+            duration = info.frames / info.samplerate
+        except Exception:
+            duration = None  # soundfile 無法讀取的格式（例如 m4a），辨識後由 Whisper 回報長度
+        corpus.append({"name": stem, "path": path, "duration": duration, "reference": references.get(stem)})
+    return corpus
+
+
+def build_settings(args) -> List[Dict[str, Any]]:
+    settings = []
+    for compute_type in args.compute_types:
+        for beam_size in args.beam_sizes:
+            for batch_size in args.batch_sizes:
+                for vad in args.vad:
+                    if vad and batch_size > 1:
+                        continue  # 批次流程沒有 VAD
+                    settings.append({"compute_type": compute_type, "beam_size": beam_size,
+                                     "batch_size": batch_size, "vad_filter": vad})
+    return settings
+
+
+def run_setting(service: STTService, corpus: List[Dict[str, Any]], setting: Dict[str, Any],
+                best_of: int) -> Tuple[List[Dict[str, Any]], float]:
+    """以單一設定辨識整個語料，回傳逐檔結果與總牆鐘時間"""
+    service.beam_size = setting["beam_size"]
+    service.best_of = max(best_of, setting["beam_size"])
+    service.vad_filter = setting["vad_filter"]
+    batch_size = setting["batch_size"]
+
+    # 預熱：第一次呼叫包含 CUDA 核心初始化，不列入統計
+    service._transcribe_audio_sync(corpus[0]["path"])
+
+    results = []
+    total_start = time.perf_counter()
+    for start in range(0, len(corpus), batch_size):
+        chunk = corpus[start:start + batch_size]
+        batch_start = time.perf_counter()
+        if batch_size == 1:
+            try:
+                texts = [service._transcribe_audio_sync(chunk[0]["path"])]
+            except Exception as e:
+                texts = [e]
+        else:
+            texts = service._transcribe_batch_sync([(item["path"], None) for item in chunk])
+        latency = time.perf_counter() - batch_start
+        # 批次中的每個請求都要等整批完成，延遲以整批時間計
+        for item, text in zip(chunk, texts):
+            results.append({"name": item["name"], "latency": latency, "text": text})
+    return results, time.perf_counter() - total_start
+
+
+def score(corpus: List[Dict[str, Any]], results: List[Dict[str, Any]], wall_time: float,
+          converter) -> Dict[str, Any]:
+    """彙整 RTF、吞吐量與 CER"""
+    audio_seconds = sum(item["duration"] or 0.0 for item in corpus)
+    errors = 0
+    reference_chars = 0
+    failures = 0
+    files = []
+    for item, result in zip(corpus, results):
+        text = result["text"]
+        if isinstance(text, Exception):
+            failures += 1
+            files.append({"name": item["name"], "error": str(text)})
+            continue
+        entry = {"name": item["name"], "latency": round(result["latency"], 4), "text": text}
+        if item["reference"]:
+            reference = normalize_text(item["reference"], converter)
+            distance = edit_distance(reference, normalize_text(text, converter))
+            errors += distance
+            reference_chars += len(reference)
+            entry["cer"] = round(distance / len(reference), 4) if reference else None
+        files.append(entry)
+
+    latencies = [result["latency"] for result in results if not isinstance(result["text"], Exception)]
+    return {
+        "files": len(corpus),
+        "failures": failures,
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall_time, 3),
+        "rtf": round(wall_time / audio_seconds, 4) if audio_seconds else None,
+        "throughput_x_realtime": round(audio_seconds / wall_time, 2) if wall_time else None,
+        "files_per_second": round(len(corpus) / wall_time, 2) if wall_time else None,
+        "cer": round(errors / reference_chars, 4) if reference_chars else None,
+        "latency": summarize(latencies),
+        "details": files,
+    }
+
+
+async def load_model(service: STTService, compute_type: str):
+    service.compute_type = compute_type
+    service.model = None
+    start_time = time.time()
+    await service.initialize()
+    print(f"模型 {service.model_name}（compute_type={compute_type}）載入耗時 {time.time() - start_time:.1f} 秒")
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    references = load_references(args.audio_dir, args.references)
+    corpus = load_corpus(args.audio_dir, references)
+    if args.limit:
+        corpus = corpus[:args.limit]
+    if not corpus:
+        raise FileNotFoundError(f"{args.audio_dir} 中沒有音檔")
+    print(f"語料: {len(corpus)} 個音檔，其中 {sum(1 for item in corpus if item['reference'])} 個有參考逐字稿")
+
+    service = STTService()
+    service.batcher = None  # 直接呼叫同步流程，批次大小由本工具控制
+    runs = []
+    loaded_compute_type = None
+    for setting in build_settings(args):
+        if setting["compute_type"] != loaded_compute_type:
+            await load_model(service, setting["compute_type"])
+            loaded_compute_type = setting["compute_type"]
+        results, wall_time = run_setting(service, corpus, setting, args.best_of)
+        # 無法由檔頭讀出長度的音檔，以重新解碼的長度補上（只做一次）
+        for item in corpus:
+            if item["duration"] is None:
+                item["duration"] = len(service._load_audio(item["path"], None)) / service.model.feature_extractor.sampling_rate
+        result = {**setting, **score(corpus, results, wall_time, service.converter)}
+        runs.append(result)
+        print_row(result)
+
+    return {
+        "model": service.model_name,
+        "device": service.device,
+        "audio_dir": args.audio_dir,
+        "runs": runs,
+    }
+
+
+def print_row(result: Dict[str, Any]):
+    cer = f"{result['cer']:.2%}" if result["cer"] is not None else "-"
+    print(f"{result['compute_type']:<14} beam {result['beam_size']:<2} batch {result['batch_size']:<3} "
+          f"vad {'on ' if result['vad_filter'] else 'off'}  RTF {result['rtf'] or 0:.3f}  "
+          f"{result['throughput_x_realtime'] or 0:>6.1f}x  {result['files_per_second'] or 0:>6.2f} 檔/秒  "
+          f"p95 {result['latency'].get('p95', 0):.2f} 秒  CER {cer}  失敗 {result['failures']}")
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="STT 速度與準確度基準測試")
+    parser.add_argument("--audio-dir", default="./local_voice", help="音檔資料夾")
+    parser.add_argument("--references", help="參考逐字稿（JSON 或 TSV），未指定時讀取同名 .txt")
+    parser.add_argument("--beam-sizes", default="1,5")
+    parser.add_argument("--best-of", type=int, default=5, help="單筆辨識的 best_of（不小於 beam size）")
+    parser.add_argument("--compute-types", default="auto", help="例如 float16,int8_float16,int8")
+    parser.add_argument("--batch-sizes", default="1,8")
+    parser.add_argument("--vad", default="off,on", help="off、on 或 off,on")
+    parser.add_argument("--limit", type=int, help="只取前 N 個音檔")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+    args.beam_sizes = parse_list(args.beam_sizes, int)
+    args.compute_types = parse_list(args.compute_types)
+    args.batch_sizes = parse_list(args.batch_sizes, int)
+    vad_values = parse_list(args.vad)
+    unknown = [value for value in vad_values if value not in ("on", "off")]
+    if unknown:
+        parser.error(f"--vad 只接受 on/off: {', '.join(unknown)}")
+    args.vad = [value == "on" for value in vad_values]
+    if any(size < 1 for size in args.batch_sizes + args.beam_sizes):
+        parser.error("beam size 與批次大小至少為 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+TTS 即時率（RTF）基準測試
+以固定的文字 × 語者矩陣對任一 TTS 引擎（breezy / vibe / index / spark）合成，先預熱再重複量測，
+輸出與 outputs/tts_test_results/tts_test_results_fixed.json 相同的格式（可直接作為 tts.router.seed_results），
+並加上每個引擎的百分位數；指定 --baseline 時與先前的結果比較，RTF 變慢超過容許比例即標記為退化。
+
+用法（於 backend 目錄，需要 GPU 與模型）：
+    python -m benchmarks.benchmark_tts --providers index,spark --speakers 男聲=./voices/zh-Novem_man.wav
+    python -m benchmarks.benchmark_tts --providers breezy --repetitions 5 \\
+        --baseline outputs/tts_test_results/tts_test_results_fixed.json --output outputs/tts_test_results/latest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.audio_utils import wav_duration
+from app.tts_registry import TTS_ENGINES, tts_registry, call_synthesize
+from app.tts_router import SEED_ENGINE_NAMES
+from benchmarks.stats import summarize
+
+# 固定的測試文本（長度涵蓋短句到一般回覆）
+CORPUS = [
+    "你好，歡迎使用即時語音對話系統，今天有什麼可以幫你的嗎？",
+    "台北今天白天多雲時晴，午後山區有短暫陣雨的機會，出門記得帶把傘，氣溫大約在二十五到三十度之間。",
+    "語音合成的速度通常以即時率來衡量，也就是合成所需的時間除以產生音訊的長度，數值越低代表越快。",
+]
+
+# provider -> 測試結果中的引擎名稱
+ENGINE_NAMES = {provider: engine_name for engine_name, provider in SEED_ENGINE_NAMES.items()}
+
+
+def parse_speakers(value: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """'名稱=音檔路徑,...' -> [(名稱, 路徑)]；未指定時使用引擎的預設語者"""
+    if not value:
+        return [("default", None)]
+    speakers = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, path = item.partition("=")
+        if not path:
+            name, path = os.path.splitext(os.path.basename(item))[0], item
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"語者音檔不存在: {path}")
+        speakers.append((name, path))
+    return speakers
+
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    """每行一段文本；未指定時使用內建文本"""
+    if not path:
+        return list(CORPUS)
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+async def benchmark_provider(provider: str, corpus: List[str], speakers: List[Tuple[str, Optional[str]]],
+                             warmup: int, repetitions: int, audio_dir: Optional[str]) -> Dict[str, Any]:
+    """載入單一引擎並跑完文字 × 語者矩陣"""
+    print(f"\n=== {ENGINE_NAMES.get(provider, provider)} ===")
+    try:
+        start_time = time.time()
+        service = await tts_registry.create_engine(provider)
+        load_time = time.time() - start_time
+    except Exception as e:
+        print(f"引擎載入失敗: {e}")
+        return {"status": "failed", "error": str(e), "tests": []}
+    print(f"引擎載入完成，耗時 {load_time:.1f} 秒")
+
+    # 預熱：排除 CUDA 核心編譯、快取建立等首次呼叫成本，結果不列入統計
+    for i in range(warmup):
+        try:
+            await call_synthesize(provider, service, corpus[0], speakers[0][1])
+        except Exception as e:
+            print(f"預熱失敗: {e}")
+            break
+
+    tests = []
+    rtf_values: List[float] = []
+    synthesis_times: List[float] = []
+    for text_index, text in enumerate(corpus, 1):
+        for speaker_index, (speaker_name, speaker_path) in enumerate(speakers, 1):
+            test_name = f"Text{text_index}_Speaker{speaker_index}"
+            runs = []
+            error = None
+            audio = b""
+            for _ in range(repetitions):
+                try:
+                    start_time = time.time()
+                    audio = await call_synthesize(provider, service, text, speaker_path)
+                    synthesis_time = time.time() - start_time
+                except Exception as e:
+                    error = str(e)
+                    break
+                duration = wav_duration(audio)
+                runs.append({
+                    "synthesis_time": synthesis_time,
+                    "audio_duration": duration,
+                    "rtf": synthesis_time / duration if duration > 0 else None,
+                })
+
+            if error or not runs:
+                print(f"{test_name:<18} 失敗: {error}")
+                tests.append({"test_name": test_name, "text_length": len(text), "speaker": speaker_name,
+                              "success": False, "error": error})
+                continue
+
+            if audio_dir:
+                with open(os.path.join(audio_dir, f"{provider}_{test_name}.wav"), "wb") as f:
+                    f.write(audio)
+
+            run_rtfs = [run["rtf"] for run in runs if run["rtf"] is not None]
+            run_times = [run["synthesis_time"] for run in runs]
+            rtf_values.extend(run_rtfs)
+            synthesis_times.extend(run_times)
+            synthesis_time = sum(run_times) / len(run_times)
+            audio_duration = sum(run["audio_duration"] for run in runs) / len(runs)
+            test = {
+                "test_name": test_name,
+                "text_length": len(text),
+                "speaker": speaker_name,
+                "synthesis_time": synthesis_time,
+                "audio_duration": audio_duration,
+                "rtf": synthesis_time / audio_duration if audio_duration > 0 else None,
+                "file_size": len(audio),
+                "success": True,
+                "repetitions": len(runs),
+                "rtf_runs": [round(value, 4) for value in run_rtfs],
+            }
+            tests.append(test)
+            print(f"{test_name:<18} {speaker_name:<12} {len(text):>4} 字  "
+                  f"合成 {synthesis_time:>7.2f} 秒  音訊 {audio_duration:>7.2f} 秒  RTF {test['rtf'] or 0:.3f}")
+
+    if hasattr(service, "cleanup"):
+        service.cleanup()
+
+    failures = sum(1 for test in tests if not test["success"])
+    return {
+        "status": "success" if failures == 0 else ("failed" if failures == len(tests) else "partial"),
+        "load_time": load_time,
+        "tests": tests,
+        "summary": {
+            "rtf": summarize(rtf_values),
+            "synthesis_time": summarize(synthesis_times),
+            "failures": failures,
+        },
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """逐項比較 RTF，回傳退化項目的說明（RTF 越高越慢）"""
+    regressions = []
+    for engine_name, engine_result in results.items():
+        base_engine = baseline.get(engine_name)
+        if not isinstance(engine_result, dict) or not isinstance(base_engine, dict):
+            continue
+        base_tests = {test["test_name"]: test for test in base_engine.get("tests", [])}
+        print(f"\n--- {engine_name} vs baseline ---")
+        for test in engine_result.get("tests", []):
+            base = base_tests.get(test["test_name"])
+            if base is None or not base.get("success"):
+                continue
+            if not test.get("success"):
+                regressions.append(f"{engine_name} {test['test_name']}: 基準成功，本次失敗")
+                continue
+            if not test.get("rtf") or not base.get("rtf"):
+                continue
+            change = test["rtf"] / base["rtf"] - 1
+            flag = "退化" if change > tolerance else ("改善" if change < -tolerance else "")
+            print(f"{test['test_name']:<18} RTF {base['rtf']:.3f} -> {test['rtf']:.3f} ({change:+.1%}) {flag}")
+            if change > tolerance:
+                regressions.append(f"{engine_name} {test['test_name']}: RTF {base['rtf']:.3f} -> {test['rtf']:.3f} ({change:+.1%})")
+
+        # 引擎層級以 p50 比較；舊格式的基準沒有 summary 時由各項 RTF 計算
+        base_rtfs = base_engine.get("summary", {}).get("rtf") or summarize(
+            [test["rtf"] for test in base_engine.get("tests", []) if test.get("success") and test.get("rtf")])
+        current_rtfs = engine_result.get("summary", {}).get("rtf")
+        if base_rtfs and current_rtfs:
+            change = current_rtfs["p50"] / base_rtfs["p50"] - 1
+            print(f"{'p50':<18} RTF {base_rtfs['p50']:.3f} -> {current_rtfs['p50']:.3f} ({change:+.1%})")
+            if change > tolerance:
+                regressions.append(f"{engine_name} p50: RTF {base_rtfs['p50']:.3f} -> {current_rtfs['p50']:.3f} ({change:+.1%})")
+    return regressions
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    corpus = load_corpus(args.corpus)
+    speakers = parse_speakers(args.speakers)
+    if args.audio_dir:
+        os.makedirs(args.audio_dir, exist_ok=True)
+
+    results: Dict[str, Any] = {
+        "_meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "warmup": args.warmup,
+            "repetitions": args.repetitions,
+            "corpus": corpus,
+            "speakers": {name: path for name, path in speakers},
+        }
+    }
+    try:
+        import torch
+        if torch.cuda.is_available():
+            results["_meta"]["gpu"] = torch.cuda.get_device_name(0)
+    except Exception:
+        pass
+
+    for provider in args.providers:
+        results[ENGINE_NAMES.get(provider, provider)] = await benchmark_provider(
+            provider, corpus, speakers, args.warmup, args.repetitions, args.audio_dir)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TTS 引擎即時率（RTF）基準測試")
+    parser.add_argument("--providers", default=tts_registry.default_provider,
+                        help=f"逗號分隔，可選: {', '.join(TTS_ENGINES)}")
+    parser.add_argument("--speakers", help="逗號分隔的 名稱=語者音檔路徑；未指定時使用引擎預設語者")
+    parser.add_argument("--corpus", help="測試文本檔（每行一段），未指定時使用內建的 3 段文本")
+    parser.add_argument("--warmup", type=int, default=1, help="每個引擎正式量測前的預熱次數")
+    parser.add_argument("--repetitions", type=int, default=3, help="每個 文本 × 語者 組合的重複次數")
+    parser.add_argument("--output", default="./outputs/tts_test_results/tts_benchmark_results.json",
+                        help="結果 JSON 檔路徑")
+    parser.add_argument("--audio-dir", help="保存每個組合最後一次合成的音檔")
+    parser.add_argument("--baseline", help="與此結果檔比較 RTF")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="RTF 變慢超過此比例視為退化")
+    args = parser.parse_args()
+    args.providers = [name.strip() for name in args.providers.split(",") if name.strip()]
+    unknown = [name for name in args.providers if name not in TTS_ENGINES]
+    if unknown:
+        parser.error(f"未知的 TTS 引擎: {', '.join(unknown)}")
+    if args.repetitions < 1:
+        parser.error("--repetitions 至少為 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已寫入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n偵測到 {len(regressions)} 項退化（容許 {args.tolerance:.0%}）：")
+            for item in regressions:
+                print(f"  - {item}")
+            sys.exit(1)
+        print(f"\n未偵測到退化（容許 {args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
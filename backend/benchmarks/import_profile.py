@@ -0,0 +1,113 @@
+"""
+匯入耗時報告
+以 `python -X importtime` 在子行程中匯入 app.main（或指定模組），列出累計耗時最高的模組與各頂層套件的耗時，
+並可與先前的報告比較，總匯入時間變慢超過容許比例即標記為退化（結束碼 1）。
+
+用法（於 backend 目錄）：
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --target app.tts_vibe --top 20 --output import_profile.json
+    python -m benchmarks.import_profile --repetitions 5 --baseline import_profile.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from app.import_profile import run_importtime, summarize_packages
+from benchmarks.stats import summarize
+
+
+def profile(target: str, repetitions: int) -> Dict[str, Any]:
+    """重複匯入數次（每次都是新的子行程），模組明細取最後一次，總時間取各次統計"""
+    runs = []
+    for _ in range(repetitions):
+        runs.append(run_importtime(target))
+    last = runs[-1]
+    modules = sorted(last["modules"], key=lambda entry: entry["cumulative_seconds"], reverse=True)
+    top_level = [entry for entry in last["modules"] if entry["depth"] == 0]
+    return {
+        "_meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "target": target,
+            "repetitions": repetitions,
+        },
+        "import_seconds": summarize([sum(entry["cumulative_seconds"] for entry in run["modules"] if entry["depth"] == 0)
+                                     for run in runs]),
+        "wall_seconds": summarize([run["wall_seconds"] for run in runs]),
+        "packages": {name: round(seconds, 4) for name, seconds in summarize_packages(last["modules"]).items()},
+        "top_level": {entry["module"]: round(entry["cumulative_seconds"], 4) for entry in top_level},
+        "modules": modules,
+    }
+
+
+def print_report(report: Dict[str, Any], top: int):
+    print(f"匯入 {report['_meta']['target']}：p50 {report['import_seconds']['p50']:.3f} 秒"
+          f"（行程牆鐘 p50 {report['wall_seconds']['p50']:.3f} 秒）")
+    print(f"\n累計耗時前 {top} 名模組：")
+    for entry in report["modules"][:top]:
+        print(f"  {entry['cumulative_seconds']:>8.3f} 秒  {'  ' * entry['depth']}{entry['module']}")
+    print(f"\n頂層套件（自身耗時加總）前 {top} 名：")
+    for name, seconds in list(report["packages"].items())[:top]:
+        print(f"  {seconds:>8.3f} 秒  {name}")
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """比較總匯入時間（p50）與各頂層套件耗時，回傳退化項目的說明"""
+    regressions = []
+    base_p50 = baseline.get("import_seconds", {}).get("p50")
+    current_p50 = report["import_seconds"].get("p50")
+    if base_p50 and current_p50:
+        change = current_p50 / base_p50 - 1
+        print(f"\n總匯入時間 {base_p50:.3f} -> {current_p50:.3f} 秒 ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(f"總匯入時間 {base_p50:.3f} -> {current_p50:.3f} 秒 ({change:+.1%})")
+    # 新出現的重量級套件（例如不小心在模組層級匯入了 torch）
+    base_packages = baseline.get("packages", {})
+    for name, seconds in report["packages"].items():
+        if name not in base_packages and seconds >= 0.05:
+            regressions.append(f"新增匯入 {name}（{seconds:.3f} 秒）")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="匯入耗時報告（-X importtime）")
+    parser.add_argument("--target", default="app.main", help="要匯入的模組")
+    parser.add_argument("--repetitions", type=int, default=3, help="重複匯入次數（每次為新的子行程）")
+    parser.add_argument("--top", type=int, default=25, help="列出的模組 / 套件數")
+    parser.add_argument("--output", help="將報告寫入 JSON 檔")
+    parser.add_argument("--baseline", help="與此報告比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="總匯入時間變慢超過此比例視為退化")
+    args = parser.parse_args()
+    if args.repetitions < 1:
+        parser.error("--repetitions 至少為 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    report = profile(args.target, args.repetitions)
+    print_report(report, args.top)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n報告已寫入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n偵測到 {len(regressions)} 項退化：")
+            for item in regressions:
+                print(f"  - {item}")
+            sys.exit(1)
+        print(f"\n未偵測到退化（容許 {args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
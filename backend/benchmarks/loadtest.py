@@ -0,0 +1,204 @@
+"""
+端對端負載測試
+以替身引擎（benchmarks.stubs）載入真正的 app.main，透過 httpx 的 ASGITransport 在同一個事件迴圈內
+對 /voice_chat、/text_chat、/tts 施加固定並行度的負載，回報吞吐量、p50/p95/p99 延遲與事件迴圈停頓。
+不需要 GPU 或模型，用來抓出排程與阻塞事件迴圈的退化。
+
+用法（於 backend 目錄）：
+    python -m benchmarks.loadtest --endpoints voice_chat,text_chat,tts --concurrency 1,4,16 --requests 40
+    python -m benchmarks.loadtest --tts-latency 0.5 --output loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from benchmarks.stats import percentile
+from benchmarks.stubs import StubProfile, install_stubs, make_wav
+
+ENDPOINTS = ("voice_chat", "text_chat", "text_chat_pipeline", "tts")
+SAMPLE_TEXT = "今天的天氣很好，我們一起去公園散步吧。"
+
+
+class LoopStallMonitor:
+    """以固定間隔 sleep 量測事件迴圈延遲：實際醒來時間比預期晚多少，就是迴圈被阻塞的時間"""
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.02):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        stalls = [lag for lag in self.lags if lag >= self.threshold]
+        return {
+            "max_ms": round(max(self.lags, default=0.0) * 1000, 1),
+            "p99_ms": round(percentile(self.lags, 99) * 1000, 1),
+            "stalls": len(stalls),
+            "stall_time_ms": round(sum(stalls) * 1000, 1),
+        }
+
+
+def build_requests(audio_seconds: float) -> Dict[str, Callable[[httpx.AsyncClient], Any]]:
+    """各端點的請求產生函式"""
+    upload = make_wav(audio_seconds, 16000)
+
+    def voice_chat(client: httpx.AsyncClient):
+        return client.post("/voice_chat", files={"audio": ("input.wav", upload, "audio/wav")})
+
+    def text_chat(client: httpx.AsyncClient):
+        return client.post("/text_chat", json={"message": SAMPLE_TEXT})
+
+    def text_chat_pipeline(client: httpx.AsyncClient):
+        return client.post("/text_chat", json={"message": SAMPLE_TEXT, "pipeline": True})
+
+    def tts(client: httpx.AsyncClient):
+        return client.post("/tts", json={"text": SAMPLE_TEXT})
+
+    return {
+        "voice_chat": voice_chat,
+        "text_chat": text_chat,
+        "text_chat_pipeline": text_chat_pipeline,
+        "tts": tts,
+    }
+
+
+async def run_load(client: httpx.AsyncClient, send: Callable, concurrency: int, total: int) -> Dict[str, Any]:
+    """以固定並行度送出 total 個請求，回傳延遲與錯誤統計"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await send(client)
+                await response.aread()
+                if response.status_code >= 400:
+                    key = str(response.status_code)
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+            except Exception as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": total,
+        "completed": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    profile = StubProfile(
+        stt_latency=args.stt_latency,
+        llm_latency=args.llm_latency,
+        llm_token_latency=args.llm_token_latency,
+        tts_latency=args.tts_latency,
+        tts_latency_per_char=args.tts_latency_per_char,
+        tts_seconds_per_char=args.tts_seconds_per_char,
+    )
+    app = install_stubs(profile)
+
+    # 追蹤資料寫到暫存目錄，不污染 logs/
+    from app.tracing import tracer
+    tracer.export_path = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "traces.jsonl")
+
+    requests = build_requests(args.audio_seconds)
+    monitor = LoopStallMonitor(threshold=args.stall_threshold_ms / 1000)
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+        for endpoint in args.endpoints:
+            send = requests[endpoint]
+            # 預熱一次，排除首次呼叫的匯入與建立執行緒池成本
+            await (await send(client)).aread()
+            for concurrency in args.concurrency:
+                monitor.start()
+                result = await run_load(client, send, concurrency, args.requests)
+                result["loop"] = await monitor.stop()
+                result.update({"endpoint": endpoint, "concurrency": concurrency})
+                results.append(result)
+                print_row(result)
+    return results
+
+
+def print_row(result: Dict[str, Any]):
+    errors = sum(result["errors"].values())
+    print(f"{result['endpoint']:<20} c={result['concurrency']:<4} "
+          f"{result['throughput_rps']:>7.2f} req/s  "
+          f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+          f"loop max {result['loop']['max_ms']:>6.1f} ms  stalls {result['loop']['stalls']:>3} "
+          f"({result['loop']['stall_time_ms']:.0f} ms)  errors {errors}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="以替身引擎對 app.main 進行端對端負載測試")
+    parser.add_argument("--endpoints", default="voice_chat,text_chat,tts",
+                        help=f"逗號分隔，可選: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗號分隔的並行度")
+    parser.add_argument("--requests", type=int, default=40, help="每個並行度送出的請求數")
+    parser.add_argument("--timeout", type=float, default=120.0, help="單一請求逾時（秒）")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="/voice_chat 上傳音檔長度")
+    parser.add_argument("--stt-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-token-latency", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.1)
+    parser.add_argument("--tts-latency-per-char", type=float, default=0.01)
+    parser.add_argument("--tts-seconds-per-char", type=float, default=0.25)
+    parser.add_argument("--stall-threshold-ms", type=float, default=20.0, help="超過此延遲才計為一次停頓")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知的端點: {', '.join(unknown)}")
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    return args
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
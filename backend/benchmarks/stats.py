@@ -0,0 +1,28 @@
+"""
+基準測試共用的統計函式
+"""
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def summarize(values: List[float], quantiles: Iterable[int] = (50, 90, 95, 99), digits: int = 4) -> Dict[str, float]:
+    """平均、最小、最大與各百分位數"""
+    if not values:
+        return {}
+    summary = {
+        "mean": round(sum(values) / len(values), digits),
+        "min": round(min(values), digits),
+        "max": round(max(values), digits),
+    }
+    for q in quantiles:
+        summary[f"p{q}"] = round(percentile(values, q), digits)
+    return summary
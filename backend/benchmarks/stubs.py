@@ -0,0 +1,159 @@
+"""
+負載測試用的替身引擎
+與真實的 STTService / ChatService / TTS 服務介面相同，只在 CPU 上以固定延遲模擬推論：
+- 推論一樣透過 scheduler.run 進入各引擎的執行緒池，排程與事件迴圈的行為與正式環境一致
+- 延遲與輸出大小可設定，結果完全可重現（不需要 GPU 或下載模型）
+"""
+import io
+import struct
+import sys
+import time
+import types
+import wave
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.chat import ChatService
+from app.scheduler import scheduler
+
+
+@dataclass
+class StubProfile:
+    """替身引擎的延遲與輸出設定（秒）"""
+    device: str = "cuda:0"  # 只用來對應排程器的設備名額，不會真的使用 GPU
+    stt_latency: float = 0.2
+    llm_latency: float = 0.3
+    llm_token_latency: float = 0.02  # 串流模式每個 token 的間隔
+    reply_text: str = "好的，我了解你的意思。今天天氣很好，適合出去走走。有什麼我可以幫忙的嗎？"
+    transcript: str = "今天天氣怎麼樣"
+    tts_latency: float = 0.1  # 每次合成的固定延遲
+    tts_latency_per_char: float = 0.01
+    tts_seconds_per_char: float = 0.25  # 輸出音訊長度
+    tts_sample_rate: int = 24000
+
+
+def make_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """產生指定長度的 16-bit 單聲道 WAV（低音量方波，內容固定）"""
+    frames = int(seconds * sample_rate)
+    half_period = max(1, sample_rate // 400)
+    cycle = struct.pack("<h", -1000) * half_period + struct.pack("<h", 1000) * half_period
+    samples = (cycle * (frames // (2 * half_period) + 1))[:frames * 2]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples)
+    return buffer.getvalue()
+
+
+class StubSTTService:
+    """替身 STTService：固定延遲後回傳固定逐字稿"""
+
+    def __init__(self, profile: Optional[StubProfile] = None):
+        self.profile = profile or StubProfile()
+        self.model = object()
+        scheduler.register_engine("stt", self.profile.device)
+
+    async def initialize(self):
+        pass
+
+    def is_ready(self) -> bool:
+        return True
+
+    def _transcribe_sync(self, audio_data, sample_rate: int) -> str:
+        time.sleep(self.profile.stt_latency)
+        return self.profile.transcript
+
+    async def transcribe(self, audio_data, sample_rate: int = 16000) -> str:
+        return await scheduler.run("stt", self._transcribe_sync, audio_data, sample_rate)
+
+    async def transcribe_file(self, file_path: str) -> str:
+        return await scheduler.run("stt", self._transcribe_sync, file_path, 16000)
+
+
+class StubLLM:
+    """替身 LLM：chat 與 stream_chat 介面與 llm_tools 相同"""
+
+    def __init__(self, profile: StubProfile):
+        self.profile = profile
+
+    def chat(self, query: str, history=None, system=None):
+        time.sleep(self.profile.llm_latency)
+        return self.profile.reply_text, history
+
+    def stream_chat(self, query: str, history=None, system=None):
+        time.sleep(self.profile.llm_latency)
+        text = ""
+        for char in self.profile.reply_text:
+            time.sleep(self.profile.llm_token_latency)
+            text += char
+            yield text
+
+
+class StubChatService(ChatService):
+    """替身 ChatService：沿用真實 ChatService 的對話歷史與串流邏輯，只替換 LLM"""
+
+    def __init__(self, profile: Optional[StubProfile] = None):
+        self.profile = profile or StubProfile()
+        self.conversations = {}
+        self.llm_chat = StubLLM(self.profile)
+        self.use_llm_tools = False
+        scheduler.register_engine("llm", self.profile.device)
+
+    async def initialize_llm(self, *args, **kwargs):
+        pass
+
+
+class StubTTSService:
+    """替身 TTS 服務：固定延遲 + 每字延遲，輸出與文字長度成正比的 WAV"""
+
+    def __init__(self, name: str = "index", profile: Optional[StubProfile] = None):
+        self.name = name
+        self.engine = f"tts_{name}"
+        self.profile = profile or StubProfile()
+        scheduler.register_engine(self.engine, self.profile.device)
+
+    async def initialize(self, **kwargs):
+        pass
+
+    def is_ready(self) -> bool:
+        return True
+
+    def cleanup(self):
+        pass
+
+    def get_speaker_info(self) -> Dict:
+        return {"speakers": [{"id": "stub", "name": "stub"}], "default_speaker": "stub"}
+
+    def _synthesize_sync(self, text: str) -> bytes:
+        time.sleep(self.profile.tts_latency + self.profile.tts_latency_per_char * len(text))
+        return make_wav(max(0.1, len(text) * self.profile.tts_seconds_per_char), self.profile.tts_sample_rate)
+
+    async def synthesize(self, text: str, speaker_voice_path: Optional[str] = None, **kwargs) -> bytes:
+        return await scheduler.run(self.engine, self._synthesize_sync, text)
+
+
+def install_stubs(profile: StubProfile, providers=("index",)):
+    """以替身引擎載入 app.main，回傳 FastAPI app
+
+    app.stt 在匯入 app.main 前換成替身模組，避免載入 faster-whisper；
+    ChatService 與 TTS 引擎則在匯入後替換成替身實例。不送 lifespan 事件，因此不會觸發模型載入。
+    """
+    import app
+
+    stub_stt_module = types.ModuleType("app.stt")
+    stub_stt_module.STTService = StubSTTService
+    sys.modules["app.stt"] = stub_stt_module
+    app.stt = stub_stt_module
+
+    from app import main
+    from app.tts_registry import tts_registry
+
+    main.stt_service = StubSTTService(profile)
+    main.chat_service = StubChatService(profile)
+    tts_registry.enabled = True
+    for name in providers:
+        tts_registry.register_instance(name, StubTTSService(name, profile))
+    return main.app
+
@@ -0,0 +1,53 @@
+import pytest
+
+from app.http_audio import etag_matches, parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=999-999", (999, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("Bytes = 10-20", (10, 20)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", SIZE),
+    ("bytes=2000-3000", SIZE),
+    ("bytes=20-10", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=-10", 0),
+    ("bytes=0-", 0),
+])
+def test_unsatisfiable_ranges(header, size):
+    assert parse_range(header, size) is None
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-99",
+    "bytes=0-99,200-299",
+    "bytes=abc-",
+    "bytes=-",
+])
+def test_malformed_ranges_raise(header):
+    with pytest.raises(ValueError):
+        parse_range(header, SIZE)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('"xyz"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
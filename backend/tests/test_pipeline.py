@@ -0,0 +1,175 @@
+from app.pipeline import SentenceSplitter, split_sentences
+
+
+def test_feed_emits_completed_sentences_and_keeps_remainder():
+    splitter = SentenceSplitter()
+    assert splitter.feed("今天天") == []
+    assert splitter.feed("氣很好。明天") == ["今天天氣很好。"]
+    assert splitter.flush() == ["明天"]
+    assert splitter.flush() == []
+
+
+def test_english_period_needs_following_whitespace():
+    splitter = SentenceSplitter()
+    assert splitter.feed("Pi is 3.14 today. Next") == ["Pi is 3.14 today."]
+    assert splitter.flush() == ["Next"]
+
+
+def test_short_sentences_merge_with_next():
+    splitter = SentenceSplitter(min_chars=4)
+    assert splitter.feed("你好。今天天氣很好！") == ["你好。今天天氣很好！"]
+
+
+def test_consecutive_boundaries_stay_with_sentence():
+    splitter = SentenceSplitter()
+    assert splitter.feed("真的嗎？！好的") == ["真的嗎？！"]
+
+
+def test_long_buffer_is_cut_at_last_clause_boundary():
+    splitter = SentenceSplitter(max_chars=10)
+    assert splitter.feed("一二三四五，六七八九十一二") == ["一二三四五，"]
+    assert splitter.flush() == ["六七八九十一二"]
+
+
+def test_long_buffer_without_clause_boundary_waits():
+    splitter = SentenceSplitter(max_chars=5)
+    assert splitter.feed("一二三四五六七八") == []
+    assert splitter.flush() == ["一二三四五六七八"]
+
+
+def test_split_sentences_keeps_short_sentences():
+    assert split_sentences("好。第二句！第三") == ["好。", "第二句！", "第三"]
+
+
+def test_split_sentences_does_not_cut_long_clauses():
+    text = "，".join(["這是一段很長的子句"] * 20) + "。"
+    assert split_sentences(text) == [text]
+
+
+def test_split_sentences_empty_text():
+    assert split_sentences("") == []
+    assert split_sentences("   ") == []
+
+
+from app.pipeline import SpeechPipeline  # noqa: E402
+
+import asyncio  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+async def token_stream(tokens, delay=0.0):
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+
+
+async def collect(pipeline, deltas):
+    return [event async for event in pipeline.run(deltas)]
+
+
+SENTENCES = ["第一句話。", "第二句話！", "第三句話？", "第四句話。"]
+
+
+def test_pipeline_emits_audio_in_sentence_order():
+    # 前面的句子合成得比較慢，音訊仍須依句子順序輸出
+    delays = {sentence: 0.04 - 0.01 * i for i, sentence in enumerate(SENTENCES)}
+
+    async def synthesize(sentence):
+        await asyncio.sleep(delays[sentence])
+        return sentence.encode("utf-8")
+
+    pipeline = SpeechPipeline(synthesize, min_chars=1, max_chars=80, max_inflight=4)
+    events = asyncio.run(collect(pipeline, token_stream(SENTENCES)))
+
+    assert [e["text"] for e in events if e["type"] == "token"] == SENTENCES
+    assert [e for e in events if e["type"] == "llm_done"] == [{"type": "llm_done", "text": "".join(SENTENCES)}]
+    audio = [e for e in events if e["type"] == "audio"]
+    assert [e["index"] for e in audio] == [0, 1, 2, 3]
+    assert [e["text"] for e in audio] == SENTENCES
+    assert [e["audio"] for e in audio] == [s.encode("utf-8") for s in SENTENCES]
+
+
+def test_pipeline_bounds_concurrent_synthesis():
+    active = 0
+    peak = 0
+
+    async def synthesize(sentence):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return b""
+
+    sentences = [f"這是第{i}句。" for i in range(8)]
+    pipeline = SpeechPipeline(synthesize, min_chars=1, max_chars=80, max_inflight=2)
+    events = asyncio.run(collect(pipeline, token_stream(sentences)))
+
+    assert len([e for e in events if e["type"] == "audio"]) == len(sentences)
+    assert peak == 2
+
+
+def test_pipeline_propagates_synthesis_failure():
+    async def synthesize(sentence):
+        if sentence == SENTENCES[1]:
+            raise RuntimeError("tts failed")
+        return b"ok"
+
+    async def run():
+        received = []
+        with pytest.raises(RuntimeError, match="tts failed"):
+            async for event in SpeechPipeline(synthesize, min_chars=1, max_inflight=1).run(token_stream(SENTENCES)):
+                received.append(event)
+        return received
+
+    received = asyncio.run(run())
+    assert [e["index"] for e in received if e["type"] == "audio"] == [0]
+
+
+def test_pipeline_propagates_llm_failure():
+    async def failing_stream():
+        yield "第一句話。"
+        raise RuntimeError("llm failed")
+
+    async def synthesize(sentence):
+        return b""
+
+    async def run():
+        async for _ in SpeechPipeline(synthesize, min_chars=1).run(failing_stream()):
+            pass
+
+    with pytest.raises(RuntimeError, match="llm failed"):
+        asyncio.run(run())
+
+
+def test_pipeline_cancels_outstanding_synthesis_when_closed():
+    started = []
+    cancelled = []
+    never = None
+
+    async def synthesize(sentence):
+        started.append(sentence)
+        try:
+            await never.wait()
+        except asyncio.CancelledError:
+            cancelled.append(sentence)
+            raise
+        return b""
+
+    async def run():
+        nonlocal never
+        never = asyncio.Event()
+        events = SpeechPipeline(synthesize, min_chars=1, max_inflight=2).run(token_stream(SENTENCES))
+        async for event in events:
+            # 第三句的 token 送出時前兩句已在合成，佔滿 max_inflight
+            if event["type"] == "token" and event["text"] == SENTENCES[2]:
+                break
+        await asyncio.sleep(0.01)
+        await events.aclose()
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert started == SENTENCES[:2]
+    assert cancelled == started